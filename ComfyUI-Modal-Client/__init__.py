@@ -1,4 +1,6 @@
 from .nodes.modal_register_output import NODE_CLASS_MAPPINGS as MODAL_REGISTER_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS as MODAL_REGISTER_DISPLAY
+# Registra la ruta /modal/register_outputs en el servidor de ComfyUI
+from .nodes import modal_history  # noqa: F401
 
 NODE_CLASS_MAPPINGS = {
     **MODAL_REGISTER_MAPPINGS,
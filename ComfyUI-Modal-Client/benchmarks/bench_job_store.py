@@ -0,0 +1,127 @@
+"""
+Benchmark: cola/historial en JSON (reescritura completa) vs JobStore (SQLite WAL).
+
+Simula lo que hace el Bridge con N trabajos lanzados desde varios hilos a la
+vez: registrar el trabajo al enviarlo y pasarlo al historial al terminar. La
+variante JSON reproduce las funciones load_queue/save_queue/load_history/
+save_history originales (sin bloqueo, historial limitado a 50). Al final se
+cuentan los trabajos perdidos por escrituras concurrentes.
+
+Uso:
+    python benchmarks/bench_job_store.py --jobs 1000 --threads 16
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "server"))
+
+from modal_job_store import JobStore  # noqa: E402
+
+
+class LegacyJsonStore:
+    """Copia del enfoque anterior: cada operación relee y reescribe el fichero entero"""
+
+    history_cap = 50
+
+    def __init__(self, directory):
+        self.queue_file = Path(directory) / "_modal_queue.json"
+        self.history_file = Path(directory) / "_modal_gpu_history.json"
+
+    def _load(self, path):
+        if path.exists():
+            try:
+                return json.loads(path.read_text())
+            except ValueError:
+                return []
+        return []
+
+    def add(self, job):
+        queue = self._load(self.queue_file)
+        queue.append(job)
+        self.queue_file.write_text(json.dumps(queue, indent=2))
+
+    def finish(self, task_id, status, **fields):
+        queue = self._load(self.queue_file)
+        for item in queue:
+            if item["task_id"] == task_id:
+                history = self._load(self.history_file)
+                history.insert(0, {**item, **fields, "status": status})
+                self.history_file.write_text(json.dumps(history[:50], indent=2))
+                queue.remove(item)
+                break
+        self.queue_file.write_text(json.dumps(queue, indent=2))
+
+    def counts(self):
+        return len(self._load(self.queue_file)), len(self._load(self.history_file))
+
+
+class JobStoreAdapter:
+    history_cap = None
+
+    def __init__(self, directory):
+        self.store = JobStore(Path(directory) / "_modal_jobs.sqlite3")
+
+    def add(self, job):
+        self.store.add(job)
+
+    def finish(self, task_id, status, **fields):
+        self.store.finish(task_id, status, **fields)
+
+    def counts(self):
+        return len(self.store.active()), self.store.history(limit=1)[1]
+
+
+def run(store, jobs, threads):
+    def submit_and_finish(i):
+        task_id = f"task-{i:05d}"
+        store.add({
+            "task_id": task_id,
+            "gpu_type": ("T4", "A10G", "A100", "H100")[i % 4],
+            "status": "running",
+            "timestamp": datetime.now().isoformat(),
+            "nodes": 12
+        })
+        store.finish(task_id, "completed", execution_seconds=1.0 + i % 7, images=[f"{task_id}.png"])
+
+    began = time.perf_counter()
+    errors = 0
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(submit_and_finish, i) for i in range(jobs)]:
+            try:
+                future.result()
+            except Exception:
+                # JSON a medio escribir leído por otro hilo, etc.
+                errors += 1
+    elapsed = time.perf_counter() - began
+    queued, finished = store.counts()
+    return elapsed, queued, finished, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"🧪 {args.jobs} envíos + {args.jobs} finalizaciones\n")
+    for threads in sorted({1, args.threads}):
+        for name, factory in (("JSON (reescritura)", LegacyJsonStore), ("JobStore (SQLite WAL)", JobStoreAdapter)):
+            with tempfile.TemporaryDirectory() as tmp:
+                store = factory(tmp)
+                elapsed, queued, finished, errors = run(store, args.jobs, threads)
+            ops = 2 * args.jobs / elapsed
+            # Todo terminó: lo correcto es cola vacía y todo el historial (o su tope) lleno
+            expected = min(args.jobs, store.history_cap or args.jobs)
+            lost = expected - finished
+            print(f"{threads:3d} hilos  {name:22s} {elapsed:7.2f} s  {ops:8.0f} ops/s  "
+                  f"historial={finished:5d}/{expected:<5d} cola={queued:4d}  errores={errors:4d}  perdidos={lost}")
+
+
+if __name__ == "__main__":
+    main()
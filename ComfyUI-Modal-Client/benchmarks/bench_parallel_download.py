@@ -0,0 +1,128 @@
+"""
+Benchmark: descarga por rangos en paralelo vs una sola conexión.
+
+Levanta un servidor HTTP local que admite Range y limita el ancho de banda
+por conexión (como hacen los CDN de HuggingFace), y descarga el mismo fichero
+con download_to_part usando 1 y N conexiones. También interrumpe una descarga
+a medias para comprobar que se reanuda desde lo ya escrito.
+
+Uso:
+    python benchmarks/bench_parallel_download.py --size-mb 256 --per-conn-mbps 32
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "server"))
+
+import modal_downloader  # noqa: E402
+from modal_downloader import download_to_part  # noqa: E402
+
+
+def make_handler(payload: bytes, per_conn_bps: float, fail_after: dict):
+    class RangeHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            start, end = 0, len(payload) - 1
+            range_header = self.headers.get("Range")
+            if range_header:
+                first, last = range_header.replace("bytes=", "").split("-")
+                start, end = int(first), int(last or end)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+
+            block = 256 * 1024
+            sent = 0
+            began = time.time()
+            for offset in range(start, end + 1, block):
+                if fail_after.get("bytes") is not None and offset >= fail_after["bytes"]:
+                    return
+                data = payload[offset:min(offset + block, end + 1)]
+                self.wfile.write(data)
+                sent += len(data)
+                # Limitar cada conexión a per_conn_bps
+                ahead = sent / per_conn_bps - (time.time() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    return RangeHandler
+
+
+def run(url, part_path, connections, chunk_size):
+    part_path.unlink(missing_ok=True)
+    began = time.time()
+    info = download_to_part(url, part_path, connections=connections, chunk_size=chunk_size)
+    return time.time() - began, info
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--per-conn-mbps", type=float, default=32.0, help="MB/s por conexión")
+    parser.add_argument("--connections", type=int, default=modal_downloader.DOWNLOAD_CONNECTIONS)
+    parser.add_argument("--chunk-mb", type=int, default=16)
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    expected = hashlib.sha256(payload).hexdigest()
+    fail_after = {"bytes": None}
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        make_handler(payload, args.per_conn_mbps * 1024 * 1024, fail_after)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/model.safetensors"
+    chunk_size = args.chunk_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as tmp:
+        part_path = Path(tmp) / "model.safetensors.part"
+        results = {}
+        for connections in (1, args.connections):
+            elapsed, info = run(url, part_path, connections, chunk_size)
+            digest = hashlib.sha256(part_path.read_bytes()).hexdigest()
+            assert digest == expected, "el fichero descargado no coincide"
+            assert info["sha256"] == expected, "el SHA-256 calculado al descargar no coincide"
+            results[connections] = elapsed
+            print(
+                f"{connections:>2} conexión(es) [{info['mode']:>6}]: {elapsed:6.2f}s "
+                f"({args.size_mb / elapsed:7.1f} MB/s)"
+            )
+        print(f"Aceleración: x{results[1] / results[args.connections]:.2f}")
+
+        # Reanudación: cortar el servidor a mitad y repetir sin borrar el .part
+        part_path.unlink(missing_ok=True)
+        fail_after["bytes"] = len(payload) // 2
+        modal_downloader.DOWNLOAD_CHUNK_RETRIES = 1
+        try:
+            download_to_part(url, part_path, connections=args.connections, chunk_size=chunk_size)
+        except Exception:
+            pass
+        fail_after["bytes"] = None
+        began = time.time()
+        info = download_to_part(url, part_path, connections=args.connections, chunk_size=chunk_size)
+        digest = hashlib.sha256(part_path.read_bytes()).hexdigest()
+        assert digest == expected, "el fichero reanudado no coincide"
+        assert info["sha256"] == expected, "el SHA-256 tras reanudar no coincide"
+        print(
+            f"Reanudación: {info['resumed_bytes'] / (1024**2):.0f} MB reutilizados, "
+            f"resto en {time.time() - began:.2f}s"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
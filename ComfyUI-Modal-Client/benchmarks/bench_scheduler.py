@@ -0,0 +1,175 @@
+"""
+Benchmark: lanzar cada trabajo al recibirlo vs JobScheduler, contra un Modal simulado.
+
+El backend simulado arranca un contenedor por trabajo si no hay uno caliente
+libre de esa GPU (arranque en frío de --cold-start s) y lo deja caliente
+--scaledown s tras terminar, como los ejecutores reales. Llega una ráfaga de
+--jobs trabajos de varios usuarios con prioridades mezcladas. Se mide:
+tiempo total y throughput, latencia de cola (p50/p95 por prioridad), pico de
+contenedores, arranques en frío y gasto (segundos de GPU × precio).
+
+El tiempo está escalado: un segundo simulado dura --time-scale segundos reales.
+
+Uso:
+    python benchmarks/bench_scheduler.py --jobs 60 --users 3
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "server"))
+
+from modal_scheduler import JobScheduler  # noqa: E402
+
+PRICES = {"T4": 0.50, "A10G": 1.10, "A100": 3.00, "H100": 8.00}
+LIMITS = {"T4": 4, "A10G": 3, "A100": 2, "H100": 1}
+
+
+class StubModal:
+    """Contenedores por GPU con arranque en frío y ventana de apagado"""
+
+    def __init__(self, clock, time_scale, cold_start, scaledown):
+        self.clock = clock
+        self.time_scale = time_scale
+        self.cold_start = cold_start
+        self.scaledown = scaledown
+        self.warm = {}          # gpu -> [instante en que se apaga cada contenedor libre]
+        self.busy = 0
+        self.peak = 0
+        self.cold_starts = 0
+        self.gpu_seconds = {}
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds * self.time_scale)
+
+    async def run(self, job):
+        gpu = job["gpu_type"]
+        now = self.clock()
+        pool = [t for t in self.warm.get(gpu, []) if t > now]
+        started = now
+        if pool:
+            pool.remove(min(pool))
+            self.warm[gpu] = pool
+            billed = job["duration"]
+        else:
+            self.cold_starts += 1
+            billed = self.cold_start + job["duration"]
+        self.busy += 1
+        self.peak = max(self.peak, self.busy)
+        await self.sleep(billed)
+        self.busy -= 1
+        finished = self.clock()
+        # El contenedor sigue facturando mientras espera caliente (se cuenta entero)
+        self.warm.setdefault(gpu, []).append(finished + self.scaledown)
+        self.gpu_seconds[gpu] = self.gpu_seconds.get(gpu, 0.0) + (finished - started) + self.scaledown
+        return finished
+
+    def cost(self):
+        return sum(PRICES[gpu] * seconds / 3600 for gpu, seconds in self.gpu_seconds.items())
+
+
+def make_jobs(count, users, seed):
+    rng = random.Random(seed)
+    jobs = []
+    for i in range(count):
+        gpu = rng.choices(list(LIMITS), weights=(5, 3, 2, 1))[0]
+        jobs.append({
+            "task_id": f"job-{i:04d}",
+            "gpu_type": gpu,
+            "priority": rng.choices(("high", "normal", "low"), weights=(1, 6, 3))[0],
+            "user": f"user-{i % users}",
+            "duration": rng.uniform(20, 90),
+            "estimated_seconds": 60,
+        })
+    return jobs
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def simulate(jobs, scheduled, args):
+    t0 = time.monotonic()
+
+    def clock():
+        return (time.monotonic() - t0) / args.time_scale
+
+    backend = StubModal(clock, args.time_scale, args.cold_start, args.scaledown)
+    done = {}
+    finished = asyncio.Event()
+
+    async def execute(job):
+        done[job["task_id"]] = (job, await backend.run(job))
+        if scheduled:
+            scheduler.release(job["task_id"])
+        if len(done) == len(jobs):
+            finished.set()
+
+    if scheduled:
+        async def launch(job):
+            # Como spawn: lanza y vuelve; el final lo avisa el backend
+            asyncio.get_running_loop().create_task(execute(job))
+
+        scheduler = JobScheduler(
+            launch, LIMITS, price_per_hour=PRICES,
+            spend_ceiling_per_hour=args.spend_ceiling or None, max_queued=len(jobs), clock=clock
+        )
+        runner = asyncio.get_running_loop().create_task(scheduler.run(interval=1.0))
+        for job in jobs:
+            scheduler.submit(dict(job))
+    else:
+        for job in jobs:
+            job = dict(job, queued_at=clock(), started_at=clock())
+            asyncio.get_running_loop().create_task(execute(job))
+
+    await finished.wait()
+    if scheduled:
+        runner.cancel()
+
+    makespan = clock()
+    waits = {}
+    for job, _ in done.values():
+        waits.setdefault(job["priority"], []).append(job["started_at"] - job["queued_at"])
+    return {
+        "makespan": makespan,
+        "throughput": len(jobs) / makespan * 60,
+        "waits": waits,
+        "peak": backend.peak,
+        "cold_starts": backend.cold_starts,
+        "cost": backend.cost(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=60)
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--cold-start", type=float, default=45.0)
+    parser.add_argument("--scaledown", type=float, default=300.0)
+    parser.add_argument("--spend-ceiling", type=float, default=0.0, help="USD/h para el planificador (0 = sin techo)")
+    parser.add_argument("--time-scale", type=float, default=0.002)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.jobs, args.users, args.seed)
+    print(f"🧪 Ráfaga de {args.jobs} trabajos, {args.users} usuarios, límites {LIMITS}\n")
+    for name, scheduled in (("spawn inmediato", False), ("JobScheduler", True)):
+        r = asyncio.run(simulate(jobs, scheduled, args))
+        print(f"{name:16s} total {r['makespan']:7.0f} s  {r['throughput']:5.1f} trabajos/min  "
+              f"pico {r['peak']:3d} contenedores  {r['cold_starts']:3d} en frío  gasto ${r['cost']:6.2f}")
+        for priority in ("high", "normal", "low"):
+            waits = r["waits"].get(priority, [])
+            print(f"{'':16s} cola {priority:6s} p50 {percentile(waits, 0.5):6.0f} s  "
+                  f"p95 {percentile(waits, 0.95):6.0f} s  (media {statistics.mean(waits) if waits else 0:5.0f} s, n={len(waits)})")
+        print()
+
+
+if __name__ == "__main__":
+    main()
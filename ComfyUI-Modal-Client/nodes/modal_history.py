@@ -0,0 +1,94 @@
+import os
+import time
+import uuid
+
+import folder_paths
+from aiohttp import web
+from server import PromptServer
+
+# Historial de ComfyUI: mismo tope que usa execution.PromptQueue
+MAXIMUM_HISTORY_SIZE = 10000
+# Id del nodo ficticio que "produce" las imágenes en el prompt sintético
+MODAL_OUTPUT_NODE_ID = "modal_output"
+
+
+def _output_file(filename: str, subfolder: str = ""):
+    """Ruta dentro de output/ o None si no existe o se sale de la carpeta"""
+    output_dir = os.path.abspath(folder_paths.get_output_directory())
+    path = os.path.abspath(os.path.join(output_dir, subfolder, filename))
+    if os.path.commonpath([output_dir, path]) != output_dir or not os.path.isfile(path):
+        return None
+    return path
+
+
+def register_outputs(filenames, subfolder="", task_id=None, gpu_type=None):
+    """
+    Añade al historial de ComfyUI un prompt sintético cuyas salidas son las
+    imágenes ya descargadas en output/, sin decodificarlas ni volver a guardarlas.
+    Devuelve (prompt_id, imágenes registradas, filenames que no existen).
+    """
+    server = PromptServer.instance
+    images, missing = [], []
+    for filename in filenames:
+        # Los outputs de Modal llegan como "<task_id>/<fichero>": la carpeta va a subfolder
+        folder, name = os.path.split(os.path.join(subfolder, filename).replace("\\", "/"))
+        if _output_file(name, folder):
+            images.append({"filename": name, "subfolder": folder, "type": "output"})
+        else:
+            missing.append(filename)
+    if not images:
+        return None, images, missing
+
+    prompt_id = str(uuid.uuid4())
+    number = server.number
+    server.number += 1
+    now = int(time.time() * 1000)
+    prompt = {MODAL_OUTPUT_NODE_ID: {"class_type": "ModalOutput", "inputs": {"task_id": task_id or ""}}}
+    extra_data = {"client_id": "modal-bridge", "modal_task_id": task_id, "modal_gpu_type": gpu_type}
+    entry = {
+        "prompt": (number, prompt_id, prompt, extra_data, [MODAL_OUTPUT_NODE_ID]),
+        "outputs": {MODAL_OUTPUT_NODE_ID: {"images": images}},
+        "status": {
+            "status_str": "success",
+            "completed": True,
+            "messages": [
+                ["execution_start", {"prompt_id": prompt_id, "timestamp": now}],
+                ["execution_success", {"prompt_id": prompt_id, "timestamp": now}],
+            ],
+        },
+        "meta": {MODAL_OUTPUT_NODE_ID: {
+            "node_id": MODAL_OUTPUT_NODE_ID,
+            "display_node": MODAL_OUTPUT_NODE_ID,
+            "parent_node": None,
+            "real_node_id": MODAL_OUTPUT_NODE_ID,
+        }},
+    }
+
+    queue = server.prompt_queue
+    with queue.mutex:
+        if len(queue.history) >= MAXIMUM_HISTORY_SIZE:
+            queue.history.pop(next(iter(queue.history)))
+        queue.history[prompt_id] = entry
+    return prompt_id, images, missing
+
+
+@PromptServer.instance.routes.post("/modal/register_outputs")
+async def register_outputs_route(request):
+    data = await request.json()
+    filenames = data.get("filenames") or []
+    if not filenames:
+        return web.json_response({"status": "error", "message": "Falta filenames"}, status=400)
+
+    prompt_id, images, missing = register_outputs(
+        filenames,
+        subfolder=data.get("subfolder", ""),
+        task_id=data.get("task_id"),
+        gpu_type=data.get("gpu_type"),
+    )
+    if missing:
+        print(f"⚠️ [Modal] No están en output/: {', '.join(missing)}")
+    if prompt_id is None:
+        return web.json_response({"status": "error", "message": "Ninguna imagen en output/", "missing": missing}, status=404)
+
+    print(f"✓ [Modal] {len(images)} imagen(es) registradas en el historial (prompt {prompt_id})")
+    return web.json_response({"status": "success", "prompt_id": prompt_id, "images": images, "missing": missing})
@@ -1,13 +1,29 @@
-from flask import Flask, jsonify, request
-from flask_cors import CORS
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
 import modal
+import asyncio
+import contextlib
+import copy
+import hashlib
+import itertools
+import math
+import os
 import uuid
 from pathlib import Path
 import json
+import time
 from datetime import datetime
 
-app = Flask(__name__)
-CORS(app)
+from modal_job_store import JobStore
+from modal_output_cache import OutputCache
+from modal_scheduler import PRIORITIES, AdmissionError, JobScheduler
+from modal_registry import FunctionRegistry
+
+# Bridge asíncrono (ASGI): cada endpoint espera las llamadas a Modal con .aio en
+# lugar de bloquear un hilo, así que puede haber muchas llamadas en vuelo a la vez
+app = cors(Quart(__name__), allow_origin="*")
 
 # Ruta de ComfyUI
 COMFYUI_ROOT = Path(__file__).resolve().parents[3]
@@ -15,97 +31,228 @@ COMFYUI_OUTPUT_DIR = (COMFYUI_ROOT / "output").resolve()
 COMFYUI_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 MODAL_META_FILE = COMFYUI_OUTPUT_DIR / "_modal_last_outputs.json"
 
-# Archivos de historial y estado
+# Cola e historial de trabajos (SQLite); los JSON antiguos se importan una vez
+JOBS_DB_FILE = COMFYUI_OUTPUT_DIR / "_modal_jobs.sqlite3"
 HISTORY_FILE = COMFYUI_OUTPUT_DIR / "_modal_gpu_history.json"
 QUEUE_FILE = COMFYUI_OUTPUT_DIR / "_modal_queue.json"
+HISTORY_PAGE_SIZE = 50
+
+job_store = JobStore(JOBS_DB_FILE)
+migrated = job_store.import_json(QUEUE_FILE, HISTORY_FILE)
+if migrated:
+    print(f"📦 {migrated} trabajos importados de los JSON antiguos a {JOBS_DB_FILE.name}")
+
+# Estados finales que publica el almacén de progreso de Modal
+TERMINAL_STATES = ("completed", "failed", "cancelled")
 
-# Mapeo de GPUs a funciones
-GPU_FUNCTION_MAP = {
-    "T4": "execute_workflow_t4",
-    "A10G": "execute_workflow_a10g",
-    "A100": "execute_workflow_a100",
-    "H100": "execute_workflow_h100"
+# Mapeo de GPUs a clases ejecutoras (ComfyUI persistente por contenedor)
+GPU_EXECUTOR_MAP = {
+    "T4": "ComfyUIExecutorT4",
+    "A10G": "ComfyUIExecutorA10G",
+    "A100": "ComfyUIExecutorA100",
+    "H100": "ComfyUIExecutorH100"
 }
 
-try:
-    check_model_fn = modal.Function.from_name("comfyui-model-downloader", "check_model_exists")
-    download_model_fn = modal.Function.from_name("comfyui-model-downloader", "download_model")
-    
-    # Cargar todas las funciones de GPU
-    execute_workflow_fns = {}
-    for gpu_name, fn_name in GPU_FUNCTION_MAP.items():
-        try:
-            execute_workflow_fns[gpu_name] = modal.Function.from_name("comfyui-model-downloader", fn_name)
-            print(f"✓ Función {fn_name} cargada")
-        except Exception as e:
-            print(f"⚠️ No se pudo cargar {fn_name}: {e}")
-    
-    get_progress_fn = modal.Function.from_name("comfyui-model-downloader", "get_download_progress")
-    list_models_fn = modal.Function.from_name("comfyui-model-downloader", "list_all_models")
-    get_output_image_fn = modal.Function.from_name("comfyui-model-downloader", "get_output_image")
-    list_output_images_fn = modal.Function.from_name("comfyui-model-downloader", "list_output_images")
-    get_billing_fn = modal.Function.from_name("comfyui-model-downloader", "get_billing_info")
-    get_available_gpus_fn = modal.Function.from_name("comfyui-model-downloader", "get_available_gpus")
-    print("✓ Funciones de Modal conectadas correctamente")
-except Exception as e:
-    print(f"⚠️ Error conectando con Modal: {e}")
-    check_model_fn = None
-    download_model_fn = None
-    execute_workflow_fns = {}
-    get_progress_fn = None
-    list_models_fn = None
-    get_output_image_fn = None
-    list_output_images_fn = None
-    get_billing_fn = None
-    get_available_gpus_fn = None
-
-
-def load_history():
-    """Carga historial de GPU desde archivo"""
-    if HISTORY_FILE.exists():
-        try:
-            return json.loads(HISTORY_FILE.read_text())
-        except:
-            return []
-    return []
+MODAL_APP_NAME = "comfyui-model-downloader"
 
 
-def save_history(entry):
-    """Guarda entrada en el historial"""
-    history = load_history()
-    history.insert(0, entry)
-    history = history[:50]  # Mantener solo últimas 50
-    HISTORY_FILE.write_text(json.dumps(history, indent=2))
+def executor_method(gpu_type, stream=False, batch=False):
+    """Nombre en el registro de execute_workflow (o execute_workflow_stream, execute_batch) del ejecutor de una GPU"""
+    method = "execute_batch" if batch else ("execute_workflow_stream" if stream else "execute_workflow")
+    return f"{GPU_EXECUTOR_MAP[gpu_type]}.{method}"
 
 
-def load_queue():
-    """Carga cola actual"""
-    if QUEUE_FILE.exists():
-        try:
-            return json.loads(QUEUE_FILE.read_text())
-        except:
-            return []
-    return []
+# Entrega de resultados: "volume" (se leen del volumen al terminar) o "stream"
+# (llegan dentro de execute_workflow_stream según se guardan, sin más llamadas).
+# Por defecto MODAL_RESULT_MODE; cada petición puede pedir otro con result_mode.
+RESULT_MODES = ("volume", "stream")
+DEFAULT_RESULT_MODE = os.environ.get("MODAL_RESULT_MODE", "volume")
+
+
+# Handles de Modal: se resuelven en segundo plano al arrancar y bajo demanda,
+# y se re-resuelven solos tras un fallo o un redeploy (ver modal_registry.py)
+modal_functions = FunctionRegistry(MODAL_APP_NAME, [
+    "check_model_exists",
+    "check_models_exist",
+    "download_model",
+    "get_download_progress",
+    "get_download_progress_batch",
+    "preflight_workflow",
+    "list_all_models",
+    "get_output_image",
+    "read_output_range",
+    "list_output_images",
+    "get_billing_info",
+    "get_available_gpus",
+    *(executor_method(gpu) for gpu in GPU_EXECUTOR_MAP),
+    *(executor_method(gpu, stream=True) for gpu in GPU_EXECUTOR_MAP),
+    *(executor_method(gpu, batch=True) for gpu in GPU_EXECUTOR_MAP),
+])
+
+
+@app.before_serving
+async def resolve_modal_functions():
+    # Sin await: el Bridge acepta peticiones mientras se resuelven
+    app.modal_watch_task = asyncio.get_running_loop().create_task(modal_functions.watch())
+
+
+# ========== Selección automática de GPU (gpu_type = "AUTO") ==========
+# La VRAM necesaria se estima con el tamaño de los modelos que devuelve el
+# pre-flight más la memoria de activaciones según la resolución y el batch de
+# los nodos latentes. Entre las GPUs que caben se elige la de menor coste
+# esperado, usando los tiempos medidos en el historial cuando los hay.
+
+AUTO_GPU = "AUTO"
+# GPU usada si AUTO no puede estimar nada (pre-flight o tabla de precios caídos)
+AUTO_FALLBACK_GPU = "A10G"
+# Contexto CUDA, PyTorch y buffers de ComfyUI
+VRAM_OVERHEAD_GB = 1.5
+VRAM_SAFETY_MARGIN = 1.2
+# Velocidad relativa aproximada; solo se usa para GPUs sin tiempos medidos
+GPU_RELATIVE_SPEED = {"T4": 1.0, "A10G": 2.2, "A100": 4.5, "H100": 7.5}
+# Nodos que crean el latente y de dónde sale su tamaño
+LATENT_NODE_TYPES = (
+    "EmptyLatentImage",
+    "EmptySD3LatentImage",
+    "EmptyHunyuanLatentVideo",
+    "EmptyMochiLatentVideo",
+    "EmptyLTXVLatentVideo",
+    "EmptyCosmosLatentVideo",
+)
+
+_gpu_table_cache = None
+
+
+async def load_gpu_table():
+    """Tabla de GPUs de get_available_gpus, pedida una vez por proceso"""
+    global _gpu_table_cache
+    if _gpu_table_cache is None:
+        _gpu_table_cache = (await modal_functions.call("get_available_gpus")).get("gpus", [])
+    return _gpu_table_cache
+
+
+def _int_input(inputs, name, default):
+    value = inputs.get(name, default)
+    return value if isinstance(value, (int, float)) else default
+
+
+def workflow_latent_pixels(workflow_api):
+    """Píxeles totales (ancho × alto × batch × frames) del mayor latente del workflow"""
+    largest = 0
+    for node in workflow_api.values():
+        if node.get("class_type") not in LATENT_NODE_TYPES:
+            continue
+        inputs = node.get("inputs", {})
+        pixels = (
+            _int_input(inputs, "width", 512)
+            * _int_input(inputs, "height", 512)
+            * _int_input(inputs, "batch_size", 1)
+            * _int_input(inputs, "length", 1)
+        )
+        largest = max(largest, pixels)
+    return largest or 512 * 512
 
 
-def save_queue(queue):
-    """Guarda cola actual"""
-    QUEUE_FILE.write_text(json.dumps(queue, indent=2))
+def workflow_work_units(workflow_api):
+    """Unidades de trabajo = megapíxeles del latente × pasos de sampler; normaliza los tiempos medidos"""
+    steps = sum(
+        _int_input(node.get("inputs", {}), "steps", 0)
+        for node in workflow_api.values()
+    )
+    return round(workflow_latent_pixels(workflow_api) / 1e6 * max(steps, 1), 4)
+
+
+def estimate_vram_gb(workflow_api, models_bytes):
+    """VRAM estimada: pesos de los modelos + activaciones + sobrecoste fijo, con margen"""
+    weights_gb = (models_bytes or 0) / (1024**3)
+    # ~2.5 GB de activaciones por megapíxel de latente (medido con SD1.5/SDXL en fp16)
+    activations_gb = 0.5 + workflow_latent_pixels(workflow_api) / (1024 * 1024) * 2.5
+    return round((weights_gb + activations_gb + VRAM_OVERHEAD_GB) * VRAM_SAFETY_MARGIN, 1)
+
+
+async def measured_seconds_per_unit():
+    """Mediana de segundos por unidad de trabajo de cada GPU, según el historial"""
+    import statistics
+    
+    samples = {}
+    recent, _ = await asyncio.to_thread(job_store.history, status='completed', limit=500)
+    for entry in recent:
+        seconds, units = entry.get('execution_seconds'), entry.get('work_units')
+        if seconds and units:
+            samples.setdefault(entry.get('gpu_type'), []).append(seconds / units)
+    return {gpu: statistics.median(rates) for gpu, rates in samples.items()}
+
+
+def seconds_per_unit(gpu, rates):
+    """Segundos por unidad de una GPU; sin medidas propias se escala desde las demás con la velocidad relativa"""
+    if gpu in rates:
+        return rates[gpu]
+    scaled = [
+        rate * GPU_RELATIVE_SPEED.get(measured, 1.0) / GPU_RELATIVE_SPEED.get(gpu, 1.0)
+        for measured, rate in rates.items()
+    ]
+    return sum(scaled) / len(scaled) if scaled else None
+
+
+async def choose_gpu(workflow_api, models_bytes):
+    """
+    Elige la GPU más barata que cabe. Devuelve (gpu, detalle) donde detalle
+    explica la estimación y los candidatos para mostrarlo en la respuesta.
+    """
+    vram_needed = estimate_vram_gb(workflow_api, models_bytes)
+    units = workflow_work_units(workflow_api)
+    rates = await measured_seconds_per_unit()
+    
+    candidates = []
+    for gpu in await load_gpu_table():
+        name = gpu["name"]
+        if name not in GPU_EXECUTOR_MAP or not modal_functions.available(executor_method(name)):
+            continue
+        rate = seconds_per_unit(name, rates)
+        est_seconds = round(rate * units, 1) if rate else None
+        candidates.append({
+            "gpu": name,
+            "vram_gb": gpu["vram_gb"],
+            "fits": gpu["vram_gb"] >= vram_needed,
+            "cost_per_hour": gpu["cost_per_hour"],
+            "measured": name in rates,
+            "est_seconds": est_seconds,
+            "est_cost_usd": round(gpu["cost_per_hour"] * est_seconds / 3600, 5) if est_seconds else None
+        })
+    
+    fitting = [c for c in candidates if c["fits"]]
+    if not fitting:
+        # Nada cabe entero: la de más VRAM, ComfyUI descargará a RAM lo que sobre
+        fitting = sorted(candidates, key=lambda c: c["vram_gb"])[-1:]
+    if all(c["est_cost_usd"] is not None for c in fitting):
+        best = min(fitting, key=lambda c: (c["est_cost_usd"], c["cost_per_hour"]))
+        reason = "menor coste esperado según tiempos medidos"
+    else:
+        best = min(fitting, key=lambda c: c["cost_per_hour"])
+        reason = "menor precio por hora (sin tiempos medidos)"
+    
+    return best["gpu"], {
+        "mode": "auto",
+        "vram_needed_gb": vram_needed,
+        "work_units": units,
+        "reason": reason,
+        "candidates": candidates
+    }
 
 
 @app.route('/check_model', methods=['POST'])
-def check_model():
-    if not check_model_fn:
+async def check_model():
+    if not await modal_functions.get("check_model_exists"):
         return jsonify({"error": "Modal no está conectado", "exists": False}), 503
     
-    data = request.json
+    data = await request.get_json()
     subfolder = data.get('subfolder')
     filename = data.get('filename')
     
     print(f"🔍 Verificando: {subfolder}/{filename}")
     
     try:
-        result = check_model_fn.remote(subfolder=subfolder, filename=filename)
+        result = await modal_functions.call("check_model_exists", subfolder=subfolder, filename=filename)
         print(f"  Resultado: {'✓ Existe' if result.get('exists') else '✗ No existe'}")
         return jsonify(result)
     except Exception as e:
@@ -113,27 +260,63 @@ def check_model():
         return jsonify({"error": str(e), "exists": False}), 500
 
 
+@app.route('/check_models', methods=['POST'])
+async def check_models():
+    """Comprueba varios modelos con una sola llamada a Modal"""
+    if not await modal_functions.get("check_models_exist"):
+        return jsonify({"error": "Modal no está conectado", "results": []}), 503
+    
+    data = (await request.get_json()) or {}
+    models = [
+        {"subfolder": m.get('subfolder'), "filename": m.get('filename')}
+        for m in data.get('models', [])
+        if m.get('subfolder') and m.get('filename')
+    ]
+    if not models:
+        return jsonify({"results": []})
+    
+    print(f"🔍 Verificando {len(models)} modelos en un solo lote")
+    
+    try:
+        result = await modal_functions.call("check_models_exist", models=models)
+        existing = sum(1 for r in result.get('results', []) if r.get('exists'))
+        print(f"  Resultado: {existing}/{len(models)} existen")
+        return jsonify(result)
+    except Exception as e:
+        print(f"  ✗ Error: {e}")
+        return jsonify({"error": str(e), "results": []}), 500
+
+
+async def spawn_download(url, subfolder, filename):
+    """Lanza download_model en Modal y devuelve (task_id, call)"""
+    task_id = str(uuid.uuid4())
+    
+    print(f"⬇️ Descargando: {subfolder}/{filename} [task_id: {task_id}]")
+    print(f"  URL: {url[:80]}...")
+    
+    call = await modal_functions.spawn(
+        "download_model",
+        url=url,
+        subfolder=subfolder,
+        filename=filename,
+        task_id=task_id
+    )
+    track_call(task_id, call)
+    return task_id, call
+
+
 @app.route('/download_model', methods=['POST'])
-def download_model():
-    if not download_model_fn:
+async def download_model():
+    if not await modal_functions.get("download_model"):
         return jsonify({"error": "Modal no está conectado", "status": "error"}), 503
     
-    data = request.json
+    data = await request.get_json()
     url = data.get('url')
     subfolder = data.get('subfolder')
     filename = data.get('filename')
-    task_id = str(uuid.uuid4())
-    
-    print(f"⬇️ Descargando: {subfolder}/{filename} [task_id: {task_id}]")
-    print(f"  URL: {url[:80]}...")
     
     try:
-        call = download_model_fn.spawn(
-            url=url,
-            subfolder=subfolder,
-            filename=filename,
-            task_id=task_id
-        )
+        task_id, call = await spawn_download(url, subfolder, filename)
         
         return jsonify({
             "status": "started",
@@ -146,154 +329,1578 @@ def download_model():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+# ========== Planificador (server/modal_scheduler.py) ==========
+# /execute_workflow encola; el planificador lanza cada trabajo cuando hay hueco
+# en su GPU y cabe en el techo de gasto por hora. Se configura al arrancar:
+#   MODAL_MAX_CONCURRENCY="T4=4,A10G=3,A100=2,H100=1"  contenedores a la vez por GPU
+#   MODAL_SPEND_CEILING_PER_HOUR=5                       USD por hora (sin definir = sin techo)
+#   MODAL_MAX_QUEUED=100                                 trabajos esperando como máximo
+
+GPU_MAX_CONCURRENCY = {"T4": 4, "A10G": 3, "A100": 2, "H100": 1}
+# Duración supuesta de un trabajo sin tiempos medidos (para el gasto estimado)
+DEFAULT_JOB_SECONDS = 120
+# Cada cuánto se mira el progreso de los trabajos lanzados y cuándo se dan por perdidos
+JOB_WATCH_INTERVAL = 3.0
+JOB_MAX_SECONDS = 3600
+
+
+def _concurrency_limits(value):
+    limits = dict(GPU_MAX_CONCURRENCY)
+    for pair in filter(None, (p.strip() for p in value.split(","))):
+        gpu, _, limit = pair.partition("=")
+        limits[gpu.strip().upper()] = int(limit)
+    return limits
+
+
+def estimate_job_seconds(gpu_type, workflow_api, rates):
+    """Duración esperada según los tiempos medidos (DEFAULT_JOB_SECONDS si no hay)"""
+    rate = seconds_per_unit(gpu_type, rates)
+    return round(rate * workflow_work_units(workflow_api), 1) if rate else DEFAULT_JOB_SECONDS
+
+
+async def launch_job(job):
+    """Lanza en Modal un trabajo que sale de la cola; devuelve su call_id (None en modo stream)"""
+    task_id, gpu_type = job["task_id"], job["gpu_type"]
+    call_id = None
+    if job.get("variants"):
+        call = await modal_functions.spawn(
+            executor_method(gpu_type, batch=True),
+            variants=job["variants"],
+            batch_id=job["batch_id"]
+        )
+        call_id = call.object_id
+        track_call(task_id, call)
+    elif job["result_mode"] == "stream":
+        start_streamed_execution(gpu_type, job["workflow_api"], task_id)
+    else:
+        call = await modal_functions.spawn(
+            executor_method(gpu_type),
+            workflow_api=job["workflow_api"],
+            task_id=task_id
+        )
+        call_id = call.object_id
+        track_call(task_id, call)
+    # El workflow ya está en Modal: no hace falta retenerlo en memoria
+    job.pop("workflow_api", None)
+    job.pop("variants", None)
+    queue_seconds = round(job["started_at"] - job["queued_at"], 2)
+    # Un grupo de un lote no está en el historial: lo están sus variantes
+    for variant_id in batch_chunks.get(task_id, [task_id]):
+        await asyncio.to_thread(
+            job_store.update, variant_id, only_active=True, status="running", call_id=call_id, queue_seconds=queue_seconds
+        )
+    print(f"🚀 [{task_id[:8]}] Lanzado en {gpu_type} tras {queue_seconds}s en cola")
+    return call_id
+
+
+async def job_launch_failed(job, error):
+    print(f"  ✗ [{job['task_id'][:8]}] No se pudo lanzar: {error}")
+    # No llegó a lanzarse: pasa al historial como fallida
+    for task_id in forget_batch_chunk(job["task_id"]) or [job["task_id"]]:
+        await asyncio.to_thread(job_store.finish, task_id, 'failed', error=str(error))
+
+
+scheduler = JobScheduler(
+    launch_job,
+    _concurrency_limits(os.environ.get("MODAL_MAX_CONCURRENCY", "")),
+    spend_ceiling_per_hour=float(os.environ.get("MODAL_SPEND_CEILING_PER_HOUR") or 0) or None,
+    max_queued=int(os.environ.get("MODAL_MAX_QUEUED", "100")),
+    on_launch_error=job_launch_failed
+)
+
+
+async def refresh_gpu_prices():
+    """Precios por hora para el techo de gasto, de la tabla de get_available_gpus"""
+    if scheduler.price_per_hour:
+        return
+    try:
+        scheduler.price_per_hour.update({gpu["name"]: gpu["cost_per_hour"] for gpu in await load_gpu_table()})
+    except Exception as e:
+        print(f"⚠️ Sin tabla de precios, el techo de gasto no puede aplicarse todavía: {e}")
+
+
+async def watch_running_jobs():
+    """
+    Sigue los trabajos lanzados (y las descargas) aunque ninguna pestaña los
+    mire: el resultado de cada FunctionCall se recoge sin bloquear y, para lo
+    que no tiene llamada (modo stream, trabajos antiguos), se lee el progreso.
+    record_progress los libera del planificador al terminar.
+    """
+    while True:
+        await asyncio.sleep(JOB_WATCH_INTERVAL)
+        if tracked_calls:
+            await asyncio.gather(*(poll_call(task_id) for task_id in list(tracked_calls)))
+        running = [task_id for task_id in scheduler.running_ids() if task_id not in tracked_calls]
+        if not running:
+            continue
+        try:
+            await progress_cache.get_many(running)
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar el progreso de los trabajos en curso: {e}")
+        for task_id in running:
+            job = scheduler.running(task_id)
+            if job and time.monotonic() - job["started_at"] > JOB_MAX_SECONDS:
+                await asyncio.to_thread(job_store.finish, task_id, 'failed', error=f"Sin estado final tras {JOB_MAX_SECONDS} s")
+                scheduler.release(task_id)
+
+
+@app.before_serving
+async def start_scheduler():
+    # Lo que estaba en cola al cerrar el Bridge se perdió con él; lo lanzado sigue ocupando hueco.
+    # Corre una vez antes de servir peticiones, así que aquí el SQLite se usa sin hilos
+    for job in job_store.active():
+        if job.get("status") == "queued":
+            job_store.finish(job["task_id"], 'failed', error="El Bridge se reinició con el trabajo en cola")
+        elif job.get("batch_chunk"):
+            # Variante de un lote: el hueco y la llamada son de su grupo
+            chunk_id = job["batch_chunk"]
+            if chunk_id not in batch_chunks:
+                scheduler.adopt({"task_id": chunk_id, "gpu_type": job["gpu_type"]})
+                if job.get("call_id"):
+                    track_call(chunk_id, modal.FunctionCall.from_id(job["call_id"]))
+            remember_batch_chunk(chunk_id, [*batch_chunks.get(chunk_id, []), job["task_id"]])
+        elif job.get("gpu_type") in GPU_EXECUTOR_MAP:
+            scheduler.adopt({"task_id": job["task_id"], "gpu_type": job["gpu_type"]})
+            if job.get("result_mode") == "stream":
+                # execute_workflow_stream emite su resultado en vez de devolverlo: get() no
+                # lo da, así que se sigue por el Dict de progreso. El call_id sirve para cancelar
+                if job.get("call_id"):
+                    _stream_call_ids[job["task_id"]] = job["call_id"]
+            elif job.get("call_id"):
+                track_call(job["task_id"], modal.FunctionCall.from_id(job["call_id"]))
+    loop = asyncio.get_running_loop()
+    app.scheduler_task = loop.create_task(scheduler.run())
+    app.job_watch_task = loop.create_task(watch_running_jobs())
+
+
 @app.route('/execute_workflow', methods=['POST'])
-def execute_workflow():
-    data = request.json
+async def execute_workflow():
+    data = await request.get_json()
     workflow_api = data.get('workflow')
     gpu_type = data.get('gpu_type', 'T4').upper()
+    result_mode = data.get('result_mode') or DEFAULT_RESULT_MODE
+    priority = data.get('priority') or 'normal'
     
     if not workflow_api:
         return jsonify({"error": "No se proporcionó workflow", "status": "error"}), 400
+    if priority not in PRIORITIES:
+        return jsonify({"error": f"Prioridad '{priority}' no válida. Opciones: {', '.join(PRIORITIES)}", "status": "error"}), 400
+    if result_mode not in RESULT_MODES:
+        return jsonify({"error": f"result_mode '{result_mode}' no válido. Opciones: {', '.join(RESULT_MODES)}", "status": "error"}), 400
     
     # Validar GPU
-    if gpu_type not in execute_workflow_fns:
+    if gpu_type != AUTO_GPU and gpu_type not in GPU_EXECUTOR_MAP:
         return jsonify({
-            "error": f"GPU '{gpu_type}' no válida. Opciones: {', '.join(execute_workflow_fns.keys())}",
+            "error": f"GPU '{gpu_type}' no válida. Opciones: {', '.join([AUTO_GPU, *GPU_EXECUTOR_MAP])}",
             "status": "error"
         }), 400
     
-    execute_fn = execute_workflow_fns[gpu_type]
+    # Pre-flight: comprobar los modelos con una llamada CPU antes de arrancar la GPU
+    preflight = None
+    if not data.get('skip_preflight') and await modal_functions.get("preflight_workflow"):
+        try:
+            preflight = await modal_functions.call(
+                "preflight_workflow",
+                workflow_api=workflow_api,
+                model_sources=data.get('model_sources') or []
+            )
+            print(f"🧾 Pre-flight: {len(preflight['models'])} modelos ({preflight['total_gb']}), faltan {len(preflight['missing'])}")
+        except Exception as e:
+            print(f"⚠️ Pre-flight no disponible, se ejecuta sin comprobar modelos: {e}")
+        if preflight:
+            warn_unverified_models(preflight)
+        if preflight and preflight['missing']:
+            return await reject_missing_models(preflight, data.get('auto_download_models', False))
+    
+    gpu_selection = {"mode": "manual"}
+    if gpu_type == AUTO_GPU:
+        try:
+            gpu_type, gpu_selection = await choose_gpu(workflow_api, preflight['total_bytes'] if preflight else None)
+            print(f"🤖 GPU automática: {gpu_type} (~{gpu_selection['vram_needed_gb']} GB VRAM, {gpu_selection['reason']})")
+        except Exception as e:
+            gpu_type = AUTO_FALLBACK_GPU
+            gpu_selection = {"mode": "auto", "reason": f"estimación no disponible: {e}"}
+            print(f"⚠️ No se pudo elegir GPU automáticamente, se usa {gpu_type}: {e}")
+    
+    if not await modal_functions.get(executor_method(gpu_type)):
+        return jsonify({"error": f"GPU '{gpu_type}' no disponible en Modal", "status": "error"}), 503
+    if result_mode == "stream" and not await modal_functions.get(executor_method(gpu_type, stream=True)):
+        # App desplegada antes de execute_workflow_stream
+        print("⚠️ execute_workflow_stream no disponible, los resultados se leerán del volumen")
+        result_mode = "volume"
     
     task_id = str(uuid.uuid4())
     print(f"🎨 Ejecutando workflow en Modal con GPU: {gpu_type} [task_id: {task_id}]")
     print(f"  Nodos: {len(workflow_api)}")
     
+    await refresh_gpu_prices()
+    estimated_seconds = estimate_job_seconds(gpu_type, workflow_api, await measured_seconds_per_unit())
+    
     try:
-        # Agregar a la cola
-        queue = load_queue()
-        queue_entry = {
+        # Queda en la cola hasta que el planificador lo lance
+        await asyncio.to_thread(job_store.add, {
             "task_id": task_id,
             "gpu_type": gpu_type,
-            "status": "running",
+            "status": "queued",
             "timestamp": datetime.now().isoformat(),
-            "nodes": len(workflow_api)
-        }
-        queue.append(queue_entry)
-        save_queue(queue)
+            "nodes": len(workflow_api),
+            "models_bytes": preflight['total_bytes'] if preflight else None,
+            "work_units": workflow_work_units(workflow_api),
+            "gpu_selection": gpu_selection.get("mode"),
+            "result_mode": result_mode,
+            "priority": priority,
+            "estimated_seconds": estimated_seconds
+        })
         
-        call = execute_fn.spawn(
-            workflow_api=workflow_api,
-            task_id=task_id
-        )
+        try:
+            launch = scheduler.submit({
+                "task_id": task_id,
+                "gpu_type": gpu_type,
+                "priority": priority,
+                "user": data.get('client_id') or request.remote_addr or "local",
+                "estimated_seconds": estimated_seconds,
+                "workflow_api": workflow_api,
+                "result_mode": result_mode
+            })
+        except AdmissionError as e:
+            print(f"  ⛔ Rechazado: {e}")
+            await asyncio.to_thread(job_store.finish, task_id, 'failed', error=str(e))
+            return jsonify({"status": "rejected", "message": str(e), "task_id": task_id}), 429
         
+        # Si había hueco ya se está lanzando: se espera para devolver el call_id
+        call_id = await asyncio.shield(launch) if launch else None
+        job = await asyncio.to_thread(job_store.get, task_id)
+        if job["status"] == "failed":
+            return jsonify({"status": "error", "message": job.get("error")}), 500
+        
+        position = scheduler.position(task_id)
+        if position:
+            print(f"  ⏳ En cola, posición {position}")
         return jsonify({
-            "status": "started",
-            "message": f"Ejecución iniciada en Modal con GPU {gpu_type}",
+            "status": "queued" if position else "started",
+            "message": (
+                f"En cola para GPU {gpu_type} (posición {position})" if position
+                else f"Ejecución iniciada en Modal con GPU {gpu_type}"
+            ),
             "task_id": task_id,
-            "call_id": call.object_id,
-            "gpu_type": gpu_type
+            "call_id": call_id,
+            "queue_position": position,
+            "priority": priority,
+            "result_mode": result_mode,
+            "gpu_type": gpu_type,
+            "gpu_selection": gpu_selection,
+            "models_bytes": preflight['total_bytes'] if preflight else None
         })
     except Exception as e:
         print(f"  ✗ Error: {e}")
         
-        # Actualizar cola como error
-        queue = load_queue()
-        for item in queue:
-            if item['task_id'] == task_id:
-                item['status'] = 'error'
-                item['error'] = str(e)
-        save_queue(queue)
+        scheduler.release(task_id, ran=False)
+        await asyncio.to_thread(job_store.finish, task_id, 'failed', error=str(e))
         
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
-@app.route('/progress/<task_id>', methods=['GET'])
-def get_progress(task_id):
-    if not get_progress_fn:
-        return jsonify({"error": "Modal no está conectado"}), 503
+def warn_unverified_models(preflight):
+    """Modelos de nodos personalizados que no están en el catálogo: se avisa y se ejecuta igual"""
+    for model in preflight.get('unverified', []):
+        print(f"  ⚠️ {model['class_type']}.{model['input']} = {model['filename']}: no está en el catálogo, se ejecuta sin comprobar")
+
+
+async def reject_missing_models(preflight, auto_download):
+    """
+    Responde 409 sin lanzar la GPU. Con auto_download se empiezan a bajar los
+    modelos que traen URL; el cliente reenvía el workflow cuando terminen.
+    """
+    missing = preflight['missing']
+    downloads = []
+    if auto_download and await modal_functions.get("download_model"):
+        downloadable = [m for m in missing if m.get('url')]
+        # Todas las descargas se lanzan a la vez
+        spawned = await asyncio.gather(
+            *(spawn_download(m['url'], m['subfolder'], m['filename']) for m in downloadable),
+            return_exceptions=True
+        )
+        for model, outcome in zip(downloadable, spawned):
+            if isinstance(outcome, Exception):
+                print(f"  ✗ No se pudo lanzar la descarga de {model['filename']}: {outcome}")
+                continue
+            downloads.append({
+                "task_id": outcome[0],
+                "subfolder": model['subfolder'],
+                "filename": model['filename']
+            })
+    
+    without_url = [m for m in missing if not m.get('url')]
+    names = ', '.join(f"{m['subfolder']}/{m['filename']}" for m in missing)
+    print(f"✗ Workflow rechazado, faltan modelos: {names}")
+    return jsonify({
+        "status": "missing_models",
+        "message": f"Faltan {len(missing)} modelo(s) en Modal: {names}",
+        "missing": missing,
+        "downloads": downloads,
+        "not_downloadable": without_url,
+        "models_bytes": preflight['total_bytes']
+    }), 409
+
+
+# ========== Lotes y barridos de parámetros (/execute_batch) ==========
+# Un workflow con un barrido ({"<nodo>.<input>": [valores]}) o una lista de
+# workflows completos. Cada variante es un trabajo con su task_id, progreso e
+# historial. Las que usan los mismos modelos se agrupan (como mucho
+# variants_per_container y sin que su duración estimada pase de
+# BATCH_CONTAINER_BUDGET_SECONDS) en una llamada a execute_batch, que las
+# ejecuta seguidas en un contenedor: un arranque en frío y una carga de modelos
+# por grupo. Cada grupo pasa por el planificador, que reparte los grupos entre
+# contenedores según el límite de su GPU y el techo de gasto.
+
+BATCH_VARIANTS_PER_CONTAINER = int(os.environ.get("MODAL_BATCH_VARIANTS_PER_CONTAINER", "4"))
+MAX_VARIANTS_PER_CONTAINER = 16
+# Timeout de execute_batch en Modal (EXECUTOR_TIMEOUT en modal_downloader.py). Un
+# grupo se llena hasta la mitad: las estimaciones fallan y el timeout mata a todo el grupo
+EXECUTOR_TIMEOUT_SECONDS = 1800
+BATCH_CONTAINER_BUDGET_SECONDS = EXECUTOR_TIMEOUT_SECONDS // 2
+MAX_BATCH_VARIANTS = 256
+SWEEP_MODES = ("product", "zip")
+MODEL_FILE_SUFFIXES = (".safetensors", ".sft", ".ckpt", ".pt", ".pth", ".bin", ".gguf")
+# Los LoRA son pequeños y ComfyUI los aplica sobre el modelo ya cargado: no separan grupos
+SHARED_BASE_INPUTS = ("lora_name",)
+
+
+def is_workflow_api(workflow_api):
+    """Workflow en formato API: {"<nodo>": {"class_type", "inputs"}, ...}"""
+    return (
+        isinstance(workflow_api, dict) and bool(workflow_api)
+        and all(isinstance(node, dict) and isinstance(node.get("inputs", {}), dict) for node in workflow_api.values())
+    )
+
+
+def sweep_variants(workflow_api, sweep, mode="product"):
+    """
+    Lista de (workflow, valores) de un barrido. "product" prueba todas las
+    combinaciones y "zip" empareja las listas por posición. Lanza ValueError
+    si el barrido no encaja con el workflow o pasa de MAX_BATCH_VARIANTS.
+    """
+    if mode not in SWEEP_MODES:
+        raise ValueError(f"sweep_mode '{mode}' no válido. Opciones: {', '.join(SWEEP_MODES)}")
+    if not is_workflow_api(workflow_api):
+        raise ValueError("workflow debe ser un workflow en formato API")
+    if not isinstance(sweep, dict):
+        raise ValueError('sweep debe ser un objeto {"<nodo>.<input>": [valores]}')
+    for key, values in sweep.items():
+        node_id, _, input_name = key.partition(".")
+        if input_name not in workflow_api.get(node_id, {}).get("inputs", {}):
+            raise ValueError(f"'{key}' no está en el workflow (formato <nodo>.<input>)")
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"'{key}' necesita una lista de valores")
+    
+    lengths = [len(values) for values in sweep.values()]
+    if mode == "zip" and len(set(lengths)) > 1:
+        raise ValueError("Con sweep_mode 'zip' todas las listas deben tener la misma longitud")
+    count = lengths[0] if mode == "zip" else math.prod(lengths)
+    if count > MAX_BATCH_VARIANTS:
+        raise ValueError(f"El barrido genera {count} variantes (máximo {MAX_BATCH_VARIANTS})")
+    
+    combos = zip(*sweep.values()) if mode == "zip" else itertools.product(*sweep.values())
+    variants = []
+    for combo in combos:
+        params = dict(zip(sweep, combo))
+        variant = copy.deepcopy(workflow_api)
+        for key, value in params.items():
+            node_id, _, input_name = key.partition(".")
+            variant[node_id]["inputs"][input_name] = value
+        variants.append((variant, params))
+    return variants
+
+
+def workflow_model_files(workflow_api, base_only=True):
+    """Ficheros de modelo de un workflow; con base_only, sin los LoRA (para agrupar variantes)"""
+    return frozenset(
+        value
+        for node in workflow_api.values() if isinstance(node, dict)
+        for name, value in node.get("inputs", {}).items()
+        if not (base_only and name in SHARED_BASE_INPUTS) and isinstance(value, str) and value.lower().endswith(MODEL_FILE_SUFFIXES)
+    )
+
+
+def pack_variants(variants, per_container, budget_seconds=BATCH_CONTAINER_BUDGET_SECONDS):
+    """
+    Grupos de variantes con los mismos modelos, de como mucho per_container y
+    con la suma de estimated_seconds dentro de budget_seconds (una variante que
+    ya lo supera va sola).
+    """
+    by_models = {}
+    for variant in variants:
+        by_models.setdefault(workflow_model_files(variant["workflow_api"]), []).append(variant)
+    chunks = []
+    for group in by_models.values():
+        chunk, seconds = [], 0.0
+        for variant in group:
+            if chunk and (len(chunk) >= per_container or seconds + variant["estimated_seconds"] > budget_seconds):
+                chunks.append(chunk)
+                chunk, seconds = [], 0.0
+            chunk.append(variant)
+            seconds += variant["estimated_seconds"]
+        chunks.append(chunk)
+    return chunks
+
+
+@app.route('/execute_batch', methods=['POST'])
+async def execute_batch():
+    data = await request.get_json()
+    gpu_type = data.get('gpu_type', 'T4').upper()
+    priority = data.get('priority') or 'normal'
+    
+    try:
+        per_container = int(data.get('variants_per_container') or BATCH_VARIANTS_PER_CONTAINER)
+        per_container = min(max(per_container, 1), MAX_VARIANTS_PER_CONTAINER)
+        if data.get('workflows'):
+            if not isinstance(data['workflows'], list) or not all(map(is_workflow_api, data['workflows'])):
+                raise ValueError("workflows debe ser una lista de workflows en formato API")
+            if len(data['workflows']) > MAX_BATCH_VARIANTS:
+                raise ValueError(f"Demasiados workflows (máximo {MAX_BATCH_VARIANTS})")
+            variants = [(wf, {"workflow_index": i}) for i, wf in enumerate(data['workflows'])]
+        elif data.get('workflow') and data.get('sweep'):
+            variants = sweep_variants(data['workflow'], data['sweep'], data.get('sweep_mode') or 'product')
+        else:
+            raise ValueError("Falta workflow + sweep, o workflows")
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e), "status": "error"}), 400
+    if priority not in PRIORITIES:
+        return jsonify({"error": f"Prioridad '{priority}' no válida. Opciones: {', '.join(PRIORITIES)}", "status": "error"}), 400
+    if gpu_type != AUTO_GPU and gpu_type not in GPU_EXECUTOR_MAP:
+        return jsonify({
+            "error": f"GPU '{gpu_type}' no válida. Opciones: {', '.join([AUTO_GPU, *GPU_EXECUTOR_MAP])}",
+            "status": "error"
+        }), 400
+    
+    # Pre-flight una vez por cada conjunto de modelos distinto, no por variante
+    models_bytes = None
+    if not data.get('skip_preflight') and await modal_functions.get("preflight_workflow"):
+        representatives = {workflow_model_files(wf, base_only=False): wf for wf, _ in variants}
+        for wf in representatives.values():
+            try:
+                preflight = await modal_functions.call(
+                    "preflight_workflow",
+                    workflow_api=wf,
+                    model_sources=data.get('model_sources') or []
+                )
+            except Exception as e:
+                print(f"⚠️ Pre-flight no disponible, se ejecuta sin comprobar modelos: {e}")
+                break
+            warn_unverified_models(preflight)
+            if preflight['missing']:
+                return await reject_missing_models(preflight, data.get('auto_download_models', False))
+            models_bytes = max(models_bytes or 0, preflight['total_bytes'])
+    
+    gpu_selection = {"mode": "manual"}
+    if gpu_type == AUTO_GPU:
+        # Todo el lote va en la misma GPU: la elige la variante más pesada
+        heaviest = max((wf for wf, _ in variants), key=workflow_work_units)
+        try:
+            gpu_type, gpu_selection = await choose_gpu(heaviest, models_bytes)
+            print(f"🤖 GPU automática: {gpu_type} (~{gpu_selection['vram_needed_gb']} GB VRAM, {gpu_selection['reason']})")
+        except Exception as e:
+            gpu_type = AUTO_FALLBACK_GPU
+            gpu_selection = {"mode": "auto", "reason": f"estimación no disponible: {e}"}
+            print(f"⚠️ No se pudo elegir GPU automáticamente, se usa {gpu_type}: {e}")
+    
+    if not await modal_functions.get(executor_method(gpu_type, batch=True)):
+        return jsonify({"error": f"execute_batch no disponible en Modal para GPU '{gpu_type}' (¿falta redesplegar?)", "status": "error"}), 503
+    
+    await refresh_gpu_prices()
+    batch_id = str(uuid.uuid4())
+    user = data.get('client_id') or request.remote_addr or "local"
+    rates = await measured_seconds_per_unit()
+    items = [
+        {
+            "task_id": str(uuid.uuid4()),
+            "variant": index,
+            "params": params,
+            "workflow_api": wf,
+            "estimated_seconds": estimate_job_seconds(gpu_type, wf, rates)
+        }
+        for index, (wf, params) in enumerate(variants)
+    ]
+    chunks = pack_variants(items, per_container)
+    print(f"🧪 Lote {batch_id[:8]}: {len(items)} variantes en {len(chunks)} contenedor(es) {gpu_type}")
+    
+    launches, rejected = [], []
+    for chunk in chunks:
+        chunk_id = str(uuid.uuid4())
+        for item in chunk:
+            await asyncio.to_thread(job_store.add, {
+                "task_id": item["task_id"],
+                "gpu_type": gpu_type,
+                "status": "queued",
+                "timestamp": datetime.now().isoformat(),
+                "nodes": len(item["workflow_api"]),
+                "models_bytes": models_bytes,
+                "work_units": workflow_work_units(item["workflow_api"]),
+                "gpu_selection": gpu_selection.get("mode"),
+                "result_mode": "volume",
+                "priority": priority,
+                "estimated_seconds": item["estimated_seconds"],
+                "batch_id": batch_id,
+                "batch_chunk": chunk_id,
+                "variant": item["variant"],
+                "params": item["params"]
+            })
+        remember_batch_chunk(chunk_id, [item["task_id"] for item in chunk])
+        try:
+            launch = scheduler.submit({
+                "task_id": chunk_id,
+                "gpu_type": gpu_type,
+                "priority": priority,
+                "user": user,
+                "estimated_seconds": sum(item["estimated_seconds"] for item in chunk),
+                "batch_id": batch_id,
+                "variants": [{"task_id": item["task_id"], "workflow_api": item["workflow_api"]} for item in chunk],
+                "result_mode": "volume"
+            })
+        except AdmissionError as e:
+            print(f"  ⛔ Grupo rechazado: {e}")
+            for task_id in forget_batch_chunk(chunk_id):
+                await asyncio.to_thread(job_store.finish, task_id, 'failed', error=str(e))
+                rejected.append(task_id)
+            continue
+        if launch:
+            launches.append(launch)
+    
+    # Los grupos que cabían ya se están lanzando: se espera para informar de su estado
+    await asyncio.gather(*(asyncio.shield(launch) for launch in launches))
+    jobs = await asyncio.to_thread(job_store.batch, batch_id)
+    if len(rejected) == len(jobs):
+        return jsonify({"status": "rejected", "message": jobs[0].get("error"), "batch_id": batch_id}), 429
+    return jsonify({
+        "status": "started" if launches else "queued",
+        "message": f"{len(jobs)} variantes en {len(chunks)} contenedor(es) con GPU {gpu_type}",
+        "batch_id": batch_id,
+        "gpu_type": gpu_type,
+        "gpu_selection": gpu_selection,
+        "priority": priority,
+        "containers": len(chunks),
+        "rejected": len(rejected),
+        "variants": [
+            {key: job.get(key) for key in ("task_id", "variant", "params", "status", "batch_chunk", "error")}
+            for job in jobs
+        ]
+    })
+
+
+@app.route('/batch/<batch_id>', methods=['GET'])
+async def get_batch(batch_id):
+    """Progreso agregado de un lote y, por variante, su estado, valores y resultados"""
+    jobs = await asyncio.to_thread(job_store.batch, batch_id)
+    if not jobs:
+        return jsonify({"status": "error", "message": f"Lote desconocido: {batch_id}"}), 404
+    
+    active = [job["task_id"] for job in jobs if job["status"] not in TERMINAL_STATES]
+    progress = {}
+    if active:
+        try:
+            progress = await progress_cache.get_many(active)
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar el progreso del lote {batch_id[:8]}: {e}")
+        # La caché pasa al historial lo que acaba de terminar
+        jobs = await asyncio.to_thread(job_store.batch, batch_id)
+    
+    variants = []
+    for job in jobs:
+        live = progress.get(job["task_id"]) or {}
+        state = job["status"] if job["status"] in TERMINAL_STATES else (progress_state(live) or job["status"])
+        variants.append({
+            "task_id": job["task_id"],
+            "variant": job.get("variant"),
+            "params": job.get("params"),
+            "state": state,
+            "percent": 100 if state in TERMINAL_STATES else live.get("percent", 0),
+            "message": job.get("error") if state in TERMINAL_STATES else live.get("message"),
+            "images": job.get("images", []),
+            "execution_seconds": job.get("execution_seconds")
+        })
+    
+    counts = {}
+    for variant in variants:
+        counts[variant["state"]] = counts.get(variant["state"], 0) + 1
+    finished = sum(counts.get(state, 0) for state in TERMINAL_STATES)
+    return jsonify({
+        "batch_id": batch_id,
+        "gpu_type": jobs[0].get("gpu_type"),
+        "state": "completed" if finished == len(variants) else ("queued" if counts.get("queued") == len(variants) else "running"),
+        "percent": round(sum(v["percent"] for v in variants) / len(variants)),
+        "total": len(variants),
+        "counts": counts,
+        "variants": variants
+    })
+
+
+def progress_state(result):
+    """Estado efectivo de un progreso (los registros antiguos solo traen percent)"""
+    state = result.get('state')
+    if state not in TERMINAL_STATES and result.get('percent') == 100:
+        state = 'completed'
+    return state
+
+
+async def record_progress(task_id, result):
+    """Si la tarea terminó (bien o mal), pasarla de la cola al historial"""
+    state = progress_state(result)
+    if state not in TERMINAL_STATES:
+        return
     
+    final = result.get('result') or {}
+    fields = {
+        "images": result.get('generated_images', []),
+        "start_type": result.get('start_type'),
+        "startup_seconds": result.get('startup_seconds'),
+        "execution_seconds": result.get('execution_seconds')
+    }
+    if result.get('outputs'):
+        fields["outputs"] = result['outputs']
+        expected_outputs.update(result['outputs'])
+    if state != 'completed':
+        fields["error"] = final.get('message', result.get('message'))
+        if final.get('details'):
+            fields["error_details"] = final['details']
+    # finish solo actúa sobre trabajos activos: un segundo aviso no duplica nada
+    await asyncio.to_thread(job_store.finish, task_id, state, **fields)
+    scheduler.release(task_id)
+    _stream_call_ids.pop(task_id, None)
+
+
+# ========== Resultado de las llamadas (FunctionCall) ==========
+# Cada spawn deja aquí su FunctionCall y el vigilante recoge el resultado sin
+# bloquear (get con timeout=0). El estado final sale de lo que devolvió la
+# función (o de su excepción), así que un contenedor que se cae o agota su
+# timeout ya no deja la tarea colgada en su último porcentaje del Dict.
+
+# Transitorios: la llamada puede seguir viva, se vuelve a preguntar luego
+CALL_TRANSIENT_ERRORS = (modal.exception.ConnectionError, modal.exception.AuthError, ConnectionError)
+# Sin resultado todavía: según la versión de modal, get(timeout=0) lanza el TimeoutError de Python o el suyo
+CALL_PENDING_ERRORS = (TimeoutError, modal.exception.TimeoutError)
+CALL_OUTCOME_TTL = 900
+
+tracked_calls = {}    # task_id -> FunctionCall sin resultado todavía
+call_outcomes = {}    # task_id -> (recogido en, progreso final según la llamada)
+batch_chunks = {}     # grupo de un lote (una llamada a execute_batch) -> task_id de sus variantes
+batch_variant_chunk = {}   # task_id de una variante -> su grupo
+
+
+def track_call(task_id, call):
+    tracked_calls[task_id] = call
+
+
+def remember_batch_chunk(chunk_id, variant_ids):
+    batch_chunks[chunk_id] = variant_ids
+    for variant_id in variant_ids:
+        batch_variant_chunk[variant_id] = chunk_id
+
+
+def forget_batch_chunk(chunk_id):
+    """Deja de seguir un grupo; devuelve sus variantes (None si no era un grupo)"""
+    variant_ids = batch_chunks.pop(chunk_id, None)
+    for variant_id in variant_ids or []:
+        batch_variant_chunk.pop(variant_id, None)
+    return variant_ids
+
+
+def variant_outcomes(variant_ids, outcome):
+    """Progreso final de cada variante a partir del de su grupo (las que no llegaron a correr heredan el fallo)"""
+    results = {r.get("task_id"): r for r in (outcome.get("result") or {}).get("results", [])}
+    return {t: outcome_progress(results[t]) if t in results else outcome for t in variant_ids}
+
+
+def outcome_progress(result):
+    """Progreso final a partir del valor devuelto por execute_workflow o download_model"""
+    ok = result.get("status") == "success"
+    record = {
+        "state": "completed" if ok else ("cancelled" if result.get("status") == "cancelled" else "failed"),
+        "percent": 100 if ok else 0,
+        "message": result.get("message", "Completado" if ok else "Error"),
+        "result": result
+    }
+    if result.get("outputs") is not None:
+        record.update(
+            generated_images=list(result["outputs"]),
+            outputs=result["outputs"],
+            start_type=result.get("start_type"),
+            startup_seconds=result.get("startup_seconds"),
+            execution_seconds=result.get("execution_seconds")
+        )
+    return record
+
+
+def failure_progress(message, details=None):
+    return {
+        "state": "failed",
+        "percent": 0,
+        "message": message,
+        "result": {"status": "error", "message": message, "details": details}
+    }
+
+
+async def poll_call(task_id):
+    """Resultado de la llamada de task_id si ya terminó (progreso final), o None"""
+    call = tracked_calls.get(task_id)
+    if call is None:
+        return None
     try:
-        result = get_progress_fn.remote(task_id=task_id)
+        result = await call.get.aio(timeout=0)
+    except modal.exception.FunctionTimeoutError as e:
+        outcome = failure_progress(f"Timeout del contenedor en Modal: {e}")
+    except modal.exception.OutputExpiredError:
+        # El resultado ya no está en Modal: manda el progreso del Dict
+        tracked_calls.pop(task_id, None)
+        return None
+    except CALL_PENDING_ERRORS:
+        return None
+    except CALL_TRANSIENT_ERRORS as e:
+        print(f"⚠️ [{task_id[:8]}] No se pudo consultar la llamada: {e}")
+        return None
+    except Exception as e:
+        # El contenedor murió o la función lanzó fuera del try del ejecutor
+        outcome = failure_progress(f"La ejecución falló en Modal: {e}", details=repr(e))
+    else:
+        outcome = outcome_progress(result if isinstance(result, dict) else {"status": "success"})
+    
+    tracked_calls.pop(task_id, None)
+    now = time.monotonic()
+    for stale in [t for t, (at, _) in call_outcomes.items() if now - at > CALL_OUTCOME_TTL]:
+        del call_outcomes[stale]
+    outcomes = {task_id: outcome}
+    variant_ids = forget_batch_chunk(task_id)
+    if variant_ids:
+        outcomes.update(variant_outcomes(variant_ids, outcome))
+    for t, final in outcomes.items():
+        call_outcomes[t] = (now, final)
+        if final["state"] == "failed":
+            print(f"❌ [{t[:8]}] {final['message']}")
+        await record_progress(t, final)
+    return outcome
+
+
+# ========== Caché de progreso con single-flight ==========
+# Peticiones concurrentes por la misma tarea (varias pestañas, el hub SSE, la
+# cola) comparten una sola llamada a Modal, y un resultado reciente se reutiliza
+# durante PROGRESS_CACHE_TTL. Varias tareas se leen con una única invocación.
+
+PROGRESS_CACHE_TTL = 0.5
+
+
+def queued_progress(task_id, positions):
+    """Progreso de un trabajo que sigue en la cola del planificador (no existe aún en Modal)"""
+    position = positions.get(task_id)
+    return {
+        "state": "queued",
+        "percent": 0,
+        "message": f"En cola (posición {position})",
+        "filename": "workflow",
+        "queue_position": position
+    }
+
+
+async def fetch_progress(task_ids):
+    """Lee de Modal el progreso de varias tareas en una sola llamada remota"""
+    # Lo que ya terminó según su FunctionCall manda sobre el Dict de progreso
+    progress = {t: call_outcomes[t][1] for t in task_ids if t in call_outcomes}
+    # Una variante de un lote espera en la cola con su grupo
+    queued = [t for t in task_ids if scheduler.is_queued(batch_variant_chunk.get(t, t))]
+    if queued:
+        positions = scheduler.positions()
+        progress.update({t: queued_progress(batch_variant_chunk.get(t, t), positions) for t in queued})
+    task_ids = [t for t in task_ids if t not in progress]
+    if not task_ids:
+        return progress
+    if len(task_ids) == 1 or not await modal_functions.get("get_download_progress_batch"):
+        results = await asyncio.gather(*(modal_functions.call("get_download_progress", task_id=t) for t in task_ids))
+        return {**progress, **dict(zip(task_ids, results))}
+    return {**progress, **(await modal_functions.call("get_download_progress_batch", task_ids=task_ids))["progress"]}
+
+
+class ProgressCache:
+    """Progreso por tarea con TTL corto y deduplicación de llamadas en curso"""
+    
+    def __init__(self, ttl=PROGRESS_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}    # task_id -> (leído en, progreso)
+        self._inflight = {}   # task_id -> Future de la llamada en curso
+        self._fetches = set()   # tareas de lectura en curso (referencia para que no se pierdan)
+    
+    async def get(self, task_id):
+        return (await self.get_many([task_id]))[task_id]
+    
+    async def get_many(self, task_ids):
+        # Todo corre en el bucle de eventos: entre dos await nadie más toca los dicts
+        now = time.monotonic()
+        loop = asyncio.get_running_loop()
+        results, waiting, owned = {}, {}, {}
+        for task_id in dict.fromkeys(task_ids):
+            entry = self._entries.get(task_id)
+            if entry and now - entry[0] < self.ttl:
+                results[task_id] = entry[1]
+            elif task_id in self._inflight:
+                waiting[task_id] = self._inflight[task_id]
+            else:
+                owned[task_id] = self._inflight[task_id] = loop.create_future()
         
-        # Si completado, actualizar historial y cola
-        if result.get('percent') == 100:
-            # Actualizar cola
-            queue = load_queue()
-            for item in queue:
-                if item['task_id'] == task_id:
-                    item['status'] = 'completed'
-                    # Mover a historial
-                    save_history({
-                        "task_id": task_id,
-                        "gpu_type": item.get('gpu_type', 'T4'),
-                        "status": "completed",
-                        "timestamp": item.get('timestamp'),
-                        "completed_at": datetime.now().isoformat(),
-                        "images": result.get('generated_images', [])
-                    })
-                    queue.remove(item)
-                    break
-            save_queue(queue)
+        if owned:
+            # La lectura va en su propia tarea: si Quart cancela a quien la pidió
+            # (una pestaña que se cierra), los que esperan reciben igualmente el resultado
+            fetch = loop.create_task(self._fetch_owned(owned))
+            self._fetches.add(fetch)
+            fetch.add_done_callback(self._fetches.discard)
         
-        return jsonify(result)
+        for task_id, future in {**waiting, **owned}.items():
+            results[task_id] = await asyncio.shield(future)
+        return results
+    
+    async def _fetch_owned(self, owned):
+        try:
+            fetched = await fetch_progress(list(owned))
+            fetched_at = time.monotonic()
+            # Las entradas viejas se purgan al escribir para que el dict no crezca
+            stale = [t for t, (at, _) in self._entries.items() if fetched_at - at > 60]
+            for task_id in stale:
+                del self._entries[task_id]
+            for task_id, future in owned.items():
+                self._entries[task_id] = (fetched_at, fetched[task_id])
+                future.set_result(fetched[task_id])
+        except BaseException as e:
+            error = e if isinstance(e, Exception) else RuntimeError("Lectura de progreso interrumpida")
+            for future in owned.values():
+                if not future.done():
+                    future.set_exception(error)
+                    # Puede que ya nadie la espere: se da por recogida para que asyncio no avise
+                    future.exception()
+            if not isinstance(e, Exception):
+                raise
+            return
+        finally:
+            for task_id in owned:
+                self._inflight.pop(task_id, None)
+        
+        for task_id in owned:
+            try:
+                await record_progress(task_id, fetched[task_id])
+            except Exception as e:
+                print(f"⚠️ No se pudo actualizar el historial de {task_id}: {e}")
+
+
+progress_cache = ProgressCache()
+
+
+@app.route('/progress/<task_id>', methods=['GET'])
+async def get_progress(task_id):
+    if not await modal_functions.get("get_download_progress"):
+        return jsonify({"error": "Modal no está conectado"}), 503
+    
+    try:
+        return jsonify(await progress_cache.get(task_id))
     except Exception as e:
         return jsonify({"percent": 0, "message": "Error", "error": str(e)}), 500
 
 
+@app.route('/progress', methods=['GET'])
+async def get_progress_batch():
+    """Progreso de varias tareas en un solo viaje: /progress?task_ids=a,b,c"""
+    if not await modal_functions.get("get_download_progress"):
+        return jsonify({"error": "Modal no está conectado"}), 503
+    
+    task_ids = [t for t in request.args.get('task_ids', '').split(',') if t]
+    if not task_ids:
+        return jsonify({"error": "Falta task_ids"}), 400
+    
+    try:
+        return jsonify({"progress": await progress_cache.get_many(task_ids)})
+    except Exception as e:
+        return jsonify({"error": str(e), "progress": {}}), 500
+
+
+# ========== Stream de progreso (Server-Sent Events) ==========
+# Una única tarea asyncio sondea Modal por las tareas con suscriptores y reparte
+# los cambios a todas las pestañas conectadas: el número de llamadas a Modal no
+# crece con clientes × tareas, y el estado final se envía en cuanto se lee.
+
+PROGRESS_POLL_INTERVAL = 2.0
+# Mientras nada cambia el sondeo se espacia (x2 por vuelta) hasta este máximo
+PROGRESS_POLL_MAX_INTERVAL = 8.0
+# Lecturas "unknown" seguidas antes de dar una tarea por inexistente
+PROGRESS_UNKNOWN_LIMIT = 3
+SSE_KEEPALIVE_SECONDS = 15
+# Resultados finales recordados para suscriptores que llegan tarde
+PROGRESS_FINISHED_KEEP = 200
+
+
+class ProgressHub:
+    """Sondeo compartido de progreso con reparto a suscriptores (colas por stream)"""
+    
+    def __init__(self, interval=PROGRESS_POLL_INTERVAL, max_interval=PROGRESS_POLL_MAX_INTERVAL):
+        self.interval = interval
+        self.max_interval = max_interval
+        self._subscribers = {}   # task_id -> set de colas
+        self._last = {}          # task_id -> último progreso enviado
+        self._finished = {}      # task_id -> progreso final (orden de llegada)
+        self._unknown = {}       # task_id -> lecturas "unknown" seguidas
+        self._task = None
+        self._wake = None
+    
+    def subscribe(self, task_ids):
+        """Registra un stream; recibe al momento el último estado conocido de cada tarea"""
+        subscriber = asyncio.Queue()
+        for task_id in task_ids:
+            known = self._finished.get(task_id) or self._last.get(task_id)
+            if known:
+                subscriber.put_nowait((task_id, known))
+            if task_id not in self._finished:
+                self._subscribers.setdefault(task_id, set()).add(subscriber)
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        else:
+            # Una tarea nueva no espera a que acabe el backoff de las demás
+            self._wake.set()
+        return subscriber
+    
+    def unsubscribe(self, subscriber, task_ids):
+        for task_id in task_ids:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[task_id]
+                self._last.pop(task_id, None)
+                self._unknown.pop(task_id, None)
+    
+    def _publish(self, task_id, result):
+        """Reparte un progreso si cambió; devuelve si hubo algo nuevo"""
+        if progress_state(result) == "unknown":
+            misses = self._unknown[task_id] = self._unknown.get(task_id, 0) + 1
+            if misses < PROGRESS_UNKNOWN_LIMIT:
+                return False
+            # Nadie escribe progreso para esta tarea: se deja de sondear
+            self._unknown.pop(task_id, None)
+            self._last.pop(task_id, None)
+            for subscriber in self._subscribers.pop(task_id, ()):
+                subscriber.put_nowait((task_id, result))
+            return True
+        self._unknown.pop(task_id, None)
+        if self._last.get(task_id) == result:
+            return False
+        self._last[task_id] = result
+        subscribers = list(self._subscribers.get(task_id, ()))
+        if progress_state(result) in TERMINAL_STATES:
+            self._subscribers.pop(task_id, None)
+            self._last.pop(task_id, None)
+            self._finished[task_id] = result
+            while len(self._finished) > PROGRESS_FINISHED_KEEP:
+                self._finished.pop(next(iter(self._finished)))
+        for subscriber in subscribers:
+            subscriber.put_nowait((task_id, result))
+        return True
+    
+    async def _poll(self, task_ids):
+        # Todas las tareas suscritas en una sola llamada a Modal por vuelta
+        try:
+            results = await progress_cache.get_many(task_ids)
+        except Exception as e:
+            print(f"⚠️ Error leyendo progreso: {e}")
+            return False
+        changed = False
+        for task_id, result in results.items():
+            changed = self._publish(task_id, result) or changed
+        return changed
+    
+    async def _run(self):
+        # La tarea termina sola cuando no queda nadie escuchando
+        delay = self.interval
+        while self._subscribers:
+            started = time.monotonic()
+            self._wake.clear()
+            changed = await self._poll(list(self._subscribers))
+            delay = self.interval if changed else min(delay * 2, self.max_interval)
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, delay - (time.monotonic() - started)))
+                delay = self.interval
+            except asyncio.TimeoutError:
+                pass
+
+
+progress_hub = ProgressHub()
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/progress_stream', methods=['GET'])
+async def progress_stream():
+    """
+    Stream SSE del progreso de una o varias tareas: /progress_stream?task_ids=a,b
+    Emite eventos "progress" con {task_id, ...progreso} y "end" cuando todas terminan
+    (una tarea que Modal no conoce tras varias lecturas cuenta como terminada, con state "unknown").
+    """
+    if not await modal_functions.get("get_download_progress"):
+        return jsonify({"error": "Modal no está conectado"}), 503
+    
+    task_ids = [t for t in request.args.get('task_ids', '').split(',') if t]
+    if not task_ids:
+        return jsonify({"error": "Falta task_ids"}), 400
+    
+    async def stream():
+        subscriber = progress_hub.subscribe(task_ids)
+        pending = set(task_ids)
+        try:
+            yield "retry: 2000\n\n"
+            while pending:
+                try:
+                    task_id, result = await asyncio.wait_for(subscriber.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_event("progress", {"task_id": task_id, **result})
+                if progress_state(result) in TERMINAL_STATES or result.get('state') == "unknown":
+                    pending.discard(task_id)
+            yield sse_event("end", {"task_ids": task_ids})
+        finally:
+            progress_hub.unsubscribe(subscriber, task_ids)
+    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    # Sin límite de tiempo: el stream dura lo que dure la tarea
+    response.timeout = None
+    return response
+
+
 @app.route('/list_output_images', methods=['GET'])
-def list_output_images_endpoint():
-    """Lista las imágenes generadas en Modal (sin descargar)"""
-    if not list_output_images_fn:
+async def list_output_images_endpoint():
+    """
+    Lista las imágenes generadas en Modal (sin descargar). Admite task_id (solo
+    ese trabajo), since (epoch: solo lo modificado después), limit y cursor
+    (el next_cursor de la página anterior).
+    """
+    if not await modal_functions.get("list_output_images"):
         return jsonify({"error": "Modal no está conectado", "images": []}), 503
     
     print("📋 Listando imágenes en Modal (sin descargar)...")
     
     try:
-        result = list_output_images_fn.remote()
+        filters = {"task_id": request.args.get('task_id'), "cursor": request.args.get('cursor')}
+        if request.args.get('since'):
+            filters["since"] = float(request.args['since'])
+        if request.args.get('limit'):
+            filters["limit"] = max(1, int(request.args['limit']))
+        result = await modal_functions.call(
+            "list_output_images",
+            **{key: value for key, value in filters.items() if value is not None}
+        )
         images = result.get("images", [])
-        print(f"✓ {len(images)} imágenes encontradas en Modal")
-        for img in images:
-            print(f"  - {img.get('filename', 'unknown')}")
+        more = " (hay más páginas)" if result.get("next_cursor") else ""
+        print(f"✓ {len(images)} imágenes encontradas en Modal{more}")
         return jsonify(result)
     except Exception as e:
         print(f"  ✗ Error: {e}")
         return jsonify({"error": str(e), "images": []}), 500
 
 
-@app.route('/get_image/<filename>', methods=['GET'])
-def get_single_image(filename):
-    """Descarga UNA imagen desde Modal y la guarda temporalmente"""
-    if not get_output_image_fn:
-        return jsonify({"error": "Modal no está conectado"}), 503
+# ========== Transferencia de outputs (volumen -> disco local) ==========
+# Las imágenes se leen directamente del volumen comfyui-outputs, sin arrancar un
+# contenedor, y se escriben por trozos en <nombre>.part, que se renombra al
+# terminar. Si una transferencia se corta, la siguiente continúa desde lo ya
+# escrito pidiendo solo los bytes que faltan (read_output_range). Al final se
+# comprueba el tamaño y, si el ejecutor lo publicó, el SHA-256.
+# Lo ya traído queda en una caché local por contenido (OutputCache): un output
+# que no cambió en el volumen, o cuyo contenido ya está en local con otro
+# nombre, se sirve sin descargar nada.
+
+OUTPUT_VOLUME_NAME = "comfyui-outputs"
+OUTPUT_CHUNK_SIZE = 8 * 1024 * 1024
+
+volume_outputs = modal.Volume.from_name(OUTPUT_VOLUME_NAME)
+
+OUTPUT_CACHE_DIR = COMFYUI_OUTPUT_DIR / ".modal_cache"
+output_cache = OutputCache(OUTPUT_CACHE_DIR, job_store)
+# Topes de la caché (objetos ya sin output en local se borran siempre)
+OUTPUT_CACHE_MAX_BYTES = int(float(os.environ.get("MODAL_OUTPUT_CACHE_MAX_GB", "20")) * 1024**3)
+OUTPUT_CACHE_MAX_DAYS = float(os.environ.get("MODAL_OUTPUT_CACHE_MAX_DAYS", "30"))
+OUTPUT_CACHE_EVICT_INTERVAL = 3600
+
+
+async def evict_output_cache():
+    """Limpia la caché de outputs al arrancar y luego cada OUTPUT_CACHE_EVICT_INTERVAL"""
+    while True:
+        try:
+            stats = await asyncio.to_thread(
+                output_cache.evict,
+                max_bytes=OUTPUT_CACHE_MAX_BYTES,
+                max_age_seconds=OUTPUT_CACHE_MAX_DAYS * 86400
+            )
+            if stats["removed"]:
+                print(f"🧹 Caché de outputs: {stats['removed']} objetos borrados "
+                      f"({stats['freed_bytes'] / (1024 * 1024):.1f} MB), quedan {stats['kept']}")
+        except Exception as e:
+            print(f"⚠️ No se pudo limpiar la caché de outputs: {e}")
+        await asyncio.sleep(OUTPUT_CACHE_EVICT_INTERVAL)
+
+
+@app.before_serving
+async def start_output_cache_eviction():
+    app.output_cache_task = asyncio.get_running_loop().create_task(evict_output_cache())
+
+# filename -> {"size", "sha256"} que publica el ejecutor al terminar cada trabajo
+expected_outputs = {}
+_output_locks = {}   # filename -> [lock, coroutines que lo usan o esperan]
+
+
+@contextlib.asynccontextmanager
+async def output_lock(filename):
+    """
+    Una sola escritura a la vez por output (su .part es compartido). La entrada
+    se borra cuando sale el último que lo usaba o esperaba, no antes: así quien
+    llega después no recibe un lock nuevo mientras otro sigue en cola.
+    """
+    entry = _output_locks.setdefault(filename, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            _output_locks.pop(filename, None)
+
+
+def local_output_path(filename):
+    """Ruta local de un output ("<task_id>/<fichero>"); no puede salirse de output/"""
+    path = (COMFYUI_OUTPUT_DIR / filename).resolve()
+    if not path.is_relative_to(COMFYUI_OUTPUT_DIR) or path == COMFYUI_OUTPUT_DIR:
+        raise ValueError(f"Ruta de output no válida: {filename}")
+    return path
+
+
+async def output_identity(filename):
+    """
+    {"size", "mtime", "sha256"} de un output: lo publicado por el ejecutor
+    (sin mtime) o, si no, el listado del volumen (sin sha256).
+    """
+    if filename in expected_outputs:
+        expected = expected_outputs[filename]
+        return {"size": expected["size"], "mtime": None, "sha256": expected.get("sha256")}
+    for entry in await volume_outputs.listdir.aio(filename):
+        if entry.path.lstrip("/") == filename:
+            return {"size": entry.size, "mtime": entry.mtime, "sha256": None}
+    raise FileNotFoundError(f"Imagen no encontrada: {filename}")
+
+
+def _hash_file(path, digest):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(OUTPUT_CHUNK_SIZE), b""):
+            digest.update(block)
+
+
+async def transfer_output(filename, dest, identity=None):
+    """
+    Copia un output del volumen a dest de forma atómica y reanudable, salvo que
+    la caché local ya lo tenga. identity ({"size", "mtime", "sha256"}) evita
+    volver a preguntar al volumen si el llamante ya listó el fichero.
+    Devuelve {"bytes", "downloaded_bytes", "sha256", "resumed_bytes", "mode"}.
+    """
+    async with output_lock(filename):
+        identity = identity or await output_identity(filename)
+        total = identity["size"]
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        cached = await asyncio.to_thread(output_cache.satisfy, filename, dest, **identity)
+        if cached:
+            return {"bytes": total, "downloaded_bytes": 0, "sha256": cached["sha256"], "resumed_bytes": 0, "mode": cached["mode"]}
+        
+        part = dest.with_name(dest.name + ".part")
+        offset = part.stat().st_size if part.exists() else 0
+        if offset > total:
+            part.unlink()
+            offset = 0
+        resumed_bytes = offset
+        mode = "range"
+        
+        digest = hashlib.sha256()
+        if offset:
+            # El prefijo ya escrito entra en el hash sin volver a descargarlo
+            await asyncio.to_thread(_hash_file, part, digest)
+        
+        with open(part, "ab") as f:
+            if offset == 0:
+                mode = "volume"
+                try:
+                    async for data in volume_outputs.read_file.aio(filename):
+                        await asyncio.to_thread(f.write, data)
+                        digest.update(data)
+                        offset += len(data)
+                except Exception as e:
+                    # Lo escrito se conserva: el resto se pide por rangos
+                    print(f"⚠️ Lectura directa del volumen cortada en {offset} bytes ({e}), se reanuda por rangos")
+                    mode = "volume+range"
+            
+            while offset < total:
+                chunk = await modal_functions.call(
+                    "read_output_range",
+                    filename=filename,
+                    offset=offset,
+                    length=OUTPUT_CHUNK_SIZE
+                )
+                if not chunk["data"]:
+                    break
+                await asyncio.to_thread(f.write, chunk["data"])
+                digest.update(chunk["data"])
+                offset += len(chunk["data"])
+        
+        sha256 = digest.hexdigest()
+        expected_sha = identity["sha256"]
+        if offset != total or (expected_sha and sha256 != expected_sha):
+            part.unlink(missing_ok=True)
+            raise IOError(
+                f"Transferencia de {filename} no verificada: {offset}/{total} bytes"
+                + (f", sha256 {sha256[:12]}… ≠ {expected_sha[:12]}…" if expected_sha and sha256 != expected_sha else "")
+            )
+        
+        os.replace(part, dest)
+        await asyncio.to_thread(output_cache.add, filename, dest, total, identity["mtime"], sha256)
+        return {
+            "bytes": total,
+            "downloaded_bytes": total - resumed_bytes,
+            "sha256": sha256,
+            "resumed_bytes": resumed_bytes,
+            "mode": mode
+        }
+
+
+# ========== Resultados en stream (result_mode = "stream") ==========
+# execute_workflow_stream va emitiendo cada output con sus bytes en cuanto su
+# nodo de guardado termina: se escribe en output/ y en la caché local sin leer
+# el volumen, así que /fetch_outputs los sirve después como "cached".
+
+_stream_tasks = {}   # task_id -> tarea que consume el stream
+_stream_call_ids = {}   # task_id -> call_id de su execute_workflow_stream
+
+
+def _write_output(dest, data):
+    part = dest.with_name(dest.name + ".part")
+    part.write_bytes(data)
+    os.replace(part, dest)
+
+
+async def store_streamed_output(event):
+    """Guarda un output recibido en el stream (verificando su SHA-256)"""
+    filename = event["filename"]
+    if hashlib.sha256(event["data"]).hexdigest() != event["sha256"]:
+        raise IOError(f"SHA-256 de {filename} no coincide con el anunciado")
+    dest = local_output_path(filename)
+    # Mismo lock que transfer_output: /fetch_outputs puede estar trayendo este fichero
+    async with output_lock(filename):
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if not await asyncio.to_thread(output_cache.is_current, filename, dest, event["size"], None, event["sha256"]):
+            await asyncio.to_thread(_write_output, dest, event["data"])
+            await asyncio.to_thread(output_cache.add, filename, dest, event["size"], None, event["sha256"])
+
+
+async def run_streamed_execution(gpu_type, workflow_api, task_id):
+    """Consume execute_workflow_stream hasta el resultado final"""
+    received = 0
+    try:
+        async for event in modal_functions.stream(
+            executor_method(gpu_type, stream=True),
+            workflow_api=workflow_api,
+            task_id=task_id
+        ):
+            if event["type"] == "started":
+                # Para poder cancelar la llamada en Modal (remote_gen no da la FunctionCall)
+                _stream_call_ids[task_id] = event["call_id"]
+                await asyncio.to_thread(job_store.update, task_id, only_active=True, call_id=event["call_id"])
+            elif event["type"] == "output":
+                expected_outputs[event["filename"]] = {"size": event["size"], "sha256": event["sha256"]}
+                if event["data"] is None:
+                    continue
+                try:
+                    await store_streamed_output(event)
+                    received += 1
+                    print(f"📨 [{task_id[:8]}] {event['filename']} recibido en stream ({event['size']} bytes)")
+                except Exception as e:
+                    # Se quedará para /fetch_outputs, que lo leerá del volumen
+                    print(f"⚠️ [{task_id[:8]}] {event['filename']}: {e}")
+            elif event["type"] == "result":
+                await asyncio.to_thread(job_store.update, task_id, streamed_outputs=received)
+                await record_progress(task_id, outcome_progress(event["result"]))
+    except Exception as e:
+        print(f"❌ [{task_id[:8]}] Stream de resultados cortado: {e}")
+        await asyncio.to_thread(job_store.finish, task_id, 'failed', error=str(e))
+        scheduler.release(task_id)
+    finally:
+        _stream_call_ids.pop(task_id, None)
+
+
+def start_streamed_execution(gpu_type, workflow_api, task_id):
+    """Lanza run_streamed_execution en segundo plano (la petición responde al momento)"""
+    task = asyncio.get_running_loop().create_task(run_streamed_execution(gpu_type, workflow_api, task_id))
+    _stream_tasks[task_id] = task
+    task.add_done_callback(lambda _: _stream_tasks.pop(task_id, None))
+    return task
+
+
+# ========== Cancelación ==========
+# Un trabajo en cola se retira sin más. Uno en marcha se cancela primero de
+# forma cooperativa (cancel_requests): el ejecutor interrumpe el prompt de
+# ComfyUI y devuelve "cancelled", y el contenedor sigue caliente. Si no
+# responde en CANCEL_GRACE_SECONDS se cancela la FunctionCall en Modal.
+
+CANCEL_GRACE_SECONDS = 10.0
+cancel_requests = modal.Dict.from_name("comfyui-cancel-requests", create_if_missing=True)
+
+
+def job_elapsed_seconds(task_id, job):
+    running = scheduler.running(task_id)
+    if running:
+        return time.monotonic() - running["started_at"]
+    try:
+        return (datetime.now() - datetime.fromisoformat(job["timestamp"])).total_seconds()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+
+def remaining_gpu_seconds(job, progress, elapsed):
+    """Segundos de GPU que le quedaban: por el avance de los nodos o, si no, por la estimación"""
+    percent = (progress or {}).get('percent') or 0
+    # El ejecutor reparte el 30-90 % entre los nodos del workflow
+    fraction = (percent - 30) / 60 if 30 < percent < 90 else None
+    if fraction and fraction >= 0.05:
+        return elapsed * (1 - fraction) / fraction
+    return max((job.get('estimated_seconds') or DEFAULT_JOB_SECONDS) - elapsed, 0.0)
+
+
+async def stop_execution(task_id):
+    """
+    Para un trabajo en marcha. Devuelve (cómo se paró, resultado final si la
+    llamada terminó por su cuenta): "interrupt" (cooperativo) o "cancel" (Modal).
+    """
+    await cancel_requests.put.aio(task_id, time.time())
+    deadline = time.monotonic() + CANCEL_GRACE_SECONDS
+    while time.monotonic() < deadline:
+        if task_id in tracked_calls:
+            outcome = await poll_call(task_id)
+            if outcome:
+                return "interrupt", outcome
+        else:
+            progress = await progress_cache.get(task_id)
+            if progress_state(progress) in TERMINAL_STATES:
+                return "interrupt", progress
+        await asyncio.sleep(0.5)
+    
+    call = tracked_calls.pop(task_id, None)
+    if call is not None:
+        await call.cancel.aio()
+    stream = _stream_tasks.get(task_id)
+    # Tras reiniciar el Bridge un stream adoptado solo tiene su call_id
+    call_id = _stream_call_ids.pop(task_id, None)
+    if stream is not None or call_id:
+        # Cerrar el stream no para la llamada: hay que cancelarla en Modal
+        if call_id:
+            await modal.FunctionCall.from_id(call_id).cancel.aio()
+        else:
+            print(f"⚠️ [{task_id[:8]}] Ejecutor sin call_id en el stream (¿falta redesplegar?): la GPU seguirá hasta el timeout")
+        if stream is not None:
+            stream.cancel()
+    return "cancel", None
+
+
+async def cancel_batch_variant(task_id, job):
+    """
+    Cancela una variante de un lote sin parar su grupo: el ejecutor la salta o
+    la interrumpe. Si era lo último pendiente de un grupo en cola, el grupo no se lanza.
+    """
+    chunk_id = batch_variant_chunk[task_id]
+    await cancel_requests.put.aio(task_id, time.time())
+    try:
+        progress = await progress_cache.get(task_id)
+    except Exception:
+        progress = {}
+    estimated = job.get("estimated_seconds") or DEFAULT_JOB_SECONDS
+    done = 0.0
+    if progress_state(progress) == "running":
+        done = min(max(((progress.get('percent') or 0) - 30) / 60, 0.0), 1.0)
+    queued = scheduler.is_queued(chunk_id)
+    if queued:
+        others = [t for t in batch_chunks[chunk_id] if t != task_id]
+        
+        def other_jobs():
+            return [job_store.get(t) or {} for t in others]
+        
+        jobs = await asyncio.to_thread(other_jobs)
+        # Mientras se leía el almacén el grupo pudo salir de la cola
+        if scheduler.is_queued(chunk_id) and all(j.get("status") in TERMINAL_STATES for j in jobs):
+            scheduler.release(chunk_id, ran=False)
+            forget_batch_chunk(chunk_id)
+    return ("dequeue" if queued else "interrupt"), {
+        "cancelled_while": "queued" if queued else "running",
+        "gpu_seconds_used": round(estimated * done, 1),
+        "gpu_seconds_saved": round(estimated * (1 - done), 1)
+    }
+
+
+@app.route('/cancel/<task_id>', methods=['POST'])
+async def cancel_task(task_id):
+    """Cancela un trabajo (en cola o en marcha) o una descarga y anota los segundos de GPU ahorrados"""
+    job = await asyncio.to_thread(job_store.get, task_id)
+    if job is None:
+        call = tracked_calls.pop(task_id, None)
+        if call is None:
+            return jsonify({"status": "error", "message": f"Tarea desconocida: {task_id}"}), 404
+        # Descarga de modelo: no hay GPU que ahorrar
+        await call.cancel.aio()
+        print(f"🛑 [{task_id[:8]}] Descarga cancelada")
+        return jsonify({"status": "cancelled", "task_id": task_id, "stopped_by": "cancel"})
+    if job["status"] in TERMINAL_STATES:
+        return jsonify({"status": "already_finished", "task_id": task_id, "state": job["status"]}), 409
     
+    price = scheduler.price_per_hour.get(job.get("gpu_type"), 0.0)
+    if task_id in batch_variant_chunk:
+        stopped_by, fields = await cancel_batch_variant(task_id, job)
+    elif scheduler.is_queued(task_id):
+        scheduler.release(task_id, ran=False)
+        saved = job.get("estimated_seconds") or DEFAULT_JOB_SECONDS
+        fields = {"cancelled_while": "queued", "gpu_seconds_used": 0.0, "gpu_seconds_saved": round(saved, 1)}
+        stopped_by = "dequeue"
+    else:
+        try:
+            progress = await progress_cache.get(task_id)
+        except Exception:
+            progress = None
+        elapsed = job_elapsed_seconds(task_id, job)
+        saved = remaining_gpu_seconds(job, progress, elapsed)
+        try:
+            stopped_by, outcome = await stop_execution(task_id)
+        except Exception as e:
+            print(f"❌ [{task_id[:8]}] No se pudo cancelar: {e}")
+            return jsonify({"status": "error", "message": str(e)}), 500
+        if outcome and outcome["state"] == "completed":
+            return jsonify({"status": "already_finished", "task_id": task_id, "state": "completed"}), 409
+        fields = {
+            "cancelled_while": "running",
+            "gpu_seconds_used": round(elapsed, 1),
+            "gpu_seconds_saved": round(saved, 1),
+            "stopped_by": stopped_by
+        }
+    
+    fields["usd_saved"] = round(price * fields["gpu_seconds_saved"] / 3600, 4)
+    # El ejecutor puede haber dejado ya el estado "cancelled": se completan los campos igualmente
+    if await asyncio.to_thread(job_store.finish, task_id, 'cancelled', error="Cancelado por el usuario", **fields) is None:
+        await asyncio.to_thread(job_store.update, task_id, **fields)
+    scheduler.release(task_id)
+    print(f"🛑 [{task_id[:8]}] Cancelado ({stopped_by}), ~{fields['gpu_seconds_saved']} s de GPU ahorrados (${fields['usd_saved']})")
+    return jsonify({"status": "cancelled", "task_id": task_id, "stopped_by": stopped_by, **fields})
+
+
+@app.route('/get_image/<path:filename>', methods=['GET'])
+async def get_single_image(filename):
+    """Descarga UNA imagen desde el volumen de Modal y la guarda temporalmente"""
     print(f"⬇ Descargando imagen temporal: {filename}")
     
     try:
-        image_data = get_output_image_fn.remote(filename=filename)
-        temp_path = COMFYUI_OUTPUT_DIR / filename
-        
-        with open(temp_path, 'wb') as f:
-            f.write(image_data)
+        temp_path = local_output_path(filename)
+        started = time.monotonic()
+        transfer = await transfer_output(filename, temp_path)
         
-        print(f"✓ Imagen guardada temporalmente: {temp_path}")
+        elapsed = time.monotonic() - started
+        resumed = f", reanudada desde {transfer['resumed_bytes']} bytes" if transfer['resumed_bytes'] else ""
+        print(f"✓ Imagen guardada temporalmente: {temp_path} ({transfer['bytes']} bytes en {elapsed:.2f}s, {transfer['mode']}{resumed})")
         
         return jsonify({
             'status': 'success',
             'filename': filename,
-            'path': str(temp_path)
+            'path': str(temp_path),
+            **transfer
         })
     except Exception as e:
         print(f"❌ Error descargando {filename}: {e}")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/delete_temp/<filename>', methods=['DELETE'])
-def delete_temp_image(filename):
+# Transferencias simultáneas por defecto en /fetch_outputs (el cliente puede pedir otra)
+OUTPUT_FETCH_PARALLELISM = 8
+OUTPUT_FETCH_MAX_PARALLELISM = 32
+
+
+@app.route('/fetch_outputs', methods=['POST'])
+async def fetch_outputs():
+    """
+    Descarga todas las salidas de un trabajo (task_id) o una lista de filenames
+    en paralelo, con un límite de transferencias simultáneas. Devuelve el estado
+    de cada fichero y el total de bytes y el throughput en una sola respuesta.
+    """
+    data = (await request.get_json()) or {}
+    filenames = list(data.get('filenames') or [])
+    task_id = data.get('task_id')
+    if task_id and not filenames:
+        job = await asyncio.to_thread(job_store.get, task_id)
+        if job is None:
+            return jsonify({"status": "error", "message": f"Trabajo desconocido: {task_id}"}), 404
+        filenames = list(job.get('outputs') or job.get('images') or [])
+    if not filenames:
+        return jsonify({"status": "success", "files": [], "ok": 0, "failed": 0, "total_bytes": 0})
+    
+    parallelism = max(1, min(int(data.get('parallelism', OUTPUT_FETCH_PARALLELISM)), OUTPUT_FETCH_MAX_PARALLELISM))
+    limit = asyncio.Semaphore(parallelism)
+    print(f"⬇ Descargando {len(filenames)} salidas ({parallelism} en paralelo)")
+    
+    async def fetch_one(filename):
+        async with limit:
+            started = time.monotonic()
+            try:
+                dest = local_output_path(filename)
+                transfer = await transfer_output(filename, dest)
+                return {
+                    "filename": filename,
+                    "status": "success",
+                    "path": str(dest),
+                    "seconds": round(time.monotonic() - started, 3),
+                    **transfer
+                }
+            except Exception as e:
+                print(f"  ✗ {filename}: {e}")
+                return {"filename": filename, "status": "error", "error": str(e)}
+    
+    started = time.monotonic()
+    files = await asyncio.gather(*(fetch_one(f) for f in filenames))
+    elapsed = time.monotonic() - started
+    
+    total_bytes = sum(f.get('bytes', 0) for f in files if f['status'] == 'success')
+    downloaded_bytes = sum(f.get('downloaded_bytes', 0) for f in files if f['status'] == 'success')
+    from_cache = sum(1 for f in files if f.get('mode') in ("cached", "linked"))
+    ok = sum(1 for f in files if f['status'] == 'success')
+    throughput = downloaded_bytes / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+    print(f"✓ {ok}/{len(files)} salidas ({from_cache} desde caché), "
+          f"{downloaded_bytes / (1024 * 1024):.1f} MB descargados en {elapsed:.2f}s ({throughput:.1f} MB/s)")
+    
+    return jsonify({
+        "status": "success" if ok == len(files) else ("partial" if ok else "error"),
+        "files": files,
+        "ok": ok,
+        "failed": len(files) - ok,
+        "total_bytes": total_bytes,
+        "downloaded_bytes": downloaded_bytes,
+        "from_cache": from_cache,
+        "seconds": round(elapsed, 3),
+        "throughput_mbps": round(throughput, 2),
+        "parallelism": parallelism
+    })
+
+
+@app.route('/delete_temp/<path:filename>', methods=['DELETE'])
+async def delete_temp_image(filename):
     """Borra una imagen temporal después de procesarla"""
     try:
-        temp_path = COMFYUI_OUTPUT_DIR / filename
+        temp_path = local_output_path(filename)
         if temp_path.exists():
             temp_path.unlink()
+            await asyncio.to_thread(output_cache.forget, filename)
             print(f"🗑 Imagen temporal borrada: {filename}")
             return jsonify({'status': 'success', 'message': f'Borrada: {filename}'})
         else:
@@ -303,36 +1910,75 @@ def delete_temp_image(filename):
         return jsonify({'error': str(e)}), 500
 
 
+# Extensiones que cuentan como imagen al sincronizar (las mismas que list_output_images)
+OUTPUT_IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+async def list_changed_outputs(task_id=None):
+    """
+    Imágenes del volumen candidatas a sincronizar, leídas con listdir (sin
+    contenedor). Sin task_id solo se listan las carpetas de trabajo nuevas o
+    cuyo mtime cambió desde la última sincronización completa.
+    Devuelve (entradas, {carpeta: mtime} listadas, carpetas saltadas).
+    """
+    if task_id:
+        top = [entry for entry in await volume_outputs.listdir.aio("/") if entry.path.strip("/") == task_id]
+    else:
+        top = await volume_outputs.listdir.aio("/")
+    known = await asyncio.to_thread(job_store.synced_dirs)
+    
+    files = [entry for entry in top if entry.type != modal.volume.FileEntryType.DIRECTORY]
+    dirs = {
+        entry.path.strip("/"): entry.mtime
+        for entry in top
+        if entry.type == modal.volume.FileEntryType.DIRECTORY and not entry.path.strip("/").startswith(".")
+    }
+    # Con task_id la carpeta se revisa siempre (por si se borró algo en local)
+    changed = {path: mtime for path, mtime in dirs.items() if task_id or known.get(path) != mtime}
+    for listing in await asyncio.gather(*(volume_outputs.listdir.aio(path) for path in changed)):
+        files.extend(listing)
+    
+    entries = [entry for entry in files if entry.path.lower().endswith(OUTPUT_IMAGE_SUFFIXES)]
+    return entries, changed, len(dirs) - len(changed)
+
+
+def write_outputs_meta(filenames):
+    try:
+        MODAL_META_FILE.write_text(
+            json.dumps(
+                {
+                    "files": filenames,
+                    "local_dir": str(COMFYUI_OUTPUT_DIR)
+                },
+                ensure_ascii=False,
+                indent=2
+            ),
+            "utf-8"
+        )
+        print(f"✓ Metadatos actualizados en {MODAL_META_FILE}")
+    except Exception as e:
+        print(f"⚠️ No se pudieron escribir metadatos: {e}")
+
+
 @app.route('/download_images', methods=['GET'])
-def download_all_images():
-    """SOLO lista imágenes, NO las descarga. El mini-workflow las descargará individualmente."""
-    if not list_output_images_fn:
+async def download_all_images():
+    """SOLO lista imágenes, NO las descarga. El mini-workflow las descargará individualmente (o /sync_outputs)."""
+    if not await modal_functions.get("list_output_images"):
         return jsonify({"error": "Modal no está conectado"}), 503
     
     print("📋 Obteniendo lista de imágenes desde Modal...")
     
     try:
-        result = list_output_images_fn.remote()
-        images = result.get("images", [])
-        filenames = [img['filename'] for img in images]
+        filenames, cursor = [], None
+        while True:
+            page = await modal_functions.call("list_output_images", **({"cursor": cursor} if cursor else {}))
+            filenames.extend(img['filename'] for img in page.get("images", []))
+            cursor = page.get("next_cursor")
+            if not cursor:
+                break
         
         print(f"✓ {len(filenames)} imágenes disponibles para procesar")
-        
-        try:
-            MODAL_META_FILE.write_text(
-                json.dumps(
-                    {
-                        "files": filenames,
-                        "local_dir": str(COMFYUI_OUTPUT_DIR)
-                    },
-                    ensure_ascii=False,
-                    indent=2
-                ),
-                "utf-8"
-            )
-            print(f"✓ Metadatos actualizados en {MODAL_META_FILE}")
-        except Exception as e:
-            print(f"⚠️ No se pudieron escribir metadatos: {e}")
+        write_outputs_meta(filenames)
         
         return jsonify({
             "status": "success",
@@ -345,15 +1991,95 @@ def download_all_images():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/sync_outputs', methods=['GET', 'POST'])
+async def sync_outputs():
+    """
+    Sincroniza los outputs del volumen con la carpeta local de forma incremental.
+    Solo se listan las carpetas de trabajo que cambiaron (o la de task_id), se
+    comparan con el manifiesto por tamaño y mtime y se transfiere únicamente lo
+    nuevo o cambiado; lo que ya está en la caché por contenido se enlaza.
+    """
+    parallelism = max(1, min(int(request.args.get('parallelism', OUTPUT_FETCH_PARALLELISM)), OUTPUT_FETCH_MAX_PARALLELISM))
+    task_id = request.args.get('task_id')
+    print(f"📋 Sincronizando imágenes desde el volumen de Modal{f' (trabajo {task_id})' if task_id else ''}...")
+    
+    try:
+        started = time.monotonic()
+        entries, listed_dirs, skipped_dirs = await list_changed_outputs(task_id)
+        
+        def pending_entries():
+            pending = []
+            for entry in entries:
+                filename = entry.path.lstrip("/")
+                if not output_cache.is_current(filename, local_output_path(filename), entry.size, entry.mtime):
+                    pending.append(entry)
+            return pending
+        
+        pending = await asyncio.to_thread(pending_entries)
+        limit = asyncio.Semaphore(parallelism)
+        
+        async def sync_one(entry):
+            filename = entry.path.lstrip("/")
+            async with limit:
+                try:
+                    transfer = await transfer_output(
+                        filename,
+                        local_output_path(filename),
+                        identity={"size": entry.size, "mtime": entry.mtime, "sha256": None}
+                    )
+                    return {"filename": filename, **transfer}
+                except Exception as e:
+                    print(f"  ✗ {filename}: {e}")
+                    return {"filename": filename, "error": str(e)}
+        
+        results = await asyncio.gather(*(sync_one(entry) for entry in pending))
+        synced = [r for r in results if "error" not in r]
+        failed_dirs = {r["filename"].split("/", 1)[0] for r in results if "error" in r}
+        # Una carpeta solo se da por sincronizada si no falló ninguno de sus ficheros
+        for path, mtime in listed_dirs.items():
+            if path not in failed_dirs:
+                await asyncio.to_thread(job_store.record_synced_dir, path, mtime)
+        
+        downloaded_bytes = sum(r["downloaded_bytes"] for r in synced)
+        linked = sum(1 for r in synced if r["mode"] == "linked")
+        filenames = [r["filename"] for r in synced]
+        elapsed = time.monotonic() - started
+        
+        print(f"✓ {len(listed_dirs)} carpetas listadas ({skipped_dirs} sin cambios), "
+              f"{len(entries) - len(pending)} imágenes al día, {len(synced)} sincronizadas ({linked} desde caché), "
+              f"{downloaded_bytes / (1024 * 1024):.1f} MB en {elapsed:.2f}s")
+        
+        write_outputs_meta(filenames)
+        
+        failed = len(pending) - len(synced)
+        return jsonify({
+            "status": "success" if not failed else "partial",
+            "message": f"{len(synced)} imágenes nuevas sincronizadas ({failed} con error)",
+            "downloaded": filenames,
+            "local_dir": str(COMFYUI_OUTPUT_DIR),
+            "listed_dirs": len(listed_dirs),
+            "unchanged_dirs": skipped_dirs,
+            "unchanged": len(entries) - len(pending),
+            "synced": len(synced),
+            "linked": linked,
+            "failed": failed,
+            "downloaded_bytes": downloaded_bytes,
+            "seconds": round(elapsed, 3)
+        })
+    except Exception as e:
+        print(f"  ✗ Error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @app.route('/list_models', methods=['GET'])
-def list_models():
-    if not list_models_fn:
+async def list_models():
+    if not await modal_functions.get("list_all_models"):
         return jsonify({"error": "Modal no está conectado"}), 503
     
     print("📋 Listando modelos en Modal...")
     
     try:
-        result = list_models_fn.remote()
+        result = await modal_functions.call("list_all_models")
         return jsonify(result)
     except Exception as e:
         print(f"  ✗ Error: {e}")
@@ -362,15 +2088,15 @@ def list_models():
 
 # NUEVO: Endpoint para información de cuenta/billing
 @app.route('/modal_account', methods=['GET'])
-def get_modal_account():
+async def get_modal_account():
     """Obtiene información de cuenta y billing desde Modal"""
-    if not get_billing_fn:
+    if not await modal_functions.get("get_billing_info"):
         return jsonify({"error": "Modal no está conectado"}), 503
     
     print("💰 Obteniendo información de cuenta Modal...")
     
     try:
-        billing_info = get_billing_fn.remote()
+        billing_info = await modal_functions.call("get_billing_info")
         
         # Datos simulados si no hay variables de entorno configuradas
         account_data = {
@@ -392,15 +2118,28 @@ def get_modal_account():
 
 # NUEVO: Endpoint para cola actual
 @app.route('/modal_queue', methods=['GET'])
-def get_modal_queue():
-    """Obtiene la cola actual de trabajos"""
+async def get_modal_queue():
+    """Obtiene la cola actual de trabajos, con el progreso de todos en una sola llamada a Modal"""
     print("📋 Obteniendo cola actual...")
     
     try:
-        queue = load_queue()
+        queue = await asyncio.to_thread(job_store.active)
+        positions = scheduler.positions()
+        for item in queue:
+            item['queue_position'] = positions.get(item['task_id'])
+        if queue and modal_functions.available("get_download_progress"):
+            try:
+                progress = await progress_cache.get_many([item['task_id'] for item in queue])
+                for item in queue:
+                    item['progress'] = progress.get(item['task_id'])
+            except Exception as e:
+                print(f"  ⚠️ Sin progreso de la cola: {e}")
         return jsonify({
             "queue": queue,
-            "count": len(queue)
+            "count": len(queue),
+            "queued": sum(1 for item in queue if item.get('status') == 'queued'),
+            "running": sum(1 for item in queue if item.get('status') == 'running'),
+            "scheduler": scheduler.snapshot()
         })
     except Exception as e:
         print(f"  ✗ Error: {e}")
@@ -409,15 +2148,32 @@ def get_modal_queue():
 
 # NUEVO: Endpoint para historial de GPU
 @app.route('/gpu_history', methods=['GET'])
-def get_gpu_history():
-    """Obtiene historial de ejecuciones"""
+async def get_gpu_history():
+    """
+    Obtiene historial de ejecuciones, paginado y filtrable:
+    ?limit=50&offset=0&gpu_type=A10G&status=completed&since=2025-01-01&until=2025-02-01
+    """
     print("📜 Obteniendo historial de GPU...")
     
     try:
-        history = load_history()
+        args = request.args
+        limit = min(int(args.get('limit', HISTORY_PAGE_SIZE)), 1000)
+        offset = int(args.get('offset', 0))
+        history, total = await asyncio.to_thread(
+            job_store.history,
+            gpu_type=args.get('gpu_type'),
+            status=args.get('status'),
+            since=args.get('since'),
+            until=args.get('until'),
+            limit=limit,
+            offset=offset
+        )
         return jsonify({
             "history": history,
-            "count": len(history)
+            "count": len(history),
+            "total": total,
+            "offset": offset,
+            "limit": limit
         })
     except Exception as e:
         print(f"  ✗ Error: {e}")
@@ -425,16 +2181,19 @@ def get_gpu_history():
 
 
 @app.route('/gpu_info', methods=['GET'])
-def get_gpu_info():
+async def get_gpu_info():
     """Obtiene información de GPUs disponibles y billing desde Modal"""
-    if not get_billing_fn or not get_available_gpus_fn:
+    if not await modal_functions.get("get_billing_info") or not await modal_functions.get("get_available_gpus"):
         return jsonify({"error": "Modal no está conectado"}), 503
     
     print("📊 Obteniendo información de GPUs y billing...")
     
     try:
-        billing_info = get_billing_fn.remote()
-        gpus_info = get_available_gpus_fn.remote()
+        # Billing y GPUs son independientes: en paralelo
+        billing_info, gpus_info = await asyncio.gather(
+            modal_functions.call("get_billing_info"),
+            modal_functions.call("get_available_gpus")
+        )
         
         return jsonify({
             "status": "ok",
@@ -447,14 +2206,16 @@ def get_gpu_info():
 
 
 @app.route('/health', methods=['GET'])
-def health():
-    modal_status = "connected" if check_model_fn else "disconnected"
-    available_gpus = list(execute_workflow_fns.keys())
+async def health():
+    registry = modal_functions.health()
+    available_gpus = [gpu for gpu in GPU_EXECUTOR_MAP if registry["functions"][executor_method(gpu)]["state"] == "ok"]
     return jsonify({
         "status": "ok",
         "message": "Modal Bridge está activo",
-        "modal_status": modal_status,
+        "modal_status": registry["status"],
         "available_gpus": available_gpus,
+        "modal_functions": registry["functions"],
+        "registry_startup_seconds": registry["startup_seconds"],
         "local_output_dir": str(COMFYUI_OUTPUT_DIR)
     })
 
@@ -465,6 +2226,8 @@ if __name__ == '__main__':
     print("📍 URL: http://127.0.0.1:5001")
     print("📦 Modal App: comfyui-model-downloader")
     print(f"💾 Output local: {COMFYUI_OUTPUT_DIR}")
-    print(f"🎮 GPUs disponibles: {', '.join(execute_workflow_fns.keys())}")
+    print(f"🎮 GPUs configuradas: {', '.join(GPU_EXECUTOR_MAP)}")
     print("=" * 60)
-    app.run(host='127.0.0.1', port=5001, debug=False)
+    config = Config()
+    config.bind = ["127.0.0.1:5001"]
+    asyncio.run(serve(app, config))
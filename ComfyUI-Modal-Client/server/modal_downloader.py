@@ -1,5 +1,10 @@
+import hashlib
 import modal
 import os
+import subprocess
+import sys
+import threading
+import time
 from pathlib import Path
 import json
 
@@ -11,10 +16,24 @@ volume_outputs = modal.Volume.from_name("comfyui-outputs", create_if_missing=Tru
 MODELS_DIR = "/models"
 OUTPUT_DIR = "/outputs"
 
+# Segundos que el estado final de una tarea sigue legible tras terminar.
+# Se fija al desplegar: PROGRESS_TTL_SECONDS=1800 modal deploy server/modal_downloader.py
+PROGRESS_TTL_SECONDS = int(os.environ.get("PROGRESS_TTL_SECONDS", "900"))
+# Entradas sin estado final más viejas que esto pertenecen a contenedores muertos
+PROGRESS_STALE_SECONDS = 3 * 3600
+# Días que se conservan los outputs de cada trabajo en el volumen (0 = siempre).
+# Se fija igual: OUTPUT_RETENTION_DAYS=60 modal deploy server/modal_downloader.py
+OUTPUT_RETENTION_DAYS = int(os.environ.get("OUTPUT_RETENTION_DAYS", "30"))
+DEPLOY_ENV = {
+    "PROGRESS_TTL_SECONDS": str(PROGRESS_TTL_SECONDS),
+    "OUTPUT_RETENTION_DAYS": str(OUTPUT_RETENTION_DAYS),
+}
+
 # Imagen básica para funciones de descarga
 image_basic = (
     modal.Image.debian_slim()
     .pip_install("huggingface_hub", "requests", "tqdm")
+    .env(DEPLOY_ENV)
 )
 
 # Imagen con ComfyUI completo - VERSIONES MODERNAS
@@ -33,9 +52,461 @@ image_comfyui = (
     .run_commands(
         "cd /root/ComfyUI && pip install -r requirements.txt"
     )
+    .pip_install("requests", "websocket-client")
+    .env(DEPLOY_ENV)
 )
 
 progress_dict = modal.Dict.from_name("download-progress", create_if_missing=True)
+# task_id -> instante de la petición; el Bridge lo escribe en /cancel/<task_id>
+cancel_requests = modal.Dict.from_name("comfyui-cancel-requests", create_if_missing=True)
+
+# ========== Almacén de progreso con caducidad ==========
+# Cada entrada lleva "state": running mientras la tarea avanza y uno de
+# TERMINAL_STATES al acabar. Las entradas terminales guardan el resultado final
+# y caducan a los PROGRESS_TTL_SECONDS, así el contenedor puede devolver en
+# cuanto termina en lugar de dormir para que el bridge alcance a leerlas.
+
+TERMINAL_STATES = ("completed", "failed", "cancelled")
+
+
+def set_progress(task_id: str, state: str, percent: int, message: str, **extra):
+    """Escribe el estado de una tarea; los estados terminales reciben expires_at"""
+    now = time.time()
+    record = {
+        "state": state,
+        "percent": percent,
+        "message": message,
+        "updated_at": now,
+        **extra
+    }
+    if state in TERMINAL_STATES:
+        record["expires_at"] = now + PROGRESS_TTL_SECONDS
+    progress_dict[task_id] = record
+    return record
+
+
+def _is_expired(record, now: float):
+    if not isinstance(record, dict) or "updated_at" not in record:
+        return True
+    if "expires_at" in record:
+        return record["expires_at"] < now
+    return now - record["updated_at"] > PROGRESS_STALE_SECONDS
+
+
+def read_progress(task_id: str):
+    """Lee el estado de una tarea, descartando las entradas caducadas"""
+    record = progress_dict.get(task_id)
+    if record is not None and _is_expired(record, time.time()):
+        progress_dict.pop(task_id, None)
+        return None
+    return record
+
+
+# ========== Descarga paralela y reanudable ==========
+# El fichero se baja a MODELS_DIR/.incoming/<subfolder>/<filename>.part con
+# varias conexiones por rangos de bytes. Un .part.json junto al .part guarda
+# qué trozos están completos, así una descarga interrumpida sigue donde quedó.
+# Estas funciones solo usan requests y se pueden ejecutar fuera de Modal.
+
+INCOMING_DIR = Path(MODELS_DIR) / ".incoming"
+DOWNLOAD_CONNECTIONS = 8
+DOWNLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+DOWNLOAD_CHUNK_RETRIES = 3
+# Segundos entre actualizaciones de progreso y entre commits del volumen
+DOWNLOAD_PROGRESS_INTERVAL = 2.0
+DOWNLOAD_CHECKPOINT_INTERVAL = 60.0
+
+
+def _format_eta(seconds):
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def _content_length(response):
+    """Content-Length de una respuesta sin comprimir, o 0 si no se conoce"""
+    length = response.headers.get("Content-Length", "")
+    if response.headers.get("Content-Encoding", "identity") != "identity" or not length.isdigit():
+        return 0
+    return int(length)
+
+
+def _probe_download(url: str, headers: dict):
+    """Devuelve (tamaño total, admite rangos) pidiendo solo el primer byte"""
+    import requests
+    
+    with requests.get(url, headers={**headers, "Range": "bytes=0-0"}, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        if response.status_code == 206:
+            # Sin total en Content-Range el Content-Length es el del rango, no el del fichero
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            return (int(total), True) if total.isdigit() else (0, False)
+        return _content_length(response), False
+
+
+class _DownloadMeter:
+    """Cuenta bytes desde varios hilos y calcula velocidad y ETA"""
+
+    def __init__(self, total: int, initial: int = 0):
+        self.total = total
+        self.downloaded = initial
+        self._session_start = time.time()
+        self._session_initial = initial
+        self._lock = threading.Lock()
+
+    def add(self, count: int):
+        with self._lock:
+            self.downloaded += count
+
+    def snapshot(self):
+        with self._lock:
+            downloaded = self.downloaded
+        elapsed = max(time.time() - self._session_start, 1e-6)
+        speed = (downloaded - self._session_initial) / elapsed
+        eta = (self.total - downloaded) / speed if speed > 0 and self.total else None
+        return downloaded, speed, eta
+
+
+def sha256_file(path: Path, block_size: int = 8 * 1024 * 1024):
+    """SHA-256 de un fichero completo leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _OrderedHasher:
+    """
+    SHA-256 de una descarga por rangos: los trozos terminan en cualquier orden,
+    así que se van hasheando desde el .part según crece el prefijo contiguo.
+    """
+
+    def __init__(self, path: Path, chunks):
+        self.path = path
+        self.chunks = chunks
+        self.next_index = 0
+        self._digest = hashlib.sha256()
+
+    def advance(self, done):
+        if self.next_index not in done:
+            return
+        with open(self.path, "rb") as f:
+            while self.next_index in done:
+                start, end = self.chunks[self.next_index]
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining:
+                    block = f.read(min(remaining, 8 * 1024 * 1024))
+                    if not block:
+                        raise Exception("El .part es más corto de lo esperado")
+                    self._digest.update(block)
+                    remaining -= len(block)
+                self.next_index += 1
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+def _download_single_stream(url: str, part_path: Path, headers: dict, meter: _DownloadMeter, on_tick):
+    """Una sola conexión: para servidores sin Range o sin Content-Length"""
+    import requests
+    
+    digest = hashlib.sha256()
+    written = 0
+    with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        expected = _content_length(response)
+        with open(part_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                if chunk:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    written += len(chunk)
+                    meter.add(len(chunk))
+                    on_tick()
+    if expected and written != expected:
+        raise Exception(f"Descarga incompleta: {written}/{expected} bytes")
+    return digest.hexdigest()
+
+
+def _download_range(url: str, headers: dict, fd: int, start: int, end: int, meter: _DownloadMeter):
+    """Baja [start, end] y lo escribe en su posición del .part con pwrite"""
+    import requests
+    
+    for attempt in range(1, DOWNLOAD_CHUNK_RETRIES + 1):
+        written = 0
+        try:
+            range_headers = {**headers, "Range": f"bytes={start}-{end}"}
+            with requests.get(url, headers=range_headers, stream=True, timeout=60) as response:
+                if response.status_code != 206:
+                    raise Exception(f"El servidor ignoró el rango (HTTP {response.status_code})")
+                offset = start
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    if chunk:
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                        written += len(chunk)
+                        meter.add(len(chunk))
+            if written != end - start + 1:
+                raise Exception(f"Rango incompleto: {written}/{end - start + 1} bytes")
+            return
+        except Exception as e:
+            # El trozo se repite entero: descontar lo que se contó en este intento
+            meter.add(-written)
+            if attempt == DOWNLOAD_CHUNK_RETRIES:
+                raise
+            print(f"  ⚠️ Reintentando bytes {start}-{end} ({attempt}/{DOWNLOAD_CHUNK_RETRIES}): {e}")
+            time.sleep(2 ** attempt)
+
+
+def download_to_part(
+    url: str,
+    part_path: Path,
+    headers: dict = None,
+    connections: int = DOWNLOAD_CONNECTIONS,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    on_progress=None,
+    on_checkpoint=None
+):
+    """
+    Descarga url en part_path, en paralelo por rangos si el servidor lo admite,
+    y devuelve el modo usado, el tamaño y el SHA-256 de lo descargado.
+
+    on_progress(downloaded, total, speed_bps, eta_seconds) se llama como mucho
+    cada DOWNLOAD_PROGRESS_INTERVAL segundos; on_checkpoint() cada
+    DOWNLOAD_CHECKPOINT_INTERVAL para que el llamador persista lo ya bajado.
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    
+    headers = headers or {}
+    part_path = Path(part_path)
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    state_path = part_path.with_name(part_path.name + ".json")
+    
+    total, ranged = _probe_download(url, headers)
+    
+    last_tick = 0.0
+    
+    def tick(meter, force=False):
+        nonlocal last_tick
+        if on_progress and (force or time.time() - last_tick >= DOWNLOAD_PROGRESS_INTERVAL):
+            last_tick = time.time()
+            downloaded, speed, eta = meter.snapshot()
+            on_progress(downloaded, total, speed, eta)
+    
+    if not ranged or total <= 0 or connections <= 1:
+        meter = _DownloadMeter(total)
+        sha256 = _download_single_stream(url, part_path, headers, meter, lambda: tick(meter))
+        tick(meter, force=True)
+        state_path.unlink(missing_ok=True)
+        return {"mode": "single", "total": part_path.stat().st_size, "resumed_bytes": 0, "sha256": sha256}
+    
+    chunks = [(start, min(start + chunk_size, total) - 1) for start in range(0, total, chunk_size)]
+    
+    # Reanudar solo si el .part corresponde a la misma descarga
+    done = set()
+    if state_path.exists() and part_path.exists():
+        try:
+            state = json.loads(state_path.read_text())
+            if state.get("url") == url and state.get("total") == total and state.get("chunk_size") == chunk_size:
+                done = set(state.get("done", []))
+        except ValueError:
+            pass
+    resumed_bytes = sum(chunks[i][1] - chunks[i][0] + 1 for i in done)
+    if resumed_bytes:
+        print(f"  ↻ Reanudando: {resumed_bytes / (1024**3):.2f} GB ya en el volumen")
+    
+    def save_state():
+        state_path.write_text(json.dumps({
+            "url": url,
+            "total": total,
+            "chunk_size": chunk_size,
+            "done": sorted(done)
+        }))
+    
+    # Reservar el tamaño final de una vez: cada hilo escribe en su propio rango
+    with open(part_path, "r+b" if part_path.exists() else "wb") as f:
+        f.truncate(total)
+    save_state()
+    
+    meter = _DownloadMeter(total, initial=resumed_bytes)
+    hasher = _OrderedHasher(part_path, chunks)
+    fd = os.open(part_path, os.O_WRONLY)
+    last_checkpoint = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            pending = {
+                pool.submit(_download_range, url, headers, fd, start, end, meter): index
+                for index, (start, end) in enumerate(chunks) if index not in done
+            }
+            try:
+                while pending:
+                    finished, _ = wait(pending, timeout=DOWNLOAD_PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        index = pending.pop(future)
+                        future.result()
+                        done.add(index)
+                    if finished:
+                        os.fsync(fd)
+                        save_state()
+                        hasher.advance(done)
+                    tick(meter)
+                    if on_checkpoint and time.time() - last_checkpoint >= DOWNLOAD_CHECKPOINT_INTERVAL:
+                        on_checkpoint()
+                        last_checkpoint = time.time()
+            except BaseException:
+                # Dejar terminar los trozos en vuelo y apuntar los que acabaron bien
+                pool.shutdown(wait=True, cancel_futures=True)
+                for future, index in pending.items():
+                    if not future.cancelled() and future.exception() is None:
+                        done.add(index)
+                raise
+    finally:
+        os.close(fd)
+        # Lo completado hasta aquí queda registrado aunque la descarga falle
+        save_state()
+    
+    hasher.advance(done)
+    tick(meter, force=True)
+    state_path.unlink(missing_ok=True)
+    return {"mode": "ranged", "total": total, "resumed_bytes": resumed_bytes, "sha256": hasher.hexdigest()}
+
+
+# ========== Catálogo de modelos verificados ==========
+# Un modelo solo se publica en /models/<subfolder> después de comprobar su
+# tamaño y SHA-256. Cada modelo publicado tiene una entrada en model_manifest
+# (subfolder, filename, size, sha256, mtime), que hace de índice del volumen:
+# listar o comprobar modelos es una consulta al Dict, sin montar el volumen ni
+# recorrer directorios. download_model lo actualiza entrada a entrada y
+# reconcile_model_index lo reconstruye a partir de lo que hay en disco.
+# Los ficheros que aún no figuran (p. ej. tras actualizar desde una versión sin
+# catálogo) se dan de alta con un stat la primera vez que se consultan.
+
+model_manifest = modal.Dict.from_name("comfyui-model-manifest", create_if_missing=True)
+
+
+def model_key(subfolder: str, filename: str):
+    return f"{subfolder}/{filename}"
+
+
+def _is_sha256(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def _expected_hf_metadata(download_url: str, hf_token: str):
+    """Tamaño y SHA-256 esperados según los metadatos LFS de HuggingFace"""
+    from huggingface_hub import get_hf_file_metadata
+    
+    metadata = get_hf_file_metadata(download_url, token=hf_token)
+    # Para ficheros LFS el etag es el SHA-256 del contenido
+    etag = (metadata.etag or "").strip('"').lower()
+    return {
+        "size": metadata.size,
+        "sha256": etag if _is_sha256(etag) else None
+    }
+
+
+def _verify(size: int, sha256: str, expected: dict):
+    """Devuelve un mensaje de error si el fichero no cuadra con lo esperado"""
+    if expected.get("size") and size != expected["size"]:
+        return f"Tamaño incorrecto: {size} bytes, se esperaban {expected['size']}"
+    if expected.get("sha256") and sha256 != expected["sha256"]:
+        return f"SHA-256 incorrecto: {sha256[:12]}…, se esperaba {expected['sha256'][:12]}…"
+    return None
+
+
+def _record_verified(subfolder: str, filename: str, size: int, sha256: str, source: str):
+    """
+    Alta de un modelo en el catálogo. source indica cómo se validó:
+    "upstream" (hash del origen), "computed" (solo tamaño), "reconciled" o
+    "stat" (encontrado en el volumen, pendiente de hashear).
+    """
+    dest_path = Path(MODELS_DIR) / subfolder / filename
+    entry = {
+        "subfolder": subfolder,
+        "filename": filename,
+        "size": size,
+        "sha256": sha256,
+        "mtime": dest_path.stat().st_mtime,
+        "source": source,
+        "verified_at": time.time()
+    }
+    model_manifest[model_key(subfolder, filename)] = entry
+    return entry
+
+
+def _lookup_model(subfolder: str, filename: str):
+    """
+    Entrada del catálogo de un modelo. Si no la hay pero el fichero está en el
+    volumen se registra con un stat, sin hash: reconcile_model_index lo hashea
+    en su siguiente pasada.
+    """
+    entry = model_manifest.get(model_key(subfolder, filename))
+    if entry:
+        return entry
+    models_path = Path(MODELS_DIR).resolve()
+    path = (models_path / subfolder / filename).resolve()
+    if models_path not in path.parents or any(part.startswith(".") for part in path.relative_to(models_path).parts):
+        return None
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return None
+    if not path.is_file() or not _looks_complete(path, size):
+        return None
+    print(f"  ✓ Indexado por stat: {model_key(subfolder, filename)}")
+    return _record_verified(subfolder, filename, size, None, "stat")
+
+
+def _index_by_stat():
+    """Alta sin hash de todo lo que hay en el volumen (catálogo vacío tras actualizar)"""
+    models_path = Path(MODELS_DIR)
+    indexed = 0
+    for root, dirs, files in os.walk(models_path):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            rel_parts = (Path(root) / name).relative_to(models_path).parts
+            if len(rel_parts) < 2 or name.startswith("."):
+                continue
+            if _lookup_model(rel_parts[0], "/".join(rel_parts[1:])):
+                indexed += 1
+    print(f"📦 Catálogo vacío, {indexed} modelos indexados por stat")
+    return indexed
+
+
+def _source_for(expected: dict):
+    return "upstream" if expected.get("sha256") else "computed"
+
+
+def _looks_complete(path: Path, size: int):
+    """
+    Comprobación barata de truncado para ficheros sin hash de referencia.
+    safetensors declara en su cabecera dónde acaba el último tensor; los
+    .ckpt/.pt/.bin de PyTorch son zip y guardan el directorio al final.
+    """
+    import zipfile
+    
+    suffix = path.suffix.lower()
+    if suffix == ".safetensors":
+        with open(path, "rb") as f:
+            header_len = int.from_bytes(f.read(8), "little")
+            if header_len <= 0 or 8 + header_len > size:
+                return False
+            try:
+                header = json.loads(f.read(header_len))
+                data_end = max(
+                    (info["data_offsets"][1] for name, info in header.items() if name != "__metadata__"),
+                    default=0
+                )
+            except (ValueError, KeyError, TypeError, IndexError):
+                return False
+        return size == 8 + header_len + data_end
+    if suffix in (".ckpt", ".pt", ".pth", ".bin"):
+        return zipfile.is_zipfile(path)
+    return size > 0
+
 
 @app.function(
     image=image_basic,
@@ -44,41 +515,52 @@ progress_dict = modal.Dict.from_name("download-progress", create_if_missing=True
     timeout=7200
 )
 def download_model(url: str, subfolder: str, filename: str, task_id: str = None):
-    """Descarga un modelo desde HuggingFace reportando progreso"""
+    """Descarga un modelo, lo verifica y solo entonces lo publica en el volumen"""
     from huggingface_hub import hf_hub_url
-    import shutil
-    import requests
     
     if not task_id:
         import uuid
         task_id = str(uuid.uuid4())
     
-    def update_progress(percent, message="Descargando"):
-        progress_dict[task_id] = {
-            "percent": percent,
-            "message": message,
-            "filename": filename
-        }
+    def update_progress(percent, message="Descargando", state="running", **extra):
+        set_progress(task_id, state, percent, message, filename=filename, **extra)
+    
+    def finish(result):
+        if result["status"] == "error":
+            update_progress(0, f"Error: {result['message'][:50]}", state="failed", result=result)
+        else:
+            update_progress(100, result["message"], state="completed", result=result)
+        return result
+    
+    def report_download(downloaded, total, speed, eta):
+        percent = 10 + int((downloaded / total) * 85) if total else 10
+        update_progress(
+            min(percent, 95),
+            f"Descargando: {downloaded / (1024**3):.1f}/{total / (1024**3):.1f} GB"
+            f" · {speed / (1024**2):.1f} MB/s · ETA {_format_eta(eta)}",
+            downloaded_bytes=downloaded,
+            total_bytes=total,
+            speed_bps=int(speed),
+            eta_seconds=int(eta) if eta is not None else None
+        )
     
     dest_folder = Path(MODELS_DIR) / subfolder
     dest_folder.mkdir(parents=True, exist_ok=True)
     dest_path = dest_folder / filename
+    part_path = INCOMING_DIR / subfolder / f"{filename}.part"
     
     try:
         update_progress(0, "Iniciando")
         
-        if dest_path.exists():
-            file_size = dest_path.stat().st_size
-            if file_size > 1000:
-                update_progress(100, "Ya existe")
-                return {
-                    "status": "already_exists",
-                    "message": f"El archivo ya existe en Modal ({file_size / (1024**3):.2f} GB)",
-                    "path": str(dest_path),
-                    "task_id": task_id
-                }
-            else:
-                dest_path.unlink()
+        entry = model_manifest.get(model_key(subfolder, filename))
+        if entry and dest_path.exists() and dest_path.stat().st_size == entry["size"]:
+            return finish({
+                "status": "already_exists",
+                "message": f"El archivo ya existe en Modal ({entry['size'] / (1024**3):.2f} GB)",
+                "path": str(dest_path),
+                "sha256": entry["sha256"],
+                "task_id": task_id
+            })
         
         parts = url.replace("https://huggingface.co/", "").split("/")
         if "resolve" in parts:
@@ -91,288 +573,505 @@ def download_model(url: str, subfolder: str, filename: str, task_id: str = None)
             
             hf_token = os.environ.get("HF_TOKEN")
             if not hf_token:
-                update_progress(0, "Error: Token no configurado")
-                return {
+                return finish({
                     "status": "error",
                     "message": "Token de HuggingFace no configurado",
                     "task_id": task_id
-                }
+                })
             
             print(f"📥 Descargando: {repo_id}/{file_path}")
-            update_progress(10, "Descargando desde HuggingFace")
-            
             download_url = hf_hub_url(repo_id=repo_id, filename=file_path, revision=revision)
             headers = {"Authorization": f"Bearer {hf_token}"}
-            response = requests.get(download_url, headers=headers, stream=True)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            print(f"  Tamaño total: {total_size / (1024**3):.2f} GB")
-            
-            downloaded = 0
-            with open(dest_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=1024*1024):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        percent = int((downloaded / total_size) * 85) + 10
-                        if downloaded % (50 * 1024 * 1024) == 0:
-                            update_progress(
-                                percent,
-                                f"Descargando: {downloaded / (1024**3):.1f}/{total_size / (1024**3):.1f} GB"
-                            )
-            
-            update_progress(95, "Guardando en volumen")
+            expected = _expected_hf_metadata(download_url, hf_token)
+            print(f"  Esperado: {expected['size']} bytes, sha256 {expected['sha256'] or 'desconocido'}")
         else:
-            import requests
-            update_progress(10, "Descargando desde URL")
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            with open(dest_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=1024*1024):
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    percent = int((downloaded / total_size) * 85) + 10
-                    if downloaded % (50 * 1024 * 1024) == 0:
-                        update_progress(percent, "Descargando")
+            download_url = url
+            headers = {}
+            # Sin metadatos del origen, el Content-Length es el tamaño esperado
+            total, _ = _probe_download(download_url, headers)
+            expected = {"size": total or None, "sha256": None}
+            print(f"  Esperado: {total or 'tamaño desconocido'} bytes (Content-Length)")
         
-        update_progress(98, "Confirmando guardado")
+        # Un fichero que ya estaba pero no figura en el manifiesto se verifica en vez de rebajarse
+        if dest_path.exists():
+            update_progress(8, "Verificando archivo existente")
+            size = dest_path.stat().st_size
+            sha256 = sha256_file(dest_path)
+            if size > 0 and _verify(size, sha256, expected) is None:
+                _record_verified(subfolder, filename, size, sha256, _source_for(expected))
+                return finish({
+                    "status": "already_exists",
+                    "message": f"El archivo ya existe en Modal ({size / (1024**3):.2f} GB)",
+                    "path": str(dest_path),
+                    "sha256": sha256,
+                    "task_id": task_id
+                })
+            print(f"  ✗ Archivo existente no válido, se descarga de nuevo")
+            dest_path.unlink()
+            model_manifest.pop(model_key(subfolder, filename), None)
+            volume_models.commit()
+        
+        update_progress(10, "Descargando desde HuggingFace" if headers else "Descargando desde URL")
+        try:
+            transfer = download_to_part(
+                download_url,
+                part_path,
+                headers=headers,
+                on_progress=report_download,
+                on_checkpoint=volume_models.commit
+            )
+        except Exception:
+            # Conservar en el volumen lo ya descargado para poder reanudar
+            volume_models.commit()
+            raise
+        print(f"  Modo: {transfer['mode']}, {transfer['total'] / (1024**3):.2f} GB")
         
-        if not dest_path.exists():
-            update_progress(0, "Error: Archivo no guardado")
-            return {
+        update_progress(96, "Verificando integridad")
+        size = part_path.stat().st_size
+        problem = _verify(size, transfer["sha256"], expected)
+        if problem:
+            # Un .part corrupto no sirve para reanudar: se descarta entero
+            part_path.unlink(missing_ok=True)
+            volume_models.commit()
+            return finish({
                 "status": "error",
-                "message": "El archivo no se guardó correctamente",
+                "message": f"Descarga corrupta. {problem}",
+                "path": str(dest_path),
                 "task_id": task_id
-            }
+            })
         
-        volume_models.commit()
-        file_size = dest_path.stat().st_size
-        update_progress(100, "Completado")
+        update_progress(98, "Confirmando guardado")
         
-        import time
-        time.sleep(10)
-        if task_id in progress_dict:
-            del progress_dict[task_id]
+        # El .part solo aparece en models/ cuando está completo y verificado
+        os.replace(part_path, dest_path)
+        volume_models.commit()
+        _record_verified(subfolder, filename, size, transfer["sha256"], _source_for(expected))
         
-        return {
+        return finish({
             "status": "success",
-            "message": f"Descarga completada ({file_size / (1024**3):.2f} GB)",
+            "message": f"Descarga completada ({size / (1024**3):.2f} GB)",
             "path": str(dest_path),
-            "size_gb": f"{file_size / (1024**3):.2f} GB",
+            "size_gb": f"{size / (1024**3):.2f} GB",
+            "sha256": transfer["sha256"],
+            "resumed_bytes": transfer["resumed_bytes"],
             "task_id": task_id
-        }
+        })
         
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
-        update_progress(0, f"Error: {str(e)[:50]}")
         print(f"Error: {error_details}")
-        return {
+        return finish({
             "status": "error",
             "message": str(e),
             "path": str(dest_path),
             "task_id": task_id
-        }
+        })
 
 
-# NUEVO ENFOQUE: Crear múltiples funciones con diferentes GPUs
-@app.function(
-    image=image_comfyui,
-    gpu="T4",
-    volumes={
-        MODELS_DIR: volume_models,
-        OUTPUT_DIR: volume_outputs
-    },
-    timeout=1800,
-    secrets=[modal.Secret.from_name("HF_TOKEN")]
-)
-def execute_workflow_t4(workflow_api: dict, task_id: str = None):
-    """Ejecuta workflow con GPU T4"""
-    return _execute_workflow_internal(workflow_api, task_id, "T4")
+# ========== Ejecutor persistente de ComfyUI ==========
+# ComfyUI arranca una sola vez por contenedor y se reutiliza entre llamadas.
+# Cada GPU es una subclase de ComfyUIExecutor con su propio @app.cls.
 
+COMFYUI_PATH = Path("/root/ComfyUI")
+COMFYUI_URL = "http://127.0.0.1:8188"
 
-@app.function(
-    image=image_comfyui,
-    gpu="A10G",
-    volumes={
-        MODELS_DIR: volume_models,
-        OUTPUT_DIR: volume_outputs
-    },
-    timeout=1800,
-    secrets=[modal.Secret.from_name("HF_TOKEN")]
-)
-def execute_workflow_a10g(workflow_api: dict, task_id: str = None):
-    """Ejecuta workflow con GPU A10G"""
-    return _execute_workflow_internal(workflow_api, task_id, "A10G")
+# Nodos de guardado cuyo filename_prefix se reescribe a "<task_id>/<prefijo>"
+# para que cada trabajo escriba en su propia carpeta del volumen de outputs
 
+def namespace_outputs(workflow_api: dict, task_id: str):
+    """Copia del workflow con los filename_prefix dentro de la carpeta del trabajo"""
+    namespaced = {}
+    for node_id, node in workflow_api.items():
+        prefix = node.get("inputs", {}).get("filename_prefix")
+        if isinstance(prefix, str):
+            # Un prefijo enlazado a otro nodo (lista) se deja tal cual
+            prefix = prefix.replace("\\", "/").lstrip("/")
+            node = {**node, "inputs": {**node["inputs"], "filename_prefix": f"{task_id}/{prefix or 'ComfyUI'}"}}
+        namespaced[node_id] = node
+    return namespaced
 
-@app.function(
-    image=image_comfyui,
-    gpu="A100",
-    volumes={
-        MODELS_DIR: volume_models,
-        OUTPUT_DIR: volume_outputs
-    },
-    timeout=1800,
-    secrets=[modal.Secret.from_name("HF_TOKEN")]
-)
-def execute_workflow_a100(workflow_api: dict, task_id: str = None):
-    """Ejecuta workflow con GPU A100"""
-    return _execute_workflow_internal(workflow_api, task_id, "A100")
 
+def output_key(path):
+    """Nombre de un output relativo a la raíz del volumen ("<task_id>/<fichero>")"""
+    return Path(path).relative_to(OUTPUT_DIR).as_posix()
+
+
+# Segundos que un contenedor caliente espera nuevos trabajos antes de apagarse
+EXECUTOR_SCALEDOWN_WINDOW = 300
+SERVER_START_TIMEOUT = 180
+WORKFLOW_TIMEOUT = 600
+# Timeout de cada llamada al ejecutor (un lote entero de execute_batch cabe aquí)
+EXECUTOR_TIMEOUT = 1800
+# Cada cuánto mira el ejecutor si el Bridge pidió cancelar el trabajo en curso
+CANCEL_POLL_SECONDS = 1.0
+# Outputs hasta este tamaño viajan dentro del stream de execute_workflow_stream;
+# los mayores solo se anuncian y el Bridge los lee del volumen
+INLINE_OUTPUT_MAX_BYTES = 16 * 1024 * 1024
 
-@app.function(
-    image=image_comfyui,
-    gpu="H100",
-    volumes={
-        MODELS_DIR: volume_models,
-        OUTPUT_DIR: volume_outputs
-    },
-    timeout=1800,
-    secrets=[modal.Secret.from_name("HF_TOKEN")]
-)
-def execute_workflow_h100(workflow_api: dict, task_id: str = None):
-    """Ejecuta workflow con GPU H100"""
-    return _execute_workflow_internal(workflow_api, task_id, "H100")
 
+class WorkflowCancelled(Exception):
+    """El Bridge pidió cancelar el trabajo (cancel_requests)"""
 
-# Función interna compartida por todas las funciones de ejecución
-def _execute_workflow_internal(workflow_api: dict, task_id: str, gpu_type: str):
+
+class ComfyUIExecutor:
     """
-    Lógica interna de ejecución de workflow
+    Ejecuta workflows sobre un servidor ComfyUI que vive lo mismo que el contenedor.
+    Los checkpoints cargados y la caché de nodos se quedan en VRAM entre trabajos,
+    así que un trabajo en un contenedor caliente no paga el arranque.
     """
-    import sys
-    import subprocess
-    import uuid
-    import time
-    import requests
-    import json
-    import shutil
-    
-    if not task_id:
-        task_id = str(uuid.uuid4())
-    
-    def update_progress(percent, message="Procesando", generated_images=None):
-        progress_data = {
-            "percent": percent,
-            "message": message,
-            "filename": "workflow"
-        }
-        if generated_images is not None:
-            progress_data["generated_images"] = generated_images
-        progress_dict[task_id] = progress_data
-        print(f"📊 Progreso: {percent}% - {message}")
-    
-    try:
-        update_progress(5, "Iniciando ComfyUI")
-        print(f"🎨 Ejecutando workflow REAL en Modal")
-        print(f"  Task ID: {task_id}")
-        print(f"  GPU: {gpu_type}")
-        print(f"  Nodos: {len(workflow_api)}")
-        
-        comfyui_path = Path("/root/ComfyUI")
-        if not comfyui_path.exists():
-            raise Exception("ComfyUI no encontrado")
-        print(f"✓ ComfyUI encontrado en {comfyui_path}")
+    gpu_type = "T4"
+
+    @modal.enter()
+    def start_comfyui(self):
+        """Prepara los volúmenes y arranca ComfyUI una vez por contenedor"""
+        self.server_process = None
+        self.startup_seconds = 0.0
+        self.jobs_served = 0
         
-        # Manejo de directorios
-        models_link = comfyui_path / "models"
-        import os
-        import shutil as _sh
+        if not COMFYUI_PATH.exists():
+            raise Exception("ComfyUI no encontrado")
+        print(f"✓ ComfyUI encontrado en {COMFYUI_PATH}")
         
-        if models_link.exists() or models_link.is_symlink():
-            if models_link.is_symlink():
-                models_link.unlink()
-            else:
-                _sh.rmtree(models_link)
-        models_link.symlink_to(MODELS_DIR)
-        print(f"✓ Models symlink: {models_link} -> {MODELS_DIR}")
-        
-        print(f"\n📦 Modelos disponibles:")
-        for subfolder in Path(MODELS_DIR).iterdir():
-            if subfolder.is_dir():
-                files = list(subfolder.iterdir())
-                print(f"  {subfolder.name}: {len(files)} archivos")
-                for f in files[:2]:
-                    print(f"    - {f.name}")
-        print()
-        
-        output_link = comfyui_path / "output"
-        output_path = Path(OUTPUT_DIR)
-        output_path.mkdir(parents=True, exist_ok=True)
+        self._link_volumes()
+        self._start_server()
+
+    @modal.exit()
+    def stop_comfyui(self):
+        """Apaga ComfyUI cuando Modal retira el contenedor"""
+        if self.server_process and self.server_process.poll() is None:
+            self.server_process.terminate()
+            try:
+                self.server_process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.server_process.kill()
+
+    def _link_volumes(self):
+        """Enlaza models/ y output/ de ComfyUI a los volúmenes de Modal"""
+        import shutil
         
-        if output_link.exists() or output_link.is_symlink():
-            if output_link.is_symlink():
-                output_link.unlink()
-            else:
-                _sh.rmtree(output_link)
-        output_link.symlink_to(output_path)
-        print(f"✓ Output symlink: {output_link} -> {output_path}")
+        links = (
+            (COMFYUI_PATH / "models", Path(MODELS_DIR)),
+            (COMFYUI_PATH / "output", Path(OUTPUT_DIR)),
+        )
+        for link, target in links:
+            target.mkdir(parents=True, exist_ok=True)
+            if link.is_symlink():
+                link.unlink()
+            elif link.exists():
+                shutil.rmtree(link)
+            link.symlink_to(target)
+            print(f"✓ Symlink: {link} -> {target}")
         
-        update_progress(10, "ComfyUI configurado")
+        print(f"📦 Modelos en el catálogo: {model_manifest.len()}\n")
+
+    def _start_server(self):
+        """Lanza main.py y espera a que /system_stats responda"""
+        import requests
         
         print("\n🚀 Iniciando servidor ComfyUI...\n")
-        server_process = subprocess.Popen(
+        start = time.time()
+        self.server_process = subprocess.Popen(
             [sys.executable, "main.py", "--listen", "127.0.0.1", "--port", "8188", "--disable-auto-launch"],
-            cwd=str(comfyui_path),
+            cwd=str(COMFYUI_PATH),
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             text=True,
             bufsize=1
         )
+        # El log se vacía en un hilo aparte: si nadie lee el pipe, ComfyUI se bloquea
+        threading.Thread(target=self._pump_logs, args=(self.server_process,), daemon=True).start()
         
-        max_wait = 180
-        start = time.time()
-        server_ready = False
-        last_progress = time.time()
-        
-        while time.time() - start < max_wait:
-            if server_process.poll() is not None:
-                print(f"\n❌ ComfyUI se cerró con código: {server_process.poll()}")
-                remaining = server_process.stdout.read()
-                if remaining:
-                    print(remaining)
-                raise Exception(f"ComfyUI se cerró con código {server_process.poll()}")
-            
-            line = server_process.stdout.readline()
-            if line:
-                line = line.strip()
-                if line:
-                    print(f"  {line}")
-            
+        while time.time() - start < SERVER_START_TIMEOUT:
+            if self.server_process.poll() is not None:
+                raise Exception(f"ComfyUI se cerró con código {self.server_process.poll()}")
             try:
-                response = requests.get("http://127.0.0.1:8188/system_stats", timeout=1)
+                response = requests.get(f"{COMFYUI_URL}/system_stats", timeout=1)
                 if response.status_code == 200:
-                    server_ready = True
-                    print("\n✓ Servidor ComfyUI LISTO\n")
-                    break
-            except:
+                    self.startup_seconds = round(time.time() - start, 1)
+                    self.jobs_served = 0
+                    print(f"\n✓ Servidor ComfyUI LISTO ({self.startup_seconds}s)\n")
+                    return
+            except requests.RequestException:
                 pass
-            
-            elapsed = int(time.time() - start)
-            if time.time() - last_progress >= 10:
-                update_progress(10 + int((elapsed / max_wait) * 10), f"Iniciando ({elapsed}s)")
-                last_progress = time.time()
-            
             time.sleep(0.5)
         
-        if not server_ready:
-            server_process.terminate()
-            raise Exception(f"Timeout esperando servidor ({int(time.time() - start)}s)")
+        self.server_process.terminate()
+        raise Exception(f"Timeout esperando servidor ({int(time.time() - start)}s)")
+
+    @staticmethod
+    def _pump_logs(process):
+        for line in process.stdout:
+            line = line.rstrip()
+            if line:
+                print(f"  {line}")
+
+    def _ensure_server(self):
+        """Rearranca ComfyUI si el proceso murió entre dos trabajos"""
+        if self.server_process is None or self.server_process.poll() is not None:
+            print("⚠️ ComfyUI no está corriendo, rearrancando...")
+            self._start_server()
+
+    @modal.method()
+    def execute_workflow(self, workflow_api: dict, task_id: str = None):
+        """Ejecuta un workflow en el ComfyUI residente del contenedor"""
+        return self._execute(workflow_api, task_id)
+
+    @modal.method()
+    def execute_workflow_stream(self, workflow_api: dict, task_id: str = None, inline_max_bytes: int = INLINE_OUTPUT_MAX_BYTES):
+        """
+        Como execute_workflow, pero generador: emite primero {"type": "started"}
+        con el call_id (para poder cancelarlo), luego {"type": "output"} en cuanto
+        cada nodo de guardado termina, con los bytes ("data") si el fichero no
+        pasa de inline_max_bytes, y al final {"type": "result"} con el resultado.
+        """
+        import queue
+        
+        events = queue.Queue()
+        stop = threading.Event()
+        
+        def on_output(path: Path):
+            try:
+                size = path.stat().st_size
+                data = path.read_bytes() if size <= inline_max_bytes else None
+                events.put({
+                    "type": "output",
+                    "filename": output_key(path),
+                    "size": size,
+                    "sha256": hashlib.sha256(data).hexdigest() if data is not None else sha256_file(path),
+                    "data": data
+                })
+            except OSError as e:
+                # Sin evento el Bridge lo leerá del volumen al terminar
+                print(f"⚠️ No se pudo emitir {path.name}: {e}")
+        
+        def run():
+            try:
+                result = self._execute(workflow_api, task_id, on_output, stop=stop)
+            except BaseException as e:
+                result = {"status": "error", "message": str(e), "task_id": task_id}
+            events.put({"type": "result", "result": result})
+        
+        # El workflow corre en otro hilo; el generador reenvía sus eventos según llegan
+        threading.Thread(target=run, daemon=True).start()
+        try:
+            yield {"type": "started", "call_id": modal.current_function_call_id()}
+            while True:
+                event = events.get()
+                yield event
+                if event["type"] == "result":
+                    return
+        except (modal.exception.InputCancellation, GeneratorExit):
+            # La cancelación llega a este hilo, no al del workflow: cortar ComfyUI y avisarle
+            stop.set()
+            self._interrupt()
+            raise
+
+    @modal.method()
+    def execute_batch(self, variants: list, batch_id: str = None):
+        """
+        Ejecuta varias variantes de un lote en este contenedor. variants es una
+        lista de {"task_id", "workflow_api"}. Todos los prompts se encolan de
+        golpe en ComfyUI y se siguen por un solo websocket: ComfyUI los encadena
+        sin esperar al Bridge y con los modelos ya cargados. Cada variante deja
+        su propio progreso, y su resultado, tiempos o error van, en el mismo
+        orden, en "results".
+        """
+        import uuid
+        
+        client_id = batch_id or str(uuid.uuid4())
+        start = time.time()
+        self._ensure_server()
+        ws = self._connect_websocket(client_id)
+        try:
+            # Encolar todo antes de esperar nada; lo rechazado falla solo al llegarle el turno
+            queued = {}
+            for index, variant in enumerate(variants, 1):
+                task_id = variant["task_id"]
+                if cancel_requests.contains(task_id):
+                    continue
+                try:
+                    queued[task_id] = self._queue_prompt(namespace_outputs(variant["workflow_api"], task_id), client_id)
+                    set_progress(task_id, "running", 15, f"En cola en el contenedor ({index}/{len(variants)})", filename="workflow")
+                except Exception as e:
+                    queued[task_id] = e
+            print(f"\n🧪 Lote {batch_id}: {len(queued)}/{len(variants)} prompts en la cola de ComfyUI")
+            
+            results = []
+            for index, variant in enumerate(variants, 1):
+                task_id = variant["task_id"]
+                print(f"\n🧪 Lote {batch_id}: variante {index}/{len(variants)}")
+                prompt = queued.get(task_id)
+                
+                def prequeued(prompt=prompt):
+                    if isinstance(prompt, Exception):
+                        raise prompt
+                    return ws, prompt
+                
+                result = self._execute(variant["workflow_api"], task_id, prequeued=prequeued if prompt else None)
+                if result["status"] == "cancelled" and isinstance(prompt, str):
+                    # ComfyUI suele haberlo empezado al acabar el anterior: quitarlo de la cola no basta
+                    self._stop_prompt(prompt)
+                results.append(result)
+        except modal.exception.InputCancellation:
+            # Cancelación dura del lote entero: lo que quede en la cola de ComfyUI sobra
+            self._clear_queue()
+            raise
+        finally:
+            ws.close()
+        
+        completed = sum(1 for result in results if result["status"] == "success")
+        return {
+            "status": "success",
+            "message": f"{completed}/{len(results)} variantes completadas",
+            "batch_id": batch_id,
+            "gpu_type": self.gpu_type,
+            "batch_seconds": round(time.time() - start, 1),
+            "results": results
+        }
+
+    def _execute(self, workflow_api: dict, task_id: str = None, on_output=None, prequeued=None, stop=None):
+        """
+        Cuerpo común de execute_workflow, execute_workflow_stream y
+        execute_batch. prequeued() devuelve (websocket, prompt_id) de un prompt
+        que ya está en la cola de ComfyUI (lotes), o lanza el error al encolarlo.
+        stop (threading.Event) cancela desde otro hilo, como cancel_requests.
+        """
+        import uuid
         
-        update_progress(20, "Servidor iniciado")
+        if not task_id:
+            task_id = str(uuid.uuid4())
+        gpu_type = self.gpu_type
+        output_path = Path(OUTPUT_DIR)
+        
+        def update_progress(percent, message="Procesando", generated_images=None, state="running", **extra):
+            if generated_images is not None:
+                extra["generated_images"] = generated_images
+            set_progress(task_id, state, percent, message, filename="workflow", **extra)
+            print(f"📊 Progreso: {percent}% - {message}")
+        
+        ws = None
+        try:
+            self._ensure_server()
+            
+            # El primer trabajo de cada arranque de ComfyUI es "cold" y paga startup_seconds
+            start_type = "cold" if self.jobs_served == 0 else "warm"
+            startup_seconds = self.startup_seconds if start_type == "cold" else 0.0
+            self.jobs_served += 1
+            
+            print(f"🎨 Ejecutando workflow REAL en Modal")
+            print(f"  Task ID: {task_id}")
+            print(f"  GPU: {gpu_type}")
+            print(f"  Nodos: {len(workflow_api)}")
+            print(f"  Arranque: {start_type} (trabajo #{self.jobs_served} en este contenedor)")
+            
+            update_progress(20, f"Servidor listo ({start_type})", start_type=start_type)
+            
+            def cancelled():
+                return (stop is not None and stop.is_set()) or cancel_requests.contains(task_id)
+            
+            if cancelled():
+                raise WorkflowCancelled("Cancelado antes de empezar")
+            
+            if prequeued is None:
+                # El websocket se abre antes de encolar para no perder ningún evento
+                ws = self._connect_websocket(task_id)
+                listener = ws
+                prompt_id = self._queue_prompt(namespace_outputs(workflow_api, task_id), task_id)
+            else:
+                # ComfyUI ejecuta en orden: los mensajes de este prompt vienen tras los del anterior
+                listener, prompt_id = prequeued()
+            print(f"✓ Prompt ID: {prompt_id}\n")
+            update_progress(30, "Generando", start_type=start_type)
+            
+            start_exec = time.time()
+            self._wait_for_prompt(
+                listener, prompt_id, workflow_api,
+                lambda percent, message, **extra: update_progress(percent, message, start_type=start_type, **extra),
+                on_executed=(lambda node_output: [on_output(p) for p in self._output_paths(node_output)]) if on_output else None,
+                cancelled=cancelled
+            )
+            execution_seconds = round(time.time() - start_exec, 1)
+            print(f"✓ Workflow completado en {execution_seconds}s")
+            
+            image_paths = self._collect_images(prompt_id)
+            volume_outputs.commit()
+            print(f"\n✓ {len(image_paths)} imagen(es) guardadas\n")
+            
+            generated_filenames = [output_key(p) for p in image_paths]
+            # Tamaño y hash de cada salida para que el Bridge verifique la transferencia
+            outputs = {
+                output_key(p): {"size": Path(p).stat().st_size, "sha256": sha256_file(Path(p))}
+                for p in image_paths
+            }
+            result = {
+                "status": "success",
+                "message": f"Generadas {len(image_paths)} imágenes",
+                "images": image_paths,
+                "task_id": task_id,
+                "output_dir": str(output_path / task_id),
+                "gpu_type": gpu_type,
+                "start_type": start_type,
+                "startup_seconds": startup_seconds,
+                "execution_seconds": execution_seconds,
+                "outputs": outputs
+            }
+            # El estado final queda legible PROGRESS_TTL_SECONDS sin retener la GPU
+            update_progress(
+                100, "Completado",
+                generated_images=generated_filenames,
+                outputs=outputs,
+                state="completed",
+                start_type=start_type,
+                startup_seconds=startup_seconds,
+                execution_seconds=execution_seconds,
+                result=result
+            )
+            return result
+            
+        except WorkflowCancelled as e:
+            print(f"\n🛑 {e}")
+            cancel_requests.pop(task_id, None)
+            result = {"status": "cancelled", "message": str(e), "task_id": task_id}
+            update_progress(0, str(e), state="cancelled", result=result)
+            return result
+        except modal.exception.InputCancellation:
+            # Cancelación dura desde el Bridge: el prompt no debe seguir ocupando ComfyUI
+            self._interrupt()
+            raise
+        except Exception as e:
+            import traceback
+            error_details = getattr(e, "details", None) or traceback.format_exc()
+            print(f"\n❌ Error:\n{error_details}")
+            
+            result = {
+                "status": "error",
+                "message": str(e),
+                "task_id": task_id,
+                "details": error_details
+            }
+            update_progress(0, f"Error: {str(e)[:50]}", state="failed", result=result)
+            return result
+        finally:
+            if ws is not None:
+                ws.close()
+
+    def _connect_websocket(self, client_id: str):
+        import websocket
+        
+        ws_url = COMFYUI_URL.replace("http://", "ws://")
+        return websocket.create_connection(f"{ws_url}/ws?clientId={client_id}", timeout=10)
+
+    def _queue_prompt(self, workflow_api: dict, client_id: str):
+        """Encola el workflow en ComfyUI y devuelve su prompt_id"""
+        import requests
         
         print("📤 Enviando workflow...")
         response = requests.post(
-            "http://127.0.0.1:8188/prompt",
-            json={"prompt": workflow_api, "client_id": task_id},
+            f"{COMFYUI_URL}/prompt",
+            json={"prompt": workflow_api, "client_id": client_id},
             timeout=10
         )
-        
         if response.status_code != 200:
             raise Exception(f"Error enviando workflow: {response.text}")
         
@@ -380,90 +1079,197 @@ def _execute_workflow_internal(workflow_api: dict, task_id: str, gpu_type: str):
         prompt_id = result_data.get("prompt_id")
         if not prompt_id:
             raise Exception(f"No se recibió prompt_id: {result_data}")
+        return prompt_id
+
+    def _wait_for_prompt(self, ws, prompt_id: str, workflow_api: dict, report, on_executed=None, cancelled=None):
+        """
+        Sigue la ejecución por el websocket de ComfyUI hasta que el prompt termina.
+        Los errores de ejecución se lanzan en cuanto llegan, sin esperar al timeout.
+        on_executed recibe la salida (ui) de cada nodo en cuanto termina; si
+        cancelled() devuelve True se interrumpe el prompt y se lanza WorkflowCancelled.
+        """
+        import websocket
         
-        print(f"✓ Prompt ID: {prompt_id}\n")
-        update_progress(30, "Generando")
+        node_count = max(len(workflow_api), 1)
+        done_nodes = set()
+        current_node = None
+        step, steps = 0, 0
+        last_report = 0.0
+        deadline = time.time() + WORKFLOW_TIMEOUT
+        next_cancel_check = time.time() + CANCEL_POLL_SECONDS
         
-        max_exec = 600
-        start_exec = time.time()
+        def emit(force=False):
+            nonlocal last_report
+            # Los pasos del sampler llegan muy seguidos: no escribir el Dict más de 2 veces por segundo
+            if not force and time.time() - last_report < 0.5:
+                return
+            last_report = time.time()
+            fraction = (len(done_nodes) + (step / steps if steps else 0)) / node_count
+            node_type = workflow_api.get(current_node, {}).get("class_type") if current_node else None
+            message = f"Nodo {len(done_nodes) + 1}/{node_count}"
+            if node_type:
+                message += f" ({node_type})"
+            if steps:
+                message += f" · paso {step}/{steps}"
+            report(
+                min(30 + int(fraction * 60), 89), message,
+                node=current_node,
+                node_type=node_type,
+                node_index=len(done_nodes) + 1,
+                node_count=node_count,
+                step=step,
+                steps=steps
+            )
         
-        while time.time() - start_exec < max_exec:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self._interrupt()
+                raise Exception("Timeout ejecutando workflow")
+            if cancelled and time.time() >= next_cancel_check:
+                next_cancel_check = time.time() + CANCEL_POLL_SECONDS
+                if cancelled():
+                    # ComfyUI sigue vivo y libre para el siguiente trabajo del contenedor
+                    self._interrupt()
+                    raise WorkflowCancelled("Cancelado por el usuario")
+            ws.settimeout(min(remaining, CANCEL_POLL_SECONDS) if cancelled else remaining)
             try:
-                hist_resp = requests.get(f"http://127.0.0.1:8188/history/{prompt_id}", timeout=5)
-                if hist_resp.status_code == 200:
-                    hist_data = hist_resp.json()
-                    if prompt_id in hist_data:
-                        prompt_info = hist_data[prompt_id]
-                        if prompt_info.get("status", {}).get("completed", False):
-                            print("✓ Workflow completado!")
-                            update_progress(90, "Recogiendo imágenes")
-                            
-                            outputs = prompt_info.get("outputs", {})
-                            image_paths = []
-                            
-                            for node_id, node_output in outputs.items():
-                                if "images" in node_output:
-                                    for img_info in node_output["images"]:
-                                        filename = img_info.get("filename")
-                                        if filename:
-                                            img_path = output_path / filename
-                                            if img_path.exists():
-                                                image_paths.append(str(img_path))
-                                                print(f"  ✓ Imagen: {filename}")
-                            
-                            volume_outputs.commit()
-                            print(f"\n✓ {len(image_paths)} imagen(es) guardadas\n")
-                            
-                            server_process.terminate()
-                            
-                            generated_filenames = [Path(p).name for p in image_paths]
-                            update_progress(100, "Completado", generated_images=generated_filenames)
-                            
-                            print(f"⏱️ Manteniendo progreso disponible por 60 segundos...")
-                            time.sleep(60)
-                            
-                            if task_id in progress_dict:
-                                del progress_dict[task_id]
-                                print(f"🗑️ Progreso limpiado para task_id: {task_id}")
-                            
-                            return {
-                                "status": "success",
-                                "message": f"Generadas {len(image_paths)} imágenes",
-                                "images": image_paths,
-                                "task_id": task_id,
-                                "output_dir": str(output_path),
-                                "gpu_type": gpu_type
-                            }
-            except:
-                pass
+                raw = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            except websocket.WebSocketConnectionClosedException:
+                raise Exception("Se perdió la conexión con ComfyUI durante la ejecución")
             
-            elapsed = int(time.time() - start_exec)
-            if elapsed % 5 == 0:
-                progress = min(30 + int((elapsed / max_exec) * 60), 89)
-                update_progress(progress, f"Generando ({elapsed}s)")
+            # Los mensajes binarios son previews de imagen: no aportan estado
+            if not isinstance(raw, str):
+                continue
+            msg = json.loads(raw)
+            msg_type = msg.get("type")
+            data = msg.get("data", {})
+            if data.get("prompt_id") not in (None, prompt_id):
+                continue
             
-            time.sleep(2)
+            if msg_type == "execution_cached":
+                done_nodes.update(data.get("nodes", []))
+                emit(force=True)
+            elif msg_type == "executing":
+                if current_node is not None:
+                    done_nodes.add(current_node)
+                current_node = data.get("node")
+                step, steps = 0, 0
+                if current_node is None:
+                    return
+                emit(force=True)
+            elif msg_type == "progress":
+                step, steps = data.get("value", 0), data.get("max", 0)
+                current_node = data.get("node") or current_node
+                emit(force=step == steps)
+            elif msg_type == "executed":
+                done_nodes.add(data.get("node"))
+                if on_executed and data.get("output"):
+                    on_executed(data["output"])
+            elif msg_type == "execution_success":
+                return
+            elif msg_type == "execution_error":
+                error = Exception(
+                    f"{data.get('node_type', 'Nodo')} ({data.get('node_id')}): "
+                    f"{data.get('exception_message', '').strip()}"
+                )
+                error.details = "".join(data.get("traceback", [])) or str(error)
+                raise error
+            elif msg_type == "execution_interrupted":
+                raise Exception("Ejecución interrumpida")
+
+    def _collect_images(self, prompt_id: str):
+        """Lee una sola vez /history para obtener las imágenes del prompt terminado"""
+        import requests
         
-        server_process.terminate()
-        raise Exception("Timeout ejecutando workflow")
+        hist_resp = requests.get(f"{COMFYUI_URL}/history/{prompt_id}", timeout=10)
+        hist_resp.raise_for_status()
+        outputs = hist_resp.json().get(prompt_id, {}).get("outputs", {})
         
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        update_progress(0, f"Error: {str(e)[:50]}")
-        print(f"\n❌ Error:\n{error_details}")
+        image_paths = []
+        for node_output in outputs.values():
+            for img_path in self._output_paths(node_output):
+                image_paths.append(str(img_path))
+                print(f"  ✓ Imagen: {img_path.name}")
+        return image_paths
+
+    @staticmethod
+    def _output_paths(node_output: dict):
+        """Rutas en el volumen de las imágenes guardadas (type "output") de un nodo"""
+        paths = []
+        for img_info in node_output.get("images", []):
+            filename = img_info.get("filename")
+            if filename and img_info.get("type", "output") == "output":
+                img_path = Path(OUTPUT_DIR) / img_info.get("subfolder", "") / filename
+                if img_path.exists():
+                    paths.append(img_path)
+        return paths
+
+    def _interrupt(self):
+        """Corta el prompt en curso sin tirar el servidor"""
+        import requests
         
         try:
-            server_process.terminate()
-        except:
-            pass
+            requests.post(f"{COMFYUI_URL}/interrupt", timeout=5)
+        except requests.RequestException as e:
+            print(f"⚠️ No se pudo interrumpir ComfyUI: {e}")
+
+    def _stop_prompt(self, prompt_id: str):
+        """Saca un prompt de ComfyUI: lo quita de la cola y, si ya está corriendo, lo corta"""
+        import requests
         
-        return {
-            "status": "error",
-            "message": str(e),
-            "task_id": task_id,
-            "details": error_details
-        }
+        try:
+            # Primero el borrado: si empieza justo después, la consulta lo ve corriendo
+            requests.post(f"{COMFYUI_URL}/queue", json={"delete": [prompt_id]}, timeout=5)
+            queue = requests.get(f"{COMFYUI_URL}/queue", timeout=5).json()
+            if any(item[1] == prompt_id for item in queue.get("queue_running", [])):
+                requests.post(f"{COMFYUI_URL}/interrupt", json={"prompt_id": prompt_id}, timeout=5)
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠️ No se pudo parar {prompt_id} en ComfyUI: {e}")
+
+    def _clear_queue(self):
+        """Vacía la cola pendiente de ComfyUI y corta lo que esté corriendo"""
+        import requests
+        
+        try:
+            requests.post(f"{COMFYUI_URL}/queue", json={"clear": True}, timeout=5)
+        except requests.RequestException as e:
+            print(f"⚠️ No se pudo vaciar la cola de ComfyUI: {e}")
+        self._interrupt()
+
+
+_EXECUTOR_OPTIONS = dict(
+    image=image_comfyui,
+    volumes={
+        MODELS_DIR: volume_models,
+        OUTPUT_DIR: volume_outputs
+    },
+    timeout=EXECUTOR_TIMEOUT,
+    scaledown_window=EXECUTOR_SCALEDOWN_WINDOW,
+    secrets=[modal.Secret.from_name("HF_TOKEN")]
+)
+
+
+@app.cls(gpu="T4", **_EXECUTOR_OPTIONS)
+class ComfyUIExecutorT4(ComfyUIExecutor):
+    gpu_type = "T4"
+
+
+@app.cls(gpu="A10G", **_EXECUTOR_OPTIONS)
+class ComfyUIExecutorA10G(ComfyUIExecutor):
+    gpu_type = "A10G"
+
+
+@app.cls(gpu="A100", **_EXECUTOR_OPTIONS)
+class ComfyUIExecutorA100(ComfyUIExecutor):
+    gpu_type = "A100"
+
+
+@app.cls(gpu="H100", **_EXECUTOR_OPTIONS)
+class ComfyUIExecutorH100(ComfyUIExecutor):
+    gpu_type = "H100"
 
 
 @app.function(
@@ -479,50 +1285,168 @@ def get_output_image(filename: str):
         raise FileNotFoundError(f"Imagen no encontrada: {filename}")
 
 
+# Tamaño de trozo para leer outputs por rangos (reanudar transferencias en el Bridge)
+OUTPUT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+@app.function(
+    image=image_basic,
+    volumes={OUTPUT_DIR: volume_outputs}
+)
+def read_output_range(filename: str, offset: int = 0, length: int = OUTPUT_CHUNK_SIZE):
+    """Devuelve los bytes [offset, offset + length) de un output y su tamaño total"""
+    image_path = Path(OUTPUT_DIR) / filename
+    if not image_path.is_file():
+        raise FileNotFoundError(f"Imagen no encontrada: {filename}")
+    with open(image_path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    return {"data": data, "size": image_path.stat().st_size}
+
+
+OUTPUT_IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.webp')
+OUTPUT_LIST_PAGE_SIZE = 500
+
+
+def _scan_outputs(directory: Path, since: float = None):
+    """
+    Imágenes de un directorio del volumen y de todas sus subcarpetas. Con since
+    se filtra por el mtime de cada fichero: el de una carpeta solo cambia al
+    crear o borrar entradas directas, no al escribir en subcarpetas anidadas.
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                yield from _scan_outputs(Path(entry.path), since)
+                continue
+            stat = entry.stat()
+            if entry.name.lower().endswith(OUTPUT_IMAGE_SUFFIXES) and (since is None or stat.st_mtime > since):
+                yield {
+                    "filename": output_key(entry.path),
+                    "size": stat.st_size,
+                    "modified": stat.st_mtime
+                }
+
+
 @app.function(
     image=image_basic,
     volumes={OUTPUT_DIR: volume_outputs}
 )
-def list_output_images():
-    """Lista todas las imágenes en el output"""
+def list_output_images(task_id: str = None, since: float = None, cursor: str = None, limit: int = OUTPUT_LIST_PAGE_SIZE):
+    """
+    Lista imágenes del output por orden de modificación. task_id limita el
+    listado a la carpeta de ese trabajo; since devuelve solo lo modificado
+    después de esa marca (epoch). Para paginar se pasa el next_cursor de la
+    página anterior; next_cursor es None en la última.
+    """
     output_path = Path(OUTPUT_DIR)
-    images = []
-    if output_path.exists():
-        for file in output_path.iterdir():
-            if file.is_file() and file.suffix.lower() in ['.png', '.jpg', '.jpeg', '.webp']:
-                images.append({
-                    "filename": file.name,
-                    "size": file.stat().st_size,
-                    "modified": file.stat().st_mtime
-                })
-    return {"images": images, "count": len(images)}
+    directory = output_path / task_id if task_id else output_path
+    if not directory.is_dir():
+        return {"images": [], "count": 0, "next_cursor": None}
+    
+    images = sorted(_scan_outputs(directory, since), key=lambda img: (img["modified"], img["filename"]))
+    if cursor:
+        # El cursor es "<mtime>|<filename>" del último elemento ya entregado
+        mtime, _, filename = cursor.partition("|")
+        last = (float(mtime), filename)
+        images = [img for img in images if (img["modified"], img["filename"]) > last]
+    page = images[:limit]
+    next_cursor = None
+    if len(images) > limit:
+        next_cursor = f"{page[-1]['modified']!r}|{page[-1]['filename']}"
+    return {"images": page, "count": len(page), "next_cursor": next_cursor}
+
+
+@app.function(
+    image=image_basic,
+    volumes={OUTPUT_DIR: volume_outputs},
+    timeout=3600,
+    schedule=modal.Period(hours=24)
+)
+def prune_outputs(retention_days: int = OUTPUT_RETENTION_DAYS):
+    """
+    Borra del volumen las carpetas de trabajo (y las imágenes sueltas antiguas)
+    sin cambios en los últimos retention_days días. 0 desactiva la limpieza.
+    """
+    import shutil
+    
+    if retention_days <= 0:
+        return {"removed_tasks": 0, "removed_files": 0, "freed_bytes": 0}
+    
+    volume_outputs.reload()
+    cutoff = time.time() - retention_days * 86400
+    removed_tasks, removed_files, freed_bytes = 0, 0, 0
+    with os.scandir(OUTPUT_DIR) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                files = [Path(root) / name for root, _, names in os.walk(entry.path) for name in names]
+                stats = [f.stat() for f in files]
+                if max((st.st_mtime for st in stats), default=entry.stat().st_mtime) < cutoff:
+                    freed_bytes += sum(st.st_size for st in stats)
+                    removed_files += len(files)
+                    shutil.rmtree(entry.path)
+                    removed_tasks += 1
+            elif entry.stat().st_mtime < cutoff:
+                freed_bytes += entry.stat().st_size
+                os.remove(entry.path)
+                removed_files += 1
+    volume_outputs.commit()
+    
+    summary = {"removed_tasks": removed_tasks, "removed_files": removed_files, "freed_bytes": freed_bytes}
+    print(f"🗑️ Outputs de más de {retention_days} días eliminados: {summary}")
+    return summary
 
 
 @app.function()
 def get_download_progress(task_id: str):
     """Obtiene el progreso de una descarga o ejecución"""
-    if task_id in progress_dict:
-        return progress_dict[task_id]
+    record = read_progress(task_id)
+    if record is not None:
+        return record
     else:
-        return {"percent": 0, "message": "No encontrado", "filename": ""}
+        return {"percent": 0, "message": "No encontrado", "filename": "", "state": "unknown"}
 
 
-@app.function(
-    image=image_basic,
-    volumes={MODELS_DIR: volume_models}
-)
-def check_model_exists(subfolder: str, filename: str):
-    """Verifica si un modelo existe en Modal Volume"""
+@app.function()
+def get_download_progress_batch(task_ids: list):
+    """Progreso de varias tareas en una sola invocación (las desconocidas vienen con state "unknown")"""
+    progress = {}
+    for task_id in task_ids:
+        record = read_progress(task_id)
+        progress[task_id] = record if record is not None else {
+            "percent": 0, "message": "No encontrado", "filename": "", "state": "unknown"
+        }
+    return {"progress": progress}
+
+
+@app.function(schedule=modal.Period(minutes=30))
+def cleanup_progress():
+    """Borra del Dict las entradas caducadas o abandonadas por contenedores muertos"""
+    now = time.time()
+    expired = [task_id for task_id, record in progress_dict.items() if _is_expired(record, now)]
+    for task_id in expired:
+        progress_dict.pop(task_id, None)
+    # Peticiones de cancelación de trabajos que ya no estaban corriendo
+    stale_cancels = [task_id for task_id, at in cancel_requests.items() if now - at > PROGRESS_STALE_SECONDS]
+    for task_id in stale_cancels:
+        cancel_requests.pop(task_id, None)
+    print(f"🗑️ {len(expired)} entradas de progreso caducadas eliminadas")
+    return {"removed": len(expired), "removed_cancel_requests": len(stale_cancels)}
+
+
+def _model_status(subfolder: str, filename: str):
     dest_path = Path(MODELS_DIR) / subfolder / filename
-    if dest_path.exists():
-        file_size = dest_path.stat().st_size
-        if file_size > 1000:
-            return {
-                "exists": True,
-                "size": file_size,
-                "size_gb": f"{file_size / (1024**3):.2f} GB",
-                "path": str(dest_path)
-            }
+    entry = _lookup_model(subfolder, filename)
+    if entry:
+        return {
+            "exists": True,
+            "size": entry["size"],
+            "size_gb": f"{entry['size'] / (1024**3):.2f} GB",
+            "sha256": entry["sha256"],
+            "path": str(dest_path)
+        }
     return {
         "exists": False,
         "size": 0,
@@ -531,30 +1455,234 @@ def check_model_exists(subfolder: str, filename: str):
     }
 
 
+@app.function(image=image_basic, volumes={MODELS_DIR: volume_models})
+def check_model_exists(subfolder: str, filename: str):
+    """Verifica si un modelo verificado existe en Modal Volume (consulta al catálogo)"""
+    return _model_status(subfolder, filename)
+
+
+@app.function(image=image_basic, volumes={MODELS_DIR: volume_models})
+def check_models_exist(models: list):
+    """
+    Versión por lotes de check_model_exists: recibe una lista de
+    {"subfolder", "filename"} y responde todos en una sola invocación.
+    """
+    results = []
+    for model in models:
+        subfolder, filename = model["subfolder"], model["filename"]
+        results.append({"subfolder": subfolder, "filename": filename, **_model_status(subfolder, filename)})
+    return {"results": results}
+
+
+# ========== Pre-flight de workflows ==========
+# Antes de arrancar una GPU se comprueba que todos los modelos que nombra el
+# workflow están en el catálogo. Si falta alguno el trabajo se rechaza (o se
+# descargan primero) sin pagar el arranque de ComfyUI ni un prompt fallido.
+
+# Entrada del nodo -> carpetas de /models donde ComfyUI busca ese modelo
+MODEL_INPUT_FOLDERS = {
+    "ckpt_name": ("checkpoints",),
+    "lora_name": ("loras",),
+    "vae_name": ("vae",),
+    "unet_name": ("diffusion_models", "unet"),
+    "clip_name": ("text_encoders", "clip"),
+    "clip_name1": ("text_encoders", "clip"),
+    "clip_name2": ("text_encoders", "clip"),
+    "clip_name3": ("text_encoders", "clip"),
+    "clip_name4": ("text_encoders", "clip"),
+    "control_net_name": ("controlnet",),
+    "style_model_name": ("style_models",),
+    "gligen_name": ("gligen",),
+    "hypernetwork_name": ("hypernetworks",),
+}
+
+# Entradas cuyo significado depende del tipo de nodo
+MODEL_INPUT_FOLDERS_BY_CLASS = {
+    ("CLIPVisionLoader", "clip_name"): ("clip_vision",),
+    ("UpscaleModelLoader", "model_name"): ("upscale_models",),
+    ("PhotoMakerLoader", "photomaker_model_name"): ("photomaker",),
+}
+
+# Valores de esas entradas que no son ficheros: los VAE integrados de ComfyUI
+# y los "sin modelo" de nodos personalizados (se comparan en minúsculas)
+MODEL_INPUT_SENTINELS = {"none", "baked vae", "pixel_space", "taesd", "taesdxl", "taesd3", "taef1"}
+
+# Cargadores del núcleo de ComfyUI: solo en ellos un modelo que falta rechaza
+# el workflow. En nodos personalizados la misma entrada puede no ser un
+# fichero de /models, así que lo que falte se avisa pero no bloquea.
+CORE_MODEL_LOADERS = {
+    "CheckpointLoader", "CheckpointLoaderSimple", "ImageOnlyCheckpointLoader", "unCLIPCheckpointLoader",
+    "VAELoader", "LoraLoader", "LoraLoaderModelOnly", "UNETLoader",
+    "CLIPLoader", "DualCLIPLoader", "TripleCLIPLoader", "QuadrupleCLIPLoader",
+    "ControlNetLoader", "DiffControlNetLoader", "StyleModelLoader", "GLIGENLoader",
+    "HypernetworkLoader", "CLIPVisionLoader", "UpscaleModelLoader", "PhotoMakerLoader",
+}
+
+
+def find_workflow_models(workflow_api: dict):
+    """Referencias a modelos de un workflow en formato API, una por entrada de nodo"""
+    refs = []
+    for node_id, node in workflow_api.items():
+        class_type = node.get("class_type", "")
+        for input_name, value in node.get("inputs", {}).items():
+            # Las entradas enlazadas a otro nodo son listas, no nombres de fichero
+            if not isinstance(value, str) or not value or value.strip().lower() in MODEL_INPUT_SENTINELS:
+                continue
+            folders = MODEL_INPUT_FOLDERS_BY_CLASS.get((class_type, input_name)) or MODEL_INPUT_FOLDERS.get(input_name)
+            if folders:
+                refs.append({
+                    "node_id": node_id,
+                    "class_type": class_type,
+                    "input": input_name,
+                    "filename": value.replace("\\", "/"),
+                    "folders": list(folders),
+                    "required": class_type in CORE_MODEL_LOADERS
+                })
+    return refs
+
+
+@app.function(image=image_basic, volumes={MODELS_DIR: volume_models})
+def preflight_workflow(workflow_api: dict, model_sources: list = None):
+    """
+    Resuelve contra el catálogo los modelos que usa un workflow.
+    model_sources son los {"name", "directory", "url"} que ComfyUI guarda en el
+    workflow de la interfaz; sirven para ofrecer la descarga de lo que falte.
+    Devuelve los modelos, los que faltan (de cargadores del núcleo), los que
+    no se encuentran en nodos personalizados (unverified) y el total de bytes a cargar.
+    """
+    urls = {}
+    for source in model_sources or []:
+        if source.get("name") and source.get("url"):
+            urls[(source.get("directory"), source["name"])] = source
+            urls.setdefault((None, source["name"]), source)
+    
+    models = {}
+    for ref in find_workflow_models(workflow_api):
+        key = (ref["filename"], tuple(ref["folders"]))
+        if key in models:
+            models[key]["nodes"].append(ref["node_id"])
+            models[key]["required"] = models[key]["required"] or ref["required"]
+            continue
+        
+        model = {
+            "filename": ref["filename"],
+            "input": ref["input"],
+            "class_type": ref["class_type"],
+            "nodes": [ref["node_id"]],
+            "subfolder": ref["folders"][0],
+            "exists": False,
+            "size": 0,
+            "required": ref["required"]
+        }
+        for folder in ref["folders"]:
+            entry = _lookup_model(folder, ref["filename"])
+            if entry:
+                model.update(subfolder=folder, exists=True, size=entry["size"])
+                break
+        else:
+            source = next(
+                (urls[(folder, ref["filename"])] for folder in ref["folders"] if (folder, ref["filename"]) in urls),
+                urls.get((None, ref["filename"]))
+            )
+            if source:
+                model["url"] = source["url"]
+                model["subfolder"] = source.get("directory") or model["subfolder"]
+        models[key] = model
+    
+    models = list(models.values())
+    missing = [m for m in models if not m["exists"] and m["required"]]
+    unverified = [m for m in models if not m["exists"] and not m["required"]]
+    total_bytes = sum(m["size"] for m in models)
+    print(f"🧾 Pre-flight: {len(models)} modelos, {len(missing)} faltan, {len(unverified)} sin verificar, {total_bytes / (1024**3):.2f} GB")
+    return {
+        "models": models,
+        "missing": missing,
+        "unverified": unverified,
+        "total_bytes": total_bytes,
+        "total_gb": f"{total_bytes / (1024**3):.2f} GB"
+    }
+
+
+@app.function(image=image_basic, volumes={MODELS_DIR: volume_models})
+def list_all_models():
+    """Lista todos los modelos en Modal Volume a partir del catálogo"""
+    if not model_manifest.len():
+        _index_by_stat()
+    models = {}
+    for key, entry in model_manifest.items():
+        models.setdefault(entry["subfolder"], []).append({
+            "name": entry["filename"],
+            "size": entry["size"],
+            "size_gb": f"{entry['size'] / (1024**3):.2f} GB",
+            "sha256": entry["sha256"],
+            "modified": entry["mtime"]
+        })
+    if not models:
+        return {"message": "No hay modelos aún", "models": {}}
+    for files in models.values():
+        files.sort(key=lambda f: f["name"])
+    return {"models": models}
+
+
 @app.function(
     image=image_basic,
-    volumes={MODELS_DIR: volume_models}
+    volumes={MODELS_DIR: volume_models},
+    timeout=7200,
+    schedule=modal.Period(hours=24)
 )
-def list_all_models():
-    """Lista todos los modelos en Modal Volume"""
-    models = {}
+def reconcile_model_index():
+    """
+    Reconstruye el catálogo recorriendo el volumen: da de alta ficheros subidos
+    por otras vías, rehashea los que cambiaron y borra entradas huérfanas.
+    """
+    volume_models.reload()
     models_path = Path(MODELS_DIR)
-    if not models_path.exists():
-        return {"message": "No hay modelos aún", "models": {}}
+    indexed = dict(model_manifest.items())
+    seen = set()
+    added, updated, skipped = 0, 0, []
     
-    for subfolder in models_path.iterdir():
-        if subfolder.is_dir():
-            models[subfolder.name] = []
-            for file in subfolder.iterdir():
-                if file.is_file():
-                    file_size = file.stat().st_size
-                    if file_size > 1000:
-                        models[subfolder.name].append({
-                            "name": file.name,
-                            "size": file_size,
-                            "size_gb": f"{file_size / (1024**3):.2f} GB"
-                        })
-    return {"models": models}
+    for root, dirs, files in os.walk(models_path):
+        # .incoming y demás carpetas ocultas no son modelos publicados
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            path = Path(root) / name
+            rel_parts = path.relative_to(models_path).parts
+            if len(rel_parts) < 2 or name.startswith("."):
+                continue
+            subfolder, filename = rel_parts[0], "/".join(rel_parts[1:])
+            key = model_key(subfolder, filename)
+            stat = path.stat()
+            seen.add(key)
+            
+            entry = indexed.get(key)
+            # Las entradas dadas de alta por stat no tienen hash todavía
+            if entry and entry.get("sha256") and entry["size"] == stat.st_size and entry.get("mtime") == stat.st_mtime:
+                continue
+            if not _looks_complete(path, stat.st_size):
+                skipped.append(key)
+                print(f"  ✗ Parece truncado, no se indexa: {key}")
+                continue
+            
+            _record_verified(subfolder, filename, stat.st_size, sha256_file(path), "reconciled")
+            if entry:
+                updated += 1
+            else:
+                added += 1
+            print(f"  ✓ Indexado: {key}")
+    
+    removed = [key for key in indexed if key not in seen]
+    for key in removed:
+        model_manifest.pop(key, None)
+    
+    summary = {
+        "indexed": len(seen) - len(skipped),
+        "added": added,
+        "updated": updated,
+        "removed": len(removed),
+        "skipped": skipped
+    }
+    print(f"📦 Catálogo reconciliado: {summary}")
+    return summary
 
 
 @app.function(image=image_basic)
@@ -589,9 +1717,9 @@ def get_available_gpus():
     """Devuelve lista de GPUs disponibles en Modal"""
     return {
         "gpus": [
-            {"name": "T4", "vram": "16 GB", "cost_per_hour": 0.50},
-            {"name": "A10G", "vram": "24 GB", "cost_per_hour": 1.10},
-            {"name": "A100", "vram": "40 GB", "cost_per_hour": 3.00},
-            {"name": "H100", "vram": "80 GB", "cost_per_hour": 8.00}
+            {"name": "T4", "vram": "16 GB", "vram_gb": 16, "cost_per_hour": 0.50},
+            {"name": "A10G", "vram": "24 GB", "vram_gb": 24, "cost_per_hour": 1.10},
+            {"name": "A100", "vram": "40 GB", "vram_gb": 40, "cost_per_hour": 3.00},
+            {"name": "H100", "vram": "80 GB", "vram_gb": 80, "cost_per_hour": 8.00}
         ]
     }
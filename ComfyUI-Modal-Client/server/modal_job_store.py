@@ -0,0 +1,229 @@
+"""
+Almacén local de trabajos del Bridge (cola + historial) sobre SQLite.
+
+Sustituye a _modal_queue.json y _modal_gpu_history.json: cada trabajo es una
+fila indexada por task_id, así que actualizar un estado no reescribe nada más,
+y el modo WAL permite lectores y escritores concurrentes (el Bridge y los
+benchmarks). Las columnas indexadas (estado, GPU, fechas) sirven para filtrar; el
+resto de campos del trabajo se guarda tal cual en la columna data (JSON). Las
+variantes de un lote se buscan por data.batch_id con un índice de expresión.
+
+La tabla synced_outputs es el manifiesto de outputs ya traídos del volumen
+(tamaño, mtime y sha256), para que una sincronización solo mueva lo nuevo;
+synced_dirs guarda el mtime de cada carpeta de trabajo ya sincronizada entera,
+para no volver a listarla mientras no cambie.
+"""
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+TERMINAL_STATES = ("completed", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    task_id      TEXT PRIMARY KEY,
+    status       TEXT NOT NULL,
+    gpu_type     TEXT,
+    created_at   TEXT,
+    completed_at TEXT,
+    data         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_gpu_created ON jobs (gpu_type, created_at);
+CREATE INDEX IF NOT EXISTS jobs_completed ON jobs (completed_at);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (json_extract(data, '$.batch_id'));
+CREATE TABLE IF NOT EXISTS synced_outputs (
+    filename  TEXT PRIMARY KEY,
+    size      INTEGER NOT NULL,
+    mtime     REAL,
+    sha256    TEXT NOT NULL,
+    synced_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS synced_outputs_sha ON synced_outputs (sha256);
+CREATE TABLE IF NOT EXISTS synced_dirs (
+    path  TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+
+class JobStore:
+    """Cola e historial de trabajos en un fichero SQLite (una conexión por hilo)"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: autocommit; las lecturas-escrituras usan BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_values(job):
+        return (
+            job["task_id"],
+            job.get("status", "running"),
+            job.get("gpu_type"),
+            job.get("timestamp"),
+            job.get("completed_at"),
+            json.dumps(job),
+        )
+
+    @staticmethod
+    def _to_job(row):
+        return json.loads(row["data"]) if row else None
+
+    def add(self, job):
+        """Registra un trabajo nuevo (o lo reemplaza si el task_id ya existe)"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO jobs (task_id, status, gpu_type, created_at, completed_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            self._row_values(job)
+        )
+
+    def get(self, task_id):
+        row = self._connect().execute("SELECT data FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+        return self._to_job(row)
+
+    def update(self, task_id, only_active=False, **fields):
+        """
+        Mezcla fields en el trabajo. Con only_active=True no toca trabajos ya
+        terminados. Devuelve el trabajo actualizado o None si no se modificó.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data, status FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None or (only_active and row["status"] in TERMINAL_STATES):
+                conn.execute("COMMIT")
+                return None
+            job = {**json.loads(row["data"]), **fields}
+            conn.execute(
+                "UPDATE jobs SET task_id = ?, status = ?, gpu_type = ?, created_at = ?, completed_at = ?, data = ? "
+                "WHERE task_id = ?",
+                (*self._row_values(job), task_id)
+            )
+            conn.execute("COMMIT")
+            return job
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def finish(self, task_id, status, **fields):
+        """
+        Pasa un trabajo activo al historial con su estado final. Solo el primer
+        llamante lo consigue; los demás (otras pestañas, el hub) reciben None.
+        """
+        fields.setdefault("completed_at", datetime.now().isoformat())
+        return self.update(task_id, only_active=True, status=status, **fields)
+
+    def active(self):
+        """Trabajos en curso (la "cola"), del más antiguo al más nuevo"""
+        placeholders = ",".join("?" * len(TERMINAL_STATES))
+        rows = self._connect().execute(
+            f"SELECT data FROM jobs WHERE status NOT IN ({placeholders}) ORDER BY created_at",
+            TERMINAL_STATES
+        ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def batch(self, batch_id):
+        """Variantes de un lote (/execute_batch) en su orden"""
+        rows = self._connect().execute(
+            "SELECT data FROM jobs WHERE json_extract(data, '$.batch_id') = ? "
+            "ORDER BY json_extract(data, '$.variant')",
+            (batch_id,)
+        ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def history(self, gpu_type=None, status=None, since=None, until=None, limit=50, offset=0):
+        """
+        Trabajos terminados, del más reciente al más antiguo. since/until son
+        fechas ISO sobre completed_at. Devuelve (página, total que cumple el filtro).
+        """
+        where = [f"status IN ({','.join('?' * len(TERMINAL_STATES))})"]
+        params = list(TERMINAL_STATES)
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if gpu_type:
+            where.append("gpu_type = ?")
+            params.append(gpu_type)
+        if since:
+            where.append("completed_at >= ?")
+            params.append(since)
+        if until:
+            where.append("completed_at < ?")
+            params.append(until)
+        clause = " AND ".join(where)
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM jobs WHERE {clause}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT data FROM jobs WHERE {clause} ORDER BY completed_at DESC LIMIT ? OFFSET ?",
+            [*params, limit, offset]
+        ).fetchall()
+        return [self._to_job(row) for row in rows], total
+
+    def synced(self, filename):
+        """Entrada del manifiesto de sincronización de un output, o None"""
+        row = self._connect().execute(
+            "SELECT filename, size, mtime, sha256 FROM synced_outputs WHERE filename = ?", (filename,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def synced_map(self):
+        """Manifiesto completo: filename -> {size, mtime, sha256}"""
+        rows = self._connect().execute("SELECT filename, size, mtime, sha256 FROM synced_outputs").fetchall()
+        return {row["filename"]: dict(row) for row in rows}
+
+    def record_synced(self, filename, size, mtime, sha256):
+        """Anota que filename está en local con ese tamaño, mtime (del volumen) y hash"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO synced_outputs (filename, size, mtime, sha256, synced_at) VALUES (?, ?, ?, ?, ?)",
+            (filename, size, mtime, sha256, datetime.now().isoformat())
+        )
+
+    def forget_synced(self, filename):
+        """Quita un output del manifiesto (ya no está en local); devuelve su entrada o None"""
+        entry = self.synced(filename)
+        if entry is not None:
+            self._connect().execute("DELETE FROM synced_outputs WHERE filename = ?", (filename,))
+        return entry
+
+    def synced_dirs(self):
+        """Carpetas del volumen ya sincronizadas: path -> mtime que tenían"""
+        rows = self._connect().execute("SELECT path, mtime FROM synced_dirs").fetchall()
+        return {row["path"]: row["mtime"] for row in rows}
+
+    def record_synced_dir(self, path, mtime):
+        self._connect().execute("INSERT OR REPLACE INTO synced_dirs (path, mtime) VALUES (?, ?)", (path, mtime))
+
+    def import_json(self, queue_file, history_file):
+        """Importa una vez la cola/historial de los JSON antiguos y los renombra a .migrated"""
+        imported = 0
+        for path in (Path(queue_file), Path(history_file)):
+            if not path.exists():
+                continue
+            try:
+                jobs = json.loads(path.read_text())
+            except ValueError:
+                jobs = []
+            for job in jobs:
+                if job.get("task_id") and self.get(job["task_id"]) is None:
+                    if job.get("status") == "error":
+                        job["status"] = "failed"
+                    self.add(job)
+                    imported += 1
+            path.rename(path.with_name(path.name + ".migrated"))
+        return imported
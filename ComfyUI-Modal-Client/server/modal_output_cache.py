@@ -0,0 +1,148 @@
+"""
+Caché local de outputs direccionada por contenido.
+
+Cada imagen traída del volumen se enlaza (hard link, o copia si el sistema de
+ficheros no lo permite) en .modal_cache/objects/<sha[:2]>/<sha256>, y el
+manifiesto del JobStore anota su tamaño, mtime y hash. Antes de descargar un
+output se mira si ya está en local con la misma identidad ("cached") o si su
+contenido ya existe en la caché con otro nombre ("linked"); solo si no, hay
+que traerlo de Modal.
+
+Un objeto con un solo enlace ya no lo usa ningún output (se borró de output/),
+y evict lo elimina. evict también aplica un tope de tamaño y de antigüedad,
+empezando por los objetos más viejos. Sin hard links los objetos son copias y
+solo los limitan esos topes.
+"""
+import os
+import shutil
+import time
+from pathlib import Path
+
+
+class OutputCache:
+    """Objetos por sha256 en cache_dir + manifiesto de sincronización en el JobStore"""
+
+    def __init__(self, cache_dir, job_store):
+        self.objects_dir = Path(cache_dir) / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.job_store = job_store
+        # Sin hard links (copias) el número de enlaces no dice si un objeto se usa
+        self._linked = self._supports_links()
+
+    def _supports_links(self):
+        probe = self.objects_dir / ".probe"
+        probe.touch()
+        try:
+            os.link(probe, probe.with_suffix(".link"))
+            probe.with_suffix(".link").unlink()
+            return True
+        except OSError:
+            return False
+        finally:
+            probe.unlink()
+
+    def object_path(self, sha256):
+        return self.objects_dir / sha256[:2] / sha256
+
+    @staticmethod
+    def _link(src, dest):
+        """Hard link atómico de src en dest (copia si no se puede enlazar)"""
+        tmp = dest.with_name(dest.name + ".link")
+        if tmp.exists():
+            tmp.unlink()
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+
+    def is_current(self, filename, dest, size, mtime=None, sha256=None):
+        """True si dest ya es el output del volumen con esa identidad, según el manifiesto"""
+        entry = self.job_store.synced(filename)
+        if entry is None or entry["size"] != size:
+            return False
+        if sha256 is not None and entry["sha256"] != sha256:
+            return False
+        if mtime is not None and entry["mtime"] is not None and entry["mtime"] != mtime:
+            return False
+        try:
+            return dest.stat().st_size == size
+        except FileNotFoundError:
+            return False
+
+    def satisfy(self, filename, dest, size, mtime=None, sha256=None):
+        """
+        Intenta dejar el output en dest sin descargarlo. Devuelve
+        {"mode", "sha256"} con mode "cached" o "linked", o None si hay que traerlo.
+        """
+        if self.is_current(filename, dest, size, mtime, sha256):
+            return {"mode": "cached", "sha256": self.job_store.synced(filename)["sha256"]}
+        if sha256 is None:
+            # Sin hash del ejecutor: vale el del manifiesto si el fichero remoto no cambió
+            entry = self.job_store.synced(filename)
+            if entry is None or entry["size"] != size or mtime is None or entry["mtime"] != mtime:
+                return None
+            sha256 = entry["sha256"]
+        obj = self.object_path(sha256)
+        try:
+            if obj.stat().st_size != size:
+                return None
+        except FileNotFoundError:
+            return None
+        self._link(obj, dest)
+        self.job_store.record_synced(filename, size, mtime, sha256)
+        return {"mode": "linked", "sha256": sha256}
+
+    def add(self, filename, dest, size, mtime, sha256):
+        """Guarda dest (ya verificado) en la caché y lo anota en el manifiesto"""
+        obj = self.object_path(sha256)
+        if not obj.exists():
+            obj.parent.mkdir(exist_ok=True)
+            self._link(dest, obj)
+        elif not os.path.samefile(obj, dest):
+            # Contenido repetido con otro nombre: una sola copia en disco
+            self._link(obj, dest)
+        self.job_store.record_synced(filename, size, mtime, sha256)
+
+    def forget(self, filename):
+        """Un output borrado en local: fuera del manifiesto y, si nadie más lo usa, fuera de la caché"""
+        entry = self.job_store.forget_synced(filename)
+        if entry is None:
+            return
+        obj = self.object_path(entry["sha256"])
+        try:
+            if self._linked and obj.stat().st_nlink == 1:
+                obj.unlink()
+        except FileNotFoundError:
+            pass
+
+    def evict(self, max_bytes=None, max_age_seconds=None):
+        """
+        Borra los objetos sin outputs que los usen y, después, los más viejos
+        hasta cumplir max_bytes y max_age_seconds. Devuelve {removed, freed_bytes, kept, kept_bytes}.
+        """
+        now = time.time()
+        removed, freed = 0, 0
+        kept = []
+        for obj in self.objects_dir.glob("*/*"):
+            try:
+                stat = obj.stat()
+            except FileNotFoundError:
+                continue
+            orphan = stat.st_nlink == 1 and self._linked
+            too_old = max_age_seconds is not None and now - stat.st_mtime > max_age_seconds
+            if orphan or too_old:
+                obj.unlink(missing_ok=True)
+                removed, freed = removed + 1, freed + stat.st_size
+            else:
+                kept.append((stat.st_mtime, stat.st_size, obj))
+        
+        total = sum(size for _, size, _ in kept)
+        if max_bytes is not None and total > max_bytes:
+            kept.sort()
+            while kept and total > max_bytes:
+                _, size, obj = kept.pop(0)
+                obj.unlink(missing_ok=True)
+                removed, freed, total = removed + 1, freed + size, total - size
+        return {"removed": removed, "freed_bytes": freed, "kept": len(kept), "kept_bytes": total}
+
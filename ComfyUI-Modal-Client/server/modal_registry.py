@@ -0,0 +1,192 @@
+"""
+Registro de funciones de Modal para el Bridge.
+
+Los handles (modal.Function / métodos de modal.Cls) se resuelven de forma
+perezosa y en paralelo, se guardan en caché y, si una resolución o una llamada
+falla porque la función no existe o Modal no responde, se vuelven a resolver
+con backoff exponencial. Así el Bridge arranca al momento aunque Modal esté
+caído o la app no esté desplegada, y se recupera solo tras un modal deploy.
+"""
+import asyncio
+import time
+
+import modal
+
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+# Errores que indican que el handle ya no sirve (redeploy, red, credenciales);
+# los errores lanzados por el propio código de la función no invalidan nada
+HANDLE_ERRORS = (
+    modal.exception.NotFoundError,
+    modal.exception.ConnectionError,
+    modal.exception.AuthError,
+    ConnectionError,
+)
+
+
+class FunctionRegistry:
+    """
+    Handles de una app de Modal por nombre. Las clases se registran como
+    "Clase.metodo" y se resuelven instanciando la clase sin parámetros.
+    """
+
+    def __init__(self, app_name, names):
+        self.app_name = app_name
+        self._entries = {name: {
+            "state": "pending",
+            "handle": None,
+            "error": None,
+            "failures": 0,
+            "retry_at": 0.0,
+            "resolve_seconds": None,
+            "failing_since": None,
+            "recovered_after_seconds": None,
+        } for name in names}
+        self._resolving = {}   # nombre -> tarea de resolución en curso
+        self._created = time.monotonic()
+        self.startup_seconds = None
+
+    async def _lookup(self, name):
+        if "." in name:
+            cls_name, method = name.split(".", 1)
+            cls = modal.Cls.from_name(self.app_name, cls_name)
+            await cls.hydrate.aio()
+            return getattr(cls(), method)
+        function = modal.Function.from_name(self.app_name, name)
+        await function.hydrate.aio()
+        return function
+
+    async def _resolve(self, name):
+        entry = self._entries[name]
+        started = time.monotonic()
+        try:
+            handle = await self._lookup(name)
+        except Exception as e:
+            self._mark_failed(name, e)
+            return None
+
+        now = time.monotonic()
+        if entry["failing_since"] is not None:
+            entry["recovered_after_seconds"] = round(now - entry["failing_since"], 3)
+            print(f"✓ {name} recuperada tras {entry['recovered_after_seconds']} s")
+        entry.update(
+            state="ok",
+            handle=handle,
+            error=None,
+            failures=0,
+            failing_since=None,
+            resolve_seconds=round(now - started, 3),
+        )
+        return handle
+
+    def _mark_failed(self, name, error):
+        entry = self._entries[name]
+        now = time.monotonic()
+        entry["failures"] += 1
+        delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (entry["failures"] - 1))
+        entry.update(state="error", handle=None, error=str(error), retry_at=now + delay)
+        if entry["failing_since"] is None:
+            entry["failing_since"] = now
+        print(f"⚠️ {name} no disponible ({error}); reintento en {delay:.0f} s")
+
+    async def get(self, name):
+        """
+        Handle de la función, o None si no está disponible. Mientras dura el
+        backoff de un fallo devuelve None sin volver a preguntar a Modal.
+        """
+        entry = self._entries[name]
+        if entry["state"] == "ok":
+            return entry["handle"]
+        if entry["state"] == "error" and time.monotonic() < entry["retry_at"]:
+            return None
+        # Una sola resolución en vuelo por nombre, aunque pidan varias peticiones
+        task = self._resolving.get(name)
+        if task is None:
+            task = self._resolving[name] = asyncio.ensure_future(self._resolve(name))
+            task.add_done_callback(lambda _: self._resolving.pop(name, None))
+        return await asyncio.shield(task)
+
+    def available(self, name):
+        """Sin esperar: True salvo que la función esté fallando ahora mismo"""
+        return self._entries[name]["state"] != "error"
+
+    def report_error(self, name, error):
+        """Llamar cuando una llamada falla: si el handle ya no sirve, se re-resuelve"""
+        if isinstance(error, HANDLE_ERRORS):
+            self._mark_failed(name, error)
+
+    async def call(self, name, *args, **kwargs):
+        """function.remote.aio(...) con invalidación automática del handle"""
+        handle = await self.get(name)
+        if handle is None:
+            raise modal.exception.NotFoundError(f"{name} no está disponible en Modal")
+        try:
+            return await handle.remote.aio(*args, **kwargs)
+        except Exception as e:
+            self.report_error(name, e)
+            raise
+
+    async def spawn(self, name, *args, **kwargs):
+        """function.spawn.aio(...) con invalidación automática del handle"""
+        handle = await self.get(name)
+        if handle is None:
+            raise modal.exception.NotFoundError(f"{name} no está disponible en Modal")
+        try:
+            return await handle.spawn.aio(*args, **kwargs)
+        except Exception as e:
+            self.report_error(name, e)
+            raise
+
+    async def stream(self, name, *args, **kwargs):
+        """function.remote_gen.aio(...) (métodos generadores) con invalidación automática del handle"""
+        handle = await self.get(name)
+        if handle is None:
+            raise modal.exception.NotFoundError(f"{name} no está disponible en Modal")
+        try:
+            async for item in handle.remote_gen.aio(*args, **kwargs):
+                yield item
+        except Exception as e:
+            self.report_error(name, e)
+            raise
+
+    async def resolve_all(self):
+        """Resuelve todo en paralelo (al arrancar, en segundo plano)"""
+        await asyncio.gather(*(self.get(name) for name in self._entries))
+        if self.startup_seconds is None:
+            self.startup_seconds = round(time.monotonic() - self._created, 3)
+            ok = sum(1 for e in self._entries.values() if e["state"] == "ok")
+            print(f"✓ Funciones de Modal resueltas: {ok}/{len(self._entries)} en {self.startup_seconds} s")
+
+    async def watch(self, interval=5.0):
+        """Resuelve todo y luego reintenta en segundo plano las funciones que fallan"""
+        await self.resolve_all()
+        while True:
+            await asyncio.sleep(interval)
+            failing = [name for name, entry in self._entries.items() if entry["state"] == "error"]
+            if failing:
+                await asyncio.gather(*(self.get(name) for name in failing))
+
+    def health(self):
+        """Estado por función y tiempos del registro, para /health"""
+        now = time.monotonic()
+        functions = {}
+        for name, entry in self._entries.items():
+            functions[name] = {
+                "state": entry["state"],
+                "error": entry["error"],
+                "failures": entry["failures"],
+                "retry_in_seconds": round(max(0.0, entry["retry_at"] - now), 1) if entry["state"] == "error" else None,
+                "resolve_seconds": entry["resolve_seconds"],
+                "recovered_after_seconds": entry["recovered_after_seconds"],
+            }
+        states = {entry["state"] for entry in self._entries.values()}
+        if states == {"ok"}:
+            status = "connected"
+        elif "ok" in states:
+            status = "degraded"
+        elif states == {"pending"}:
+            status = "connecting"
+        else:
+            status = "disconnected"
+        return {"status": status, "startup_seconds": self.startup_seconds, "functions": functions}
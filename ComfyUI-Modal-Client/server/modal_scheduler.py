@@ -0,0 +1,239 @@
+"""
+Planificador de trabajos del Bridge.
+
+Los trabajos no se lanzan en Modal al recibirlos: entran en una cola y se
+lanzan cuando caben dentro de los límites:
+- concurrencia máxima por tipo de GPU (contenedores a la vez),
+- techo de gasto por hora: lo terminado en la última hora, más lo que está
+  corriendo (estimado) y más el candidato, no puede superar el techo,
+- tamaño máximo de la cola: lo que no cabe se rechaza al enviarlo.
+El orden es por prioridad (high, normal, low); dentro de una prioridad va
+primero el usuario con menos trabajos corriendo y, a igualdad, el más antiguo.
+"""
+import asyncio
+import inspect
+import itertools
+import time
+from collections import deque
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+SPEND_WINDOW_SECONDS = 3600
+
+
+class AdmissionError(Exception):
+    """El trabajo no entra en la cola (llena, o su coste supera el techo de gasto)"""
+
+
+class JobScheduler:
+    """
+    Cola con prioridades sobre el bucle de eventos. launch(job) lanza el
+    trabajo en Modal; si lanza una excepción el trabajo se libera y se llama a
+    on_launch_error(job, error), que puede ser una corrutina (se espera).
+    Quien sepa que un trabajo terminó llama a release.
+    """
+
+    def __init__(self, launch, max_concurrency, price_per_hour=None, spend_ceiling_per_hour=None,
+                 max_queued=100, on_launch_error=None, clock=time.monotonic):
+        self._launch = launch
+        self._on_launch_error = on_launch_error
+        self.max_concurrency = dict(max_concurrency)
+        self.price_per_hour = dict(price_per_hour or {})
+        self.spend_ceiling_per_hour = spend_ceiling_per_hour
+        self.max_queued = max_queued
+        self._clock = clock
+        self._seq = itertools.count()
+        self._queued = {}      # task_id -> trabajo, en orden de llegada
+        self._running = {}     # task_id -> trabajo
+        self._launches = {}    # task_id -> tarea de launch en curso
+        self._finished = deque()   # (terminado en, coste) de la última hora
+        self._wakeup = asyncio.Event()
+
+    # ----- coste -----
+
+    def job_cost(self, job, seconds=None):
+        """USD de un trabajo: precio por hora de su GPU × duración (estimada si no se da)"""
+        if seconds is None:
+            seconds = job.get("estimated_seconds") or 0
+        return self.price_per_hour.get(job["gpu_type"], 0.0) * seconds / 3600
+
+    def spend_last_hour(self):
+        """Gasto comprometido: terminados en la ventana + en curso (lo mayor entre estimado y consumido)"""
+        now = self._clock()
+        while self._finished and now - self._finished[0][0] > SPEND_WINDOW_SECONDS:
+            self._finished.popleft()
+        spent = sum(cost for _, cost in self._finished)
+        for job in self._running.values():
+            spent += max(self.job_cost(job), self.job_cost(job, now - job["started_at"]))
+        return spent
+
+    # ----- cola -----
+
+    def submit(self, job):
+        """
+        Encola job (dict con task_id, gpu_type y opcionales priority, user,
+        estimated_seconds). Lanza AdmissionError si no se admite. Devuelve la
+        tarea de lanzamiento si el trabajo salió ya de la cola, o None.
+        """
+        priority = job.setdefault("priority", "normal")
+        if priority not in PRIORITIES:
+            raise AdmissionError(f"Prioridad '{priority}' no válida. Opciones: {', '.join(PRIORITIES)}")
+        if len(self._queued) >= self.max_queued:
+            raise AdmissionError(f"Cola llena ({self.max_queued} trabajos esperando)")
+        if self.spend_ceiling_per_hour and self.job_cost(job) > self.spend_ceiling_per_hour:
+            raise AdmissionError(
+                f"Coste estimado ${self.job_cost(job):.2f} por encima del techo de ${self.spend_ceiling_per_hour:.2f}/h"
+            )
+        job.setdefault("user", "local")
+        job["seq"] = next(self._seq)
+        job["queued_at"] = self._clock()
+        self._queued[job["task_id"]] = job
+        self.dispatch()
+        return self._launches.get(job["task_id"])
+
+    def _admissible(self, job, spent):
+        gpu = job["gpu_type"]
+        running_on_gpu = sum(1 for j in self._running.values() if j["gpu_type"] == gpu)
+        if running_on_gpu >= self.max_concurrency.get(gpu, 1):
+            return False
+        if self.spend_ceiling_per_hour and spent + self.job_cost(job) > self.spend_ceiling_per_hour:
+            return False
+        return True
+
+    def _running_per_user(self):
+        counts = {}
+        for job in self._running.values():
+            counts[job["user"]] = counts.get(job["user"], 0) + 1
+        return counts
+
+    @staticmethod
+    def _order_key(running_per_user):
+        """Orden de salida: prioridad, usuario con menos trabajos corriendo, antigüedad"""
+        return lambda j: (PRIORITIES[j["priority"]], running_per_user.get(j["user"], 0), j["seq"])
+
+    def dispatch(self):
+        """Lanza todo lo que quepa ahora mismo, en orden de prioridad y reparto entre usuarios"""
+        while self._queued:
+            spent = self.spend_last_hour()
+            candidates = [job for job in self._queued.values() if self._admissible(job, spent)]
+            if not candidates:
+                return
+            self._start(min(candidates, key=self._order_key(self._running_per_user())))
+
+    def _start(self, job):
+        task_id = job["task_id"]
+        del self._queued[task_id]
+        job["started_at"] = self._clock()
+        self._running[task_id] = job
+        task = asyncio.get_running_loop().create_task(self._run_launch(job))
+        self._launches[task_id] = task
+        task.add_done_callback(lambda _: self._launches.pop(task_id, None))
+
+    async def _run_launch(self, job):
+        try:
+            return await self._launch(job)
+        except Exception as e:
+            self.release(job["task_id"], ran=False)
+            if self._on_launch_error:
+                result = self._on_launch_error(job, e)
+                if inspect.isawaitable(result):
+                    await result
+            return None
+
+    def release(self, task_id, ran=True):
+        """
+        Saca un trabajo del planificador (terminado, fallido o cancelado) y
+        deja sitio a los siguientes. ran=False no le imputa gasto. Devuelve el trabajo o None.
+        """
+        job = self._queued.pop(task_id, None)
+        if job is not None:
+            return job
+        job = self._running.pop(task_id, None)
+        if job is None:
+            return None
+        job["finished_at"] = self._clock()
+        if ran:
+            self._finished.append((job["finished_at"], self.job_cost(job, job["finished_at"] - job["started_at"])))
+        self._wakeup.set()
+        self.dispatch()
+        return job
+
+    def adopt(self, job):
+        """Cuenta como en curso un trabajo lanzado antes (p. ej. antes de reiniciar el Bridge)"""
+        job.setdefault("priority", "normal")
+        job.setdefault("user", "local")
+        job["started_at"] = self._clock()
+        self._running[job["task_id"]] = job
+
+    async def run(self, interval=5.0):
+        """Reintenta periódicamente lo bloqueado por el techo de gasto (la ventana se desliza)"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self.dispatch()
+
+    # ----- consulta -----
+
+    def is_queued(self, task_id):
+        return task_id in self._queued
+
+    def running_ids(self):
+        return list(self._running)
+
+    def running(self, task_id):
+        return self._running.get(task_id)
+
+    def queued_order(self):
+        """
+        Trabajos en cola en el orden en que saldrían si hubiera sitio: simula
+        dispatch, contando cada trabajo que sale como uno más de su usuario.
+        """
+        running_per_user = self._running_per_user()
+        pending = list(self._queued.values())
+        order = []
+        while pending:
+            job = min(pending, key=self._order_key(running_per_user))
+            pending.remove(job)
+            order.append(job)
+            running_per_user[job["user"]] = running_per_user.get(job["user"], 0) + 1
+        return order
+
+    def positions(self):
+        """
+        task_id -> posición (1 = el siguiente) en la cola de su GPU. Cada tipo de
+        GPU tiene sus propios huecos: un trabajo solo espera a los de su GPU que
+        saldrían antes que él, no a los de otras GPUs.
+        """
+        positions, ahead = {}, {}
+        for job in self.queued_order():
+            gpu = job["gpu_type"]
+            ahead[gpu] = ahead.get(gpu, 0) + 1
+            positions[job["task_id"]] = ahead[gpu]
+        return positions
+
+    def position(self, task_id):
+        """Posición (1 = el siguiente) de un trabajo en la cola de su GPU, o None"""
+        return self.positions().get(task_id) if task_id in self._queued else None
+
+    def snapshot(self):
+        """Estado para /modal_queue: límites, ocupación por GPU y gasto de la última hora"""
+        now = self._clock()
+        gpus = set(self.max_concurrency) | {j["gpu_type"] for j in (*self._queued.values(), *self._running.values())}
+        return {
+            "running": len(self._running),
+            "queued": len(self._queued),
+            "max_queued": self.max_queued,
+            "gpus": {
+                gpu: {
+                    "running": sum(1 for j in self._running.values() if j["gpu_type"] == gpu),
+                    "queued": sum(1 for j in self._queued.values() if j["gpu_type"] == gpu),
+                    "max_concurrency": self.max_concurrency.get(gpu, 1),
+                }
+                for gpu in sorted(gpus)
+            },
+            "spend_last_hour_usd": round(self.spend_last_hour(), 4),
+            "spend_ceiling_per_hour_usd": self.spend_ceiling_per_hour,
+            "oldest_wait_seconds": round(max((now - j["queued_at"] for j in self._queued.values()), default=0.0), 1),
+        }
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Los módulos del Bridge se importan por nombre, como hace el propio Bridge
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "server"))
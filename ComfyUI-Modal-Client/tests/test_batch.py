@@ -0,0 +1,80 @@
+"""Lotes: barridos de parámetros, agrupación por contenedor y validación de /execute_batch"""
+import asyncio
+
+import pytest
+
+import comfyui_modal_bridge as bridge
+
+WORKFLOW = {
+    "3": {"class_type": "KSampler", "inputs": {"seed": 1, "cfg": 7.0}},
+    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "base.safetensors"}},
+    "5": {"class_type": "LoraLoader", "inputs": {"lora_name": "a.safetensors"}},
+}
+
+
+def test_product_sweep_combines_all_values():
+    variants = bridge.sweep_variants(WORKFLOW, {"3.seed": [1, 2, 3], "3.cfg": [5, 7]})
+    assert len(variants) == 6
+    assert {(wf["3"]["inputs"]["seed"], wf["3"]["inputs"]["cfg"]) for wf, _ in variants} == {
+        (seed, cfg) for seed in (1, 2, 3) for cfg in (5, 7)
+    }
+    # El workflow original no se toca
+    assert WORKFLOW["3"]["inputs"]["seed"] == 1
+
+
+def test_zip_sweep_pairs_values():
+    variants = bridge.sweep_variants(WORKFLOW, {"3.seed": [1, 2], "3.cfg": [5, 7]}, mode="zip")
+    assert [params for _, params in variants] == [{"3.seed": 1, "3.cfg": 5}, {"3.seed": 2, "3.cfg": 7}]
+
+
+@pytest.mark.parametrize("sweep, mode", [
+    ({"9.seed": [1]}, "product"),
+    ({"3.steps": [1]}, "product"),
+    ({"3.seed": []}, "product"),
+    ({"3.seed": 5}, "product"),
+    (["3.seed"], "product"),
+    ({"3.seed": [1, 2], "3.cfg": [1]}, "zip"),
+    ({"3.seed": [1]}, "grid"),
+    ({"3.seed": list(range(bridge.MAX_BATCH_VARIANTS + 1))}, "product"),
+])
+def test_invalid_sweep_raises_value_error(sweep, mode):
+    with pytest.raises(ValueError):
+        bridge.sweep_variants(WORKFLOW, sweep, mode)
+
+
+def variant(i, ckpt="base.safetensors", lora="a.safetensors", seconds=60):
+    wf = {
+        "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": ckpt}},
+        "5": {"class_type": "LoraLoader", "inputs": {"lora_name": lora}},
+    }
+    return {"task_id": str(i), "workflow_api": wf, "estimated_seconds": seconds}
+
+
+def test_pack_groups_by_base_model_ignoring_lora():
+    items = [variant(i, lora=f"{i}.safetensors") for i in range(6)] + [variant(10 + i, ckpt="other.ckpt") for i in range(2)]
+    chunks = bridge.pack_variants(items, per_container=4)
+    assert [len(chunk) for chunk in chunks] == [4, 2, 2]
+    assert {v["workflow_api"]["4"]["inputs"]["ckpt_name"] for v in chunks[2]} == {"other.ckpt"}
+
+
+def test_pack_respects_time_budget():
+    items = [variant(i, seconds=400) for i in range(5)] + [variant(9, seconds=5000)]
+    chunks = bridge.pack_variants(items, per_container=8, budget_seconds=900)
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1, 1]
+    assert all(sum(v["estimated_seconds"] for v in chunk) <= 900 for chunk in chunks[:3])
+
+
+@pytest.mark.parametrize("body", [
+    {"workflow": WORKFLOW, "sweep": ["3.seed"]},
+    {"workflow": WORKFLOW, "sweep": {"3.seed": "1,2"}},
+    {"workflow": ["x"], "sweep": {"3.seed": [1]}},
+    {"workflows": ["x", "y"]},
+    {"workflows": {"a": WORKFLOW}},
+    {"workflows": [{"3": "KSampler"}]},
+    {"workflow": WORKFLOW, "sweep": {"3.seed": [1]}, "variants_per_container": "muchos"},
+])
+def test_malformed_batch_is_rejected_with_400(body):
+    async def post():
+        response = await bridge.app.test_client().post('/execute_batch', json=body)
+        return response.status_code
+    assert asyncio.run(post()) == 400
@@ -0,0 +1,62 @@
+"""Descargas desde URLs sin metadatos: el Content-Length como tamaño esperado"""
+import pytest
+import requests
+
+import modal_downloader as downloader
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, body=b""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+
+def serve(monkeypatch, response):
+    monkeypatch.setattr(requests, "get", lambda url, **kwargs: response)
+
+
+@pytest.mark.parametrize("response, expected", [
+    (FakeResponse(206, {"Content-Range": "bytes 0-0/1234", "Content-Length": "1"}), (1234, True)),
+    (FakeResponse(206, {"Content-Range": "bytes 0-0/*", "Content-Length": "1"}), (0, False)),
+    (FakeResponse(200, {"Content-Length": "1234"}), (1234, False)),
+    (FakeResponse(200, {"Content-Length": "1234", "Content-Encoding": "gzip"}), (0, False)),
+    (FakeResponse(200), (0, False)),
+])
+def test_probe_download_total(monkeypatch, response, expected):
+    serve(monkeypatch, response)
+    assert downloader._probe_download("https://example.com/model.safetensors", {}) == expected
+
+
+def test_single_stream_rejects_short_body(monkeypatch, tmp_path):
+    serve(monkeypatch, FakeResponse(200, {"Content-Length": "10"}, b"x" * 6))
+    meter = downloader._DownloadMeter(10)
+
+    with pytest.raises(Exception, match="6/10"):
+        downloader._download_single_stream("https://example.com/m", tmp_path / "m.part", {}, meter, lambda: None)
+
+
+def test_single_stream_accepts_full_body(monkeypatch, tmp_path):
+    serve(monkeypatch, FakeResponse(200, {"Content-Length": "10"}, b"x" * 10))
+    meter = downloader._DownloadMeter(10)
+
+    downloader._download_single_stream("https://example.com/m", tmp_path / "m.part", {}, meter, lambda: None)
+    assert (tmp_path / "m.part").read_bytes() == b"x" * 10
+
+
+def test_verify_uses_content_length_as_expected_size():
+    assert downloader._verify(6, "0" * 64, {"size": 10, "sha256": None})
+    assert downloader._verify(10, "0" * 64, {"size": 10, "sha256": None}) is None
@@ -0,0 +1,95 @@
+"""execute_batch: prompts encolados de golpe en el ComfyUI del contenedor"""
+import types
+
+import pytest
+
+import modal_downloader as downloader
+
+
+class FakeWebSocket:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    """ComfyUIExecutor sin Modal ni ComfyUI: encola, espera y corta sobre registros"""
+    progress, cancels, calls = {}, set(), []
+    monkeypatch.setattr(
+        downloader, "set_progress",
+        lambda task_id, state, percent, message, **extra: progress.setdefault(task_id, []).append((state, percent))
+    )
+    monkeypatch.setattr(downloader, "cancel_requests", types.SimpleNamespace(
+        contains=lambda task_id: task_id in cancels,
+        pop=lambda task_id, default=None: cancels.discard(task_id)
+    ))
+    monkeypatch.setattr(downloader, "volume_outputs", types.SimpleNamespace(commit=lambda: None))
+    
+    ex = downloader.ComfyUIExecutor()
+    ex.server_process, ex.startup_seconds, ex.jobs_served = None, 4.0, 0
+    ex.ws = FakeWebSocket()
+    ex._ensure_server = lambda: None
+    ex._connect_websocket = lambda client_id: ex.ws
+    ex._collect_images = lambda prompt_id: []
+    ex._stop_prompt = lambda prompt_id: calls.append(("stop", prompt_id))
+    
+    def queue_prompt(workflow_api, client_id):
+        if workflow_api["1"]["inputs"].get("invalid"):
+            raise Exception("Prompt inválido")
+        prompt_id = f"p{len([c for c in calls if c[0] == 'queue'])}"
+        calls.append(("queue", prompt_id))
+        return prompt_id
+    
+    def wait_for_prompt(ws, prompt_id, workflow_api, report, on_executed=None, cancelled=None):
+        calls.append(("wait", prompt_id))
+        if workflow_api["1"]["inputs"].get("cancel_while_running"):
+            cancels.add(workflow_api["1"]["inputs"]["cancel_while_running"])
+            raise downloader.WorkflowCancelled("Cancelado por el usuario")
+        if workflow_api["1"]["inputs"].get("fail"):
+            raise Exception("KSampler (3): CUDA out of memory")
+    
+    ex._queue_prompt = queue_prompt
+    ex._wait_for_prompt = wait_for_prompt
+    ex.progress, ex.cancels, ex.calls = progress, cancels, calls
+    return ex
+
+
+def run_batch(ex, inputs):
+    variants = [
+        {"task_id": f"v{i}", "workflow_api": {"1": {"class_type": "X", "inputs": dict(extra)}}}
+        for i, extra in enumerate(inputs)
+    ]
+    return downloader.ComfyUIExecutor.execute_batch._get_raw_f()(ex, variants, "batch")
+
+
+def test_all_prompts_queued_before_waiting(executor):
+    result = run_batch(executor, [{}, {}, {}])
+    assert [c[0] for c in executor.calls] == ["queue"] * 3 + ["wait"] * 3
+    assert [r["status"] for r in result["results"]] == ["success"] * 3
+    assert [r["start_type"] for r in result["results"]] == ["cold", "warm", "warm"]
+    assert executor.ws.closed
+
+
+def test_failures_are_independent(executor):
+    result = run_batch(executor, [{"invalid": True}, {"fail": True}, {}])
+    assert [r["status"] for r in result["results"]] == ["error", "error", "success"]
+    assert "inválido" in result["results"][0]["message"]
+    assert result["message"] == "1/3 variantes completadas"
+
+
+def test_cancelled_prompt_is_stopped_in_comfyui(executor):
+    # v1 se cancela mientras v0 corre: ComfyUI ya la tiene en cola (o empezada)
+    result = run_batch(executor, [{"cancel_while_running": "v1"}, {}, {}])
+    statuses = [r["status"] for r in result["results"]]
+    assert statuses == ["cancelled", "cancelled", "success"]
+    assert ("stop", "p0") in executor.calls and ("stop", "p1") in executor.calls
+    assert ("wait", "p1") not in executor.calls
+
+
+def test_progress_is_monotonic(executor):
+    run_batch(executor, [{}, {}])
+    for updates in executor.progress.values():
+        percents = [percent for _, percent in updates]
+        assert percents == sorted(percents)
@@ -0,0 +1,106 @@
+"""JobStore: cola, historial y manifiesto de sincronización sobre SQLite"""
+import json
+import threading
+
+import pytest
+
+from modal_job_store import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(tmp_path / "jobs.sqlite3")
+
+
+def add(store, task_id, status="running", gpu="T4", timestamp="2026-01-01T00:00:00", **extra):
+    store.add({"task_id": task_id, "status": status, "gpu_type": gpu, "timestamp": timestamp, **extra})
+
+
+def test_update_merges_fields(store):
+    add(store, "t1", nodes=3)
+
+    job = store.update("t1", call_id="fc-1")
+
+    assert job["call_id"] == "fc-1" and job["nodes"] == 3
+    assert store.get("t1") == job
+    assert store.update("nope", call_id="x") is None
+
+
+def test_only_first_finish_wins(store):
+    add(store, "t1")
+
+    first = store.finish("t1", "completed", images=["a.png"])
+    second = store.finish("t1", "failed", error="tarde")
+
+    assert first["status"] == "completed" and first["completed_at"]
+    assert second is None
+    assert store.get("t1")["status"] == "completed"
+    assert store.update("t1", only_active=True, call_id="x") is None
+
+
+def test_active_lists_unfinished_oldest_first(store):
+    add(store, "b", timestamp="2026-01-01T00:00:02")
+    add(store, "a", status="queued", timestamp="2026-01-01T00:00:01")
+    add(store, "done", timestamp="2026-01-01T00:00:00")
+    store.finish("done", "completed")
+
+    assert [job["task_id"] for job in store.active()] == ["a", "b"]
+
+
+def test_batch_returns_variants_in_order(store):
+    for variant in (2, 0, 1):
+        add(store, f"v{variant}", batch_id="lote", variant=variant)
+    add(store, "otro", batch_id="otro-lote", variant=0)
+
+    assert [job["task_id"] for job in store.batch("lote")] == ["v0", "v1", "v2"]
+
+
+def test_history_filters_and_paginates(store):
+    for index, (gpu, status) in enumerate([("T4", "completed"), ("A10G", "completed"), ("T4", "failed"), ("T4", "completed")]):
+        add(store, f"t{index}", gpu=gpu)
+        store.finish(f"t{index}", status, completed_at=f"2026-01-0{index + 1}T00:00:00")
+    add(store, "running")
+
+    page, total = store.history(gpu_type="T4", status="completed", limit=1)
+    assert total == 2 and [job["task_id"] for job in page] == ["t3"]
+
+    page, total = store.history(since="2026-01-02", until="2026-01-04", offset=1)
+    assert total == 2 and [job["task_id"] for job in page] == ["t1"]
+
+
+def test_synced_manifest(store):
+    store.record_synced("t1/a.png", 10, 123.0, "ab" * 32)
+
+    assert store.synced("t1/a.png") == {"filename": "t1/a.png", "size": 10, "mtime": 123.0, "sha256": "ab" * 32}
+    assert set(store.synced_map()) == {"t1/a.png"}
+    assert store.forget_synced("t1/a.png")["size"] == 10
+    assert store.synced("t1/a.png") is None and store.forget_synced("t1/a.png") is None
+
+    store.record_synced_dir("t1", 5.0)
+    assert store.synced_dirs() == {"t1": 5.0}
+
+
+def test_import_json_migrates_once(store, tmp_path):
+    queue_file, history_file = tmp_path / "queue.json", tmp_path / "history.json"
+    queue_file.write_text(json.dumps([{"task_id": "q", "status": "running"}]))
+    history_file.write_text(json.dumps([{"task_id": "h", "status": "error"}, {"task_id": "q", "status": "completed"}]))
+
+    assert store.import_json(queue_file, history_file) == 2
+    assert store.get("h")["status"] == "failed" and store.get("q")["status"] == "running"
+    assert not queue_file.exists() and (tmp_path / "queue.json.migrated").exists()
+    assert store.import_json(queue_file, history_file) == 0
+
+
+def test_concurrent_finish_from_threads(store):
+    add(store, "t1")
+    results = []
+    threads = [
+        threading.Thread(target=lambda status=status: results.append(store.finish("t1", status)))
+        for status in ("completed", "failed", "cancelled") * 4
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(result is not None for result in results) == 1
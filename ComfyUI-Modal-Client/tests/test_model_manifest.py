@@ -0,0 +1,41 @@
+"""Catálogo de modelos: alta por stat de lo que ya estaba en el volumen"""
+import pytest
+
+import modal_downloader as downloader
+
+
+class FakeDict(dict):
+    def len(self):
+        return len(self)
+
+
+@pytest.fixture
+def models(monkeypatch, tmp_path):
+    manifest = FakeDict()
+    monkeypatch.setattr(downloader, "MODELS_DIR", str(tmp_path))
+    monkeypatch.setattr(downloader, "model_manifest", manifest)
+    (tmp_path / "checkpoints" / "sdxl").mkdir(parents=True)
+    (tmp_path / "checkpoints" / "sdxl" / "base.gguf").write_bytes(b"x" * 10)
+    (tmp_path / ".incoming" / "checkpoints").mkdir(parents=True)
+    (tmp_path / ".incoming" / "checkpoints" / "base.gguf.part").write_bytes(b"x")
+    return manifest
+
+
+def test_status_falls_back_to_volume_and_records_entry(models):
+    status = downloader._model_status("checkpoints", "sdxl/base.gguf")
+
+    assert status["exists"] and status["size"] == 10
+    entry = models["checkpoints/sdxl/base.gguf"]
+    assert entry["source"] == "stat" and entry["sha256"] is None
+
+
+def test_missing_or_outside_paths_are_not_recorded(models):
+    assert not downloader._model_status("checkpoints", "otro.gguf")["exists"]
+    assert downloader._lookup_model("checkpoints", "../../../etc/passwd") is None
+    assert downloader._lookup_model(".incoming", "checkpoints/base.gguf.part") is None
+    assert not models
+
+
+def test_empty_manifest_is_indexed_from_volume(models):
+    assert downloader._index_by_stat() == 1
+    assert list(models) == ["checkpoints/sdxl/base.gguf"]
@@ -0,0 +1,77 @@
+"""OutputCache: caché por contenido de los outputs traídos del volumen"""
+import hashlib
+import os
+import time
+
+import pytest
+
+from modal_job_store import JobStore
+from modal_output_cache import OutputCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return OutputCache(tmp_path / ".modal_cache", JobStore(tmp_path / "jobs.sqlite3"))
+
+
+def write_output(tmp_path, name, data):
+    path = tmp_path / "output" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path, hashlib.sha256(data).hexdigest()
+
+
+def test_unchanged_output_is_cached(tmp_path, cache):
+    dest, sha = write_output(tmp_path, "t1/a.png", b"png")
+    cache.add("t1/a.png", dest, 3, 100.0, sha)
+    assert cache.satisfy("t1/a.png", dest, 3, 100.0) == {"mode": "cached", "sha256": sha}
+    assert cache.satisfy("t1/a.png", dest, 3, 101.0) is None
+
+
+def test_same_content_is_linked_not_downloaded(tmp_path, cache):
+    first, sha = write_output(tmp_path, "t1/a.png", b"same")
+    cache.add("t1/a.png", first, 4, 1.0, sha)
+    second = tmp_path / "output" / "t2" / "b.png"
+    second.parent.mkdir()
+    assert cache.satisfy("t2/b.png", second, 4, 2.0, sha) == {"mode": "linked", "sha256": sha}
+    assert second.read_bytes() == b"same"
+    assert cache.job_store.synced("t2/b.png")["sha256"] == sha
+
+
+def test_forget_drops_manifest_and_unused_object(tmp_path, cache):
+    dest, sha = write_output(tmp_path, "t1/a.png", b"gone")
+    cache.add("t1/a.png", dest, 4, 1.0, sha)
+    dest.unlink()
+    cache.forget("t1/a.png")
+    assert cache.job_store.synced("t1/a.png") is None
+    if cache._linked:
+        assert not cache.object_path(sha).exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "link"), reason="sin hard links")
+def test_evict_removes_orphans_then_oldest(tmp_path, cache):
+    if not cache._linked:
+        pytest.skip("el sistema de ficheros no admite hard links")
+    paths = {}
+    for i, name in enumerate(("old.png", "mid.png", "new.png", "orphan.png")):
+        path, sha = write_output(tmp_path, name, bytes([i]) * 100)
+        cache.add(name, path, 100, float(i), sha)
+        os.utime(cache.object_path(sha), (time.time() - 1000 + i, time.time() - 1000 + i))
+        paths[name] = (path, sha)
+    paths["orphan.png"][0].unlink()
+    
+    stats = cache.evict(max_bytes=150)
+    assert stats["removed"] == 3
+    assert stats["kept"] == 1 and stats["kept_bytes"] == 100
+    assert cache.object_path(paths["new.png"][1]).exists()
+    # Los outputs en local no se tocan: solo se pierde su copia en la caché
+    assert paths["old.png"][0].read_bytes() == bytes([0]) * 100
+
+
+def test_evict_by_age(tmp_path, cache):
+    dest, sha = write_output(tmp_path, "a.png", b"aged")
+    cache.add("a.png", dest, 4, 1.0, sha)
+    old = time.time() - 10 * 86400
+    os.utime(cache.object_path(sha), (old, old))
+    assert cache.evict(max_age_seconds=86400)["removed"] == 1
+    assert dest.exists()
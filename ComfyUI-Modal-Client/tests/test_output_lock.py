@@ -0,0 +1,67 @@
+"""output_lock: una sola escritura a la vez por output"""
+import asyncio
+import hashlib
+import types
+
+import pytest
+
+import comfyui_modal_bridge as bridge
+
+
+def test_late_caller_shares_lock_with_waiters():
+    active, peak = [0], [0]
+
+    async def writer(delay):
+        await asyncio.sleep(delay)
+        async with bridge.output_lock("t1/a.png"):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.01)
+            active[0] -= 1
+
+    async def main():
+        # El tercero llega justo cuando el primero suelta y el segundo aún espera
+        await asyncio.gather(writer(0), writer(0.001), writer(0.01))
+
+    asyncio.run(main())
+    assert peak[0] == 1
+    assert not bridge._output_locks
+
+
+def test_lock_entry_is_dropped_when_body_raises():
+    async def main():
+        with pytest.raises(IOError):
+            async with bridge.output_lock("t1/a.png"):
+                raise IOError("transferencia no verificada")
+
+    asyncio.run(main())
+    assert not bridge._output_locks
+
+
+def test_streamed_output_waits_for_running_transfer(monkeypatch, tmp_path):
+    monkeypatch.setattr(bridge, "COMFYUI_OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(bridge, "output_cache", types.SimpleNamespace(
+        is_current=lambda *args: False,
+        add=lambda *args: None
+    ))
+    data = b"png"
+    event = {"filename": "t1/a.png", "data": data, "size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+    order = []
+
+    async def transfer():
+        async with bridge.output_lock("t1/a.png"):
+            await asyncio.sleep(0.01)
+            order.append("transfer")
+
+    async def stream():
+        await asyncio.sleep(0.001)
+        await bridge.store_streamed_output(event)
+        order.append("stream")
+
+    async def main():
+        await asyncio.gather(transfer(), stream())
+
+    asyncio.run(main())
+    assert order == ["transfer", "stream"]
+    assert (tmp_path / "t1" / "a.png").read_bytes() == data
+    assert not bridge._output_locks
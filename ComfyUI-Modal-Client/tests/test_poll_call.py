@@ -0,0 +1,87 @@
+"""poll_call: resultado de las FunctionCall lanzadas por el Bridge"""
+import asyncio
+import types
+
+import modal
+import pytest
+
+import comfyui_modal_bridge as bridge
+from modal_job_store import JobStore
+
+
+class FakeCall:
+    """FunctionCall cuyo get(timeout=0) devuelve result o lanza error"""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.object_id = "fc-test"
+
+    @property
+    def get(self):
+        async def aio(timeout=None):
+            if self.error is not None:
+                raise self.error
+            return self.result
+        return types.SimpleNamespace(aio=aio)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(bridge, "job_store", store)
+    monkeypatch.setattr(bridge, "tracked_calls", {})
+    monkeypatch.setattr(bridge, "call_outcomes", {})
+    store.add({"task_id": "t1", "gpu_type": "T4", "status": "running", "timestamp": "2026-01-01T00:00:00"})
+    return store
+
+
+def poll(call):
+    bridge.track_call("t1", call)
+    return asyncio.run(bridge.poll_call("t1"))
+
+
+@pytest.mark.parametrize("error", [TimeoutError(), modal.exception.TimeoutError("not ready")])
+def test_pending_call_stays_running(store, error):
+    assert poll(FakeCall(error=error)) is None
+    assert "t1" in bridge.tracked_calls
+    assert "t1" not in bridge.call_outcomes
+    assert store.get("t1")["status"] == "running"
+
+
+def test_finished_call_completes_job(store):
+    outcome = poll(FakeCall(result={
+        "status": "success",
+        "message": "ok",
+        "outputs": {"t1/a.png": {"size": 1, "sha256": "x"}},
+        "execution_seconds": 2.0
+    }))
+    assert outcome["state"] == "completed"
+    assert "t1" not in bridge.tracked_calls
+    job = store.get("t1")
+    assert job["status"] == "completed"
+    assert job["images"] == ["t1/a.png"]
+
+
+def test_expired_output_falls_back_to_progress(store):
+    assert poll(FakeCall(error=modal.exception.OutputExpiredError("expired"))) is None
+    assert "t1" not in bridge.tracked_calls
+    assert store.get("t1")["status"] == "running"
+
+
+def test_container_timeout_fails_job(store):
+    outcome = poll(FakeCall(error=modal.exception.FunctionTimeoutError("1800s")))
+    assert outcome["state"] == "failed"
+    assert store.get("t1")["status"] == "failed"
+
+
+def test_crashed_call_fails_job(store):
+    outcome = poll(FakeCall(error=modal.exception.RemoteError("container exited with code 137")))
+    assert outcome["state"] == "failed"
+    assert "137" in store.get("t1")["error"]
+    assert bridge.call_outcomes["t1"][1] is outcome
+
+
+def test_transient_error_retries(store):
+    assert poll(FakeCall(error=modal.exception.ConnectionError("blip"))) is None
+    assert "t1" in bridge.tracked_calls
@@ -0,0 +1,44 @@
+"""Pre-flight: qué entradas de un workflow son modelos que deben existir"""
+import pytest
+
+import modal_downloader as downloader
+
+# El catálogo está falseado: que preflight_workflow corra sin el volumen es lo esperado
+pytestmark = pytest.mark.filterwarnings("ignore:The preflight_workflow function is executing locally")
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    entries = {"checkpoints/sd15.safetensors": {"size": 2 * 1024**3}}
+    monkeypatch.setattr(downloader, "_lookup_model", lambda folder, filename: entries.get(f"{folder}/{filename}"))
+    return entries
+
+
+def preflight(workflow_api):
+    return downloader.preflight_workflow.local(workflow_api)
+
+
+@pytest.mark.parametrize("value", ["pixel_space", "taesd", "taesdxl", "None", "Baked VAE", ""])
+def test_sentinel_values_are_not_models(value):
+    workflow = {"1": {"class_type": "VAELoader", "inputs": {"vae_name": value}}}
+    assert downloader.find_workflow_models(workflow) == []
+
+
+def test_core_loader_missing_model_rejects(catalog):
+    result = preflight({
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "sd15.safetensors"}},
+        "2": {"class_type": "LoraLoader", "inputs": {"lora_name": "estilo.safetensors", "model": ["1", 0]}},
+    })
+
+    assert [m["filename"] for m in result["missing"]] == ["estilo.safetensors"]
+    assert result["unverified"] == [] and result["total_bytes"] == 2 * 1024**3
+
+
+def test_custom_node_missing_model_only_warns(catalog):
+    result = preflight({
+        "1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "sd15.safetensors"}},
+        "2": {"class_type": "Efficient Loader", "inputs": {"lora_name": "preset-lora", "vae_name": "Baked VAE"}},
+    })
+
+    assert result["missing"] == []
+    assert [(m["class_type"], m["filename"]) for m in result["unverified"]] == [("Efficient Loader", "preset-lora")]
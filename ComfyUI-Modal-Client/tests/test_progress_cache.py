@@ -0,0 +1,72 @@
+"""ProgressCache: una lectura por tarea aunque se cancele quien la pidió"""
+import asyncio
+
+import pytest
+
+import comfyui_modal_bridge as bridge
+
+
+@pytest.fixture
+def modal_progress(monkeypatch):
+    """fetch_progress falso que espera a release y cuenta las llamadas"""
+    state = {"calls": [], "release": None, "error": None}
+
+    async def fetch_progress(task_ids):
+        state["calls"].append(task_ids)
+        await state["release"].wait()
+        if state["error"]:
+            raise state["error"]
+        return {t: {"state": "running", "percent": 40} for t in task_ids}
+
+    async def record_progress(task_id, result):
+        pass
+
+    monkeypatch.setattr(bridge, "fetch_progress", fetch_progress)
+    monkeypatch.setattr(bridge, "record_progress", record_progress)
+    return state
+
+
+def test_cancelled_owner_does_not_strand_waiters(modal_progress):
+    async def main():
+        modal_progress["release"] = asyncio.Event()
+        cache = bridge.ProgressCache()
+        owner = asyncio.ensure_future(cache.get("t1"))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get("t1"))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.sleep(0)
+        modal_progress["release"].set()
+        result = await asyncio.wait_for(waiter, 1)
+        return result, cache._inflight, owner.cancelled()
+
+    result, inflight, cancelled = asyncio.run(main())
+    assert result["percent"] == 40 and not inflight and cancelled
+    assert modal_progress["calls"] == [["t1"]]
+
+
+def test_failed_fetch_is_released_without_unretrieved_warning(modal_progress):
+    def main():
+        async def run():
+            modal_progress["release"] = asyncio.Event()
+            modal_progress["error"] = ConnectionError("Modal caído")
+            cache = bridge.ProgressCache()
+            owner = asyncio.ensure_future(cache.get("t1"))
+            await asyncio.sleep(0)
+            owner.cancel()
+            modal_progress["release"].set()
+            await asyncio.sleep(0.01)
+            modal_progress["error"] = None
+            return await asyncio.wait_for(cache.get("t1"), 1), cache._inflight
+
+        loop = asyncio.new_event_loop()
+        errors = []
+        loop.set_exception_handler(lambda loop, context: errors.append(context["message"]))
+        try:
+            return loop.run_until_complete(run()), errors
+        finally:
+            loop.close()
+
+    (result, inflight), errors = main()
+    assert result["percent"] == 40 and not inflight
+    assert not errors
@@ -0,0 +1,87 @@
+"""ProgressHub: backoff sin cambios y abandono de tareas desconocidas"""
+import asyncio
+import types
+
+import comfyui_modal_bridge as bridge
+
+
+def fake_cache(monkeypatch, progress):
+    """progress_cache falso: progress(task_id, vuelta) da el resultado de cada lectura"""
+    polls = []
+
+    async def get_many(task_ids):
+        polls.append(list(task_ids))
+        return {t: progress(t, len(polls)) for t in task_ids}
+
+    monkeypatch.setattr(bridge, "progress_cache", types.SimpleNamespace(get_many=get_many))
+    return polls
+
+
+def unknown(task_id, poll):
+    return {"percent": 0, "message": "No encontrado", "filename": "", "state": "unknown"}
+
+
+def test_unknown_task_is_dropped_after_limit(monkeypatch):
+    polls = fake_cache(monkeypatch, unknown)
+
+    async def main():
+        hub = bridge.ProgressHub(interval=0.001, max_interval=0.001)
+        subscriber = hub.subscribe(["bogus"])
+        task_id, result = await asyncio.wait_for(subscriber.get(), 1)
+        await asyncio.wait_for(hub._task, 1)
+        return task_id, result, hub
+
+    task_id, result, hub = asyncio.run(main())
+    assert task_id == "bogus" and result["state"] == "unknown"
+    assert len(polls) == bridge.PROGRESS_UNKNOWN_LIMIT
+    assert not hub._subscribers and not hub._unknown
+
+
+def test_unknown_before_first_progress_is_not_published(monkeypatch):
+    # Recién lanzada, la tarea puede tardar una lectura en escribir su progreso
+    def progress(task_id, poll):
+        return unknown(task_id, poll) if poll == 1 else {"state": "completed", "percent": 100}
+    fake_cache(monkeypatch, progress)
+
+    async def main():
+        hub = bridge.ProgressHub(interval=0.001, max_interval=0.001)
+        subscriber = hub.subscribe(["t1"])
+        return await asyncio.wait_for(subscriber.get(), 1)
+
+    assert asyncio.run(main()) == ("t1", {"state": "completed", "percent": 100})
+
+
+def test_polling_backs_off_while_nothing_changes(monkeypatch):
+    polls = fake_cache(monkeypatch, lambda t, poll: {"state": "running", "percent": 10})
+
+    async def main():
+        hub = bridge.ProgressHub(interval=0.01, max_interval=0.04)
+        subscriber = hub.subscribe(["t1"])
+        await asyncio.sleep(0.2)
+        hub.unsubscribe(subscriber, ["t1"])
+        await asyncio.wait_for(hub._task, 1)
+
+    asyncio.run(main())
+    # Sin backoff serían ~20 lecturas; con él 0.01 + 0.02 + 0.04 + 0.04...
+    assert 3 <= len(polls) <= 8
+
+
+def test_new_subscriber_wakes_backed_off_poller(monkeypatch):
+    polls = fake_cache(monkeypatch, lambda t, poll: {"state": "running", "percent": 10})
+
+    async def main():
+        hub = bridge.ProgressHub(interval=0.01, max_interval=10)
+        first = hub.subscribe(["t1"])
+        await asyncio.sleep(0.1)
+        hub.subscribe(["t2"])
+        task_id, _ = await asyncio.wait_for(first.get(), 1)
+        late = hub.subscribe(["t3"])
+        # t3 se lee enseguida aunque el sondeo esté en plena espera larga
+        result = await asyncio.wait_for(late.get(), 0.5)
+        hub._subscribers.clear()
+        hub._wake.set()
+        await asyncio.wait_for(hub._task, 1)
+        return result
+
+    assert asyncio.run(main())[0] == "t3"
+    assert ["t1", "t2", "t3"] in polls
@@ -0,0 +1,103 @@
+"""FunctionRegistry: resolución perezosa, backoff e invalidación de handles"""
+import asyncio
+import types
+
+import modal
+import pytest
+
+import modal_registry
+from modal_registry import FunctionRegistry
+
+
+class FakeRegistry(FunctionRegistry):
+    """Registro cuyo _lookup sale de una tabla en vez de Modal"""
+
+    def __init__(self, names, handles):
+        super().__init__("app-test", names)
+        self.handles = handles
+        self.lookups = []
+
+    async def _lookup(self, name):
+        self.lookups.append(name)
+        await asyncio.sleep(0)
+        handle = self.handles.get(name)
+        if isinstance(handle, Exception):
+            raise handle
+        return handle
+
+
+def handle(remote=None):
+    async def aio(*args, **kwargs):
+        if isinstance(remote, Exception):
+            raise remote
+        return remote
+    return types.SimpleNamespace(remote=types.SimpleNamespace(aio=aio), spawn=types.SimpleNamespace(aio=aio))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(modal_registry.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_concurrent_gets_share_one_lookup(clock):
+    registry = FakeRegistry(["f"], {"f": handle("ok")})
+
+    async def main():
+        return await asyncio.gather(*(registry.get("f") for _ in range(5)))
+
+    handles = asyncio.run(main())
+    assert registry.lookups == ["f"] and all(h is handles[0] for h in handles)
+    assert registry.health()["status"] == "connected"
+
+
+def test_failed_lookup_backs_off_then_recovers(clock):
+    registry = FakeRegistry(["f", "g"], {"f": modal.exception.NotFoundError("sin desplegar"), "g": handle()})
+
+    async def main():
+        await registry.resolve_all()
+        assert registry.health()["status"] == "degraded"
+        assert not registry.available("f") and await registry.get("f") is None
+        assert registry.lookups.count("f") == 1
+
+        registry.handles["f"] = handle("ok")
+        clock[0] += modal_registry.RETRY_BASE_SECONDS
+        return await registry.get("f")
+
+    assert asyncio.run(main()) is registry.handles["f"]
+    assert registry.health()["functions"]["f"]["recovered_after_seconds"] == modal_registry.RETRY_BASE_SECONDS
+
+
+def test_backoff_grows_exponentially(clock):
+    registry = FakeRegistry(["f"], {"f": ConnectionError("caído")})
+
+    async def main():
+        delays = []
+        for _ in range(4):
+            clock[0] += 1000
+            await registry.get("f")
+            delays.append(registry.health()["functions"]["f"]["retry_in_seconds"])
+        return delays
+
+    assert asyncio.run(main()) == [1.0, 2.0, 4.0, 8.0]
+
+
+def test_handle_errors_invalidate_but_function_errors_do_not(clock):
+    registry = FakeRegistry(["f", "g"], {
+        "f": handle(ValueError("fallo del workflow")),
+        "g": handle(modal.exception.ConnectionError("red"))
+    })
+
+    async def main():
+        with pytest.raises(ValueError):
+            await registry.call("f")
+        with pytest.raises(modal.exception.ConnectionError):
+            await registry.call("g")
+        assert registry.available("f") and not registry.available("g")
+        # En backoff no se pregunta a Modal: la llamada falla al momento
+        with pytest.raises(modal.exception.NotFoundError):
+            await registry.spawn("g")
+
+    asyncio.run(main())
+    assert registry.lookups == ["f", "g"]
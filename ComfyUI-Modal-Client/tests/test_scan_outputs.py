@@ -0,0 +1,26 @@
+"""_scan_outputs: el filtro since mira el mtime de cada fichero, no el de su carpeta"""
+import os
+
+import modal_downloader as downloader
+
+
+def write(path, mtime):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"png")
+    os.utime(path, (mtime, mtime))
+
+
+def test_since_finds_files_in_nested_folders_of_old_jobs(monkeypatch, tmp_path):
+    monkeypatch.setattr(downloader, "OUTPUT_DIR", str(tmp_path))
+    write(tmp_path / "t1" / "old.png", 100)
+    write(tmp_path / "t1" / "sub" / "new.png", 300)
+    write(tmp_path / "t1" / "sub" / "notes.txt", 300)
+    # Escribir en t1/sub no toca el mtime de t1
+    os.utime(tmp_path / "t1", (100, 100))
+
+    images = list(downloader._scan_outputs(tmp_path, since=200))
+    assert [img["filename"] for img in images] == ["t1/sub/new.png"]
+    assert images[0]["modified"] == 300
+
+    every = sorted(img["filename"] for img in downloader._scan_outputs(tmp_path))
+    assert every == ["t1/old.png", "t1/sub/new.png"]
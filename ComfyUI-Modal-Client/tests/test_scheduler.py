@@ -0,0 +1,159 @@
+"""JobScheduler: orden de salida, límites y posición en cola"""
+import asyncio
+
+import pytest
+
+from modal_scheduler import SPEND_WINDOW_SECONDS, AdmissionError, JobScheduler
+
+
+async def launch(job):
+    return job["task_id"]
+
+
+def job(task_id, user="local", priority="normal", gpu="A10G"):
+    return {"task_id": task_id, "user": user, "priority": priority, "gpu_type": gpu}
+
+
+def test_position_follows_per_user_alternation():
+    async def main():
+        scheduler = JobScheduler(launch, {"A10G": 0})
+        for task_id, user in [("a1", "ana"), ("a2", "ana"), ("a3", "ana"), ("b1", "bea"), ("b2", "bea")]:
+            scheduler.submit(job(task_id, user))
+        return [j["task_id"] for j in scheduler.queued_order()], scheduler.position("b1")
+
+    order, position = asyncio.run(main())
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
+    assert position == 2
+
+
+def test_position_matches_dispatch_order():
+    async def main():
+        scheduler = JobScheduler(launch, {"A10G": 1})
+        scheduler.submit(job("busy", "ana"))
+        for task_id, user, priority in [("a1", "ana", "normal"), ("a2", "ana", "normal"),
+                                        ("b1", "bea", "normal"), ("c1", "carla", "low")]:
+            scheduler.submit(job(task_id, user, priority))
+        expected = [j["task_id"] for j in scheduler.queued_order()]
+        # Con sitio para todos, dispatch los saca en una pasada y en su orden
+        scheduler.max_concurrency["A10G"] = 10
+        scheduler.dispatch()
+        return expected, scheduler.running_ids()[1:]
+
+    expected, dispatched = asyncio.run(main())
+    assert expected == ["b1", "a1", "a2", "c1"]
+    assert dispatched == expected
+
+
+def test_concurrency_limit_and_release_launch_next():
+    async def main():
+        scheduler = JobScheduler(launch, {"A10G": 1})
+        first = scheduler.submit(job("t1"))
+        second = scheduler.submit(job("t2"))
+        assert await first == "t1" and second is None
+        assert scheduler.running_ids() == ["t1"] and scheduler.position("t2") == 1
+
+        scheduler.release("t1")
+        return scheduler.running_ids(), scheduler.is_queued("t2")
+
+    assert asyncio.run(main()) == (["t2"], False)
+
+
+def test_priority_goes_first():
+    async def main():
+        scheduler = JobScheduler(launch, {"A10G": 0})
+        scheduler.submit(job("low", priority="low"))
+        scheduler.submit(job("normal"))
+        scheduler.submit(job("high", priority="high"))
+        return [j["task_id"] for j in scheduler.queued_order()]
+
+    assert asyncio.run(main()) == ["high", "normal", "low"]
+
+
+@pytest.mark.parametrize("limits, submitted, message", [
+    ({"max_queued": 1}, [job("t1")], "Cola llena"),
+    ({"price_per_hour": {"A10G": 3.6}, "spend_ceiling_per_hour": 1.0}, [], "techo"),
+])
+def test_admission_errors(limits, submitted, message):
+    async def main():
+        scheduler = JobScheduler(launch, {"A10G": 0}, **limits)
+        for queued in submitted:
+            scheduler.submit(queued)
+        with pytest.raises(AdmissionError, match=message):
+            scheduler.submit({**job("t2"), "estimated_seconds": 3600})
+        with pytest.raises(AdmissionError, match="Prioridad"):
+            scheduler.submit(job("t3", priority="urgente"))
+
+    asyncio.run(main())
+
+
+def test_spend_ceiling_holds_jobs_until_window_slides():
+    now = [0.0]
+
+    async def main():
+        scheduler = JobScheduler(
+            launch, {"A10G": 5}, price_per_hour={"A10G": 3.6}, spend_ceiling_per_hour=1.5, clock=lambda: now[0]
+        )
+        for task_id in ("t1", "t2"):
+            scheduler.submit({**job(task_id), "estimated_seconds": 1000})
+        assert scheduler.running_ids() == ["t1"]
+
+        now[0] = 1000
+        scheduler.release("t1")
+        assert scheduler.is_queued("t2")
+
+        now[0] = 1000 + SPEND_WINDOW_SECONDS + 1
+        scheduler.dispatch()
+        return scheduler.running_ids()
+
+    assert asyncio.run(main()) == ["t2"]
+
+
+def test_launch_error_releases_slot():
+    errors = []
+
+    async def failing(job):
+        raise RuntimeError("sin Modal")
+
+    async def main():
+        scheduler = JobScheduler(failing, {"A10G": 1}, on_launch_error=lambda job, e: errors.append((job["task_id"], str(e))))
+        launched = scheduler.submit(job("t1"))
+        scheduler.submit(job("t2"))
+        assert await launched is None
+        await asyncio.sleep(0)
+        return scheduler.running_ids()
+
+    assert asyncio.run(main()) == []
+    assert errors == [("t1", "sin Modal"), ("t2", "sin Modal")]
+
+
+def test_async_launch_error_callback_is_awaited():
+    recorded = []
+
+    async def failing(job):
+        raise RuntimeError("sin Modal")
+
+    async def on_error(job, error):
+        await asyncio.sleep(0)
+        recorded.append(job["task_id"])
+
+    async def main():
+        scheduler = JobScheduler(failing, {"A10G": 1}, on_launch_error=on_error)
+        # Quien espera el lanzamiento ve ya el fallo registrado
+        await scheduler.submit(job("t1"))
+        return list(recorded)
+
+    assert asyncio.run(main()) == ["t1"]
+
+
+def test_positions_are_per_gpu():
+    async def main():
+        scheduler = JobScheduler(launch, {"H100": 0, "T4": 0})
+        for index in range(5):
+            scheduler.submit(job(f"h{index}", gpu="H100"))
+        scheduler.submit(job("t1", gpu="T4"))
+        scheduler.submit(job("t2", gpu="T4"))
+        return scheduler.positions()
+
+    positions = asyncio.run(main())
+    assert positions["t1"] == 1 and positions["t2"] == 2
+    assert [positions[f"h{index}"] for index in range(5)] == [1, 2, 3, 4, 5]
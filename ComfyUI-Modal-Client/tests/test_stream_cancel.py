@@ -0,0 +1,123 @@
+"""Cancelación dura de los trabajos en modo stream"""
+import asyncio
+import threading
+import types
+
+import modal
+import pytest
+
+import comfyui_modal_bridge as bridge
+import modal_downloader as downloader
+from modal_job_store import JobStore
+
+
+def test_executor_interrupts_comfyui_on_input_cancellation(monkeypatch):
+    monkeypatch.setattr(modal, "current_function_call_id", lambda: "fc-stream")
+    ex = downloader.ComfyUIExecutor()
+    interrupted, stopped = [], threading.Event()
+    ex._interrupt = lambda: interrupted.append(True)
+    
+    def execute(workflow_api, task_id, on_output, stop):
+        # El workflow solo termina si le llega la señal del generador
+        if stop.wait(5):
+            stopped.set()
+        return {"status": "cancelled", "task_id": task_id}
+    ex._execute = execute
+    
+    stream = downloader.ComfyUIExecutor.execute_workflow_stream._get_raw_f()(ex, {}, "t1")
+    assert next(stream) == {"type": "started", "call_id": "fc-stream"}
+    with pytest.raises(modal.exception.InputCancellation):
+        stream.throw(modal.exception.InputCancellation())
+    assert interrupted
+    assert stopped.wait(1)
+
+
+def test_bridge_cancels_the_modal_call_of_a_stream(tmp_path, monkeypatch):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.add({"task_id": "t1", "gpu_type": "T4", "status": "running", "timestamp": "2026-01-01T00:00:00"})
+    monkeypatch.setattr(bridge, "job_store", store)
+    monkeypatch.setattr(bridge, "CANCEL_GRACE_SECONDS", 0.2)
+    
+    async def put(key, value):
+        pass
+    monkeypatch.setattr(bridge, "cancel_requests", types.SimpleNamespace(put=types.SimpleNamespace(aio=put)))
+    
+    async def get_progress(task_id):
+        # El ejecutor no atiende la cancelación cooperativa
+        return {"state": "running", "percent": 50}
+    monkeypatch.setattr(bridge.progress_cache, "get", get_progress)
+    
+    cancelled = []
+    
+    class FakeCall:
+        def __init__(self, call_id):
+            self.call_id = call_id
+        
+        @property
+        def cancel(self):
+            async def aio(terminate_containers=False):
+                cancelled.append(self.call_id)
+            return types.SimpleNamespace(aio=aio)
+    monkeypatch.setattr(modal.FunctionCall, "from_id", FakeCall)
+    
+    async def stream(name, **kwargs):
+        yield {"type": "started", "call_id": "fc-stream"}
+        await asyncio.Event().wait()
+    monkeypatch.setattr(bridge.modal_functions, "stream", stream)
+    
+    async def scenario():
+        task = bridge.start_streamed_execution("T4", {}, "t1")
+        await asyncio.sleep(0.05)
+        assert store.get("t1")["call_id"] == "fc-stream"
+        stopped_by, outcome = await bridge.stop_execution("t1")
+        await asyncio.sleep(0)
+        return stopped_by, outcome, task
+    
+    stopped_by, outcome, task = asyncio.run(scenario())
+    assert (stopped_by, outcome) == ("cancel", None)
+    assert cancelled == ["fc-stream"]
+    assert task.cancelled()
+    assert "t1" not in bridge._stream_call_ids
+
+
+def test_adopted_stream_job_follows_progress_not_call_result(tmp_path, monkeypatch):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.add({"task_id": "s1", "gpu_type": "T4", "status": "running", "result_mode": "stream",
+               "call_id": "fc-stream", "timestamp": "2026-01-01T00:00:00"})
+    store.add({"task_id": "v1", "gpu_type": "T4", "status": "running", "result_mode": "volume",
+               "call_id": "fc-volume", "timestamp": "2026-01-01T00:00:01"})
+    monkeypatch.setattr(bridge, "job_store", store)
+    monkeypatch.setattr(bridge, "tracked_calls", {})
+    monkeypatch.setattr(bridge, "_stream_call_ids", {})
+    monkeypatch.setattr(bridge, "scheduler", bridge.JobScheduler(bridge.launch_job, {}))
+    monkeypatch.setattr(modal.FunctionCall, "from_id", lambda call_id: call_id)
+    
+    async def scenario():
+        await bridge.start_scheduler()
+        bridge.app.scheduler_task.cancel()
+        bridge.app.job_watch_task.cancel()
+        # El Dict de progreso dice que el stream falló: eso es lo que queda en el historial
+        await bridge.record_progress("s1", {"state": "failed", "percent": 0, "message": "OOM"})
+    
+    asyncio.run(scenario())
+    assert bridge.tracked_calls == {"v1": "fc-volume"}
+    assert store.get("s1")["status"] == "failed" and store.get("s1")["error"] == "OOM"
+    assert "s1" not in bridge._stream_call_ids
+    assert bridge.scheduler.running_ids() == ["v1"]
+
+
+def test_adopted_stream_job_can_be_cancelled(monkeypatch):
+    monkeypatch.setattr(bridge, "CANCEL_GRACE_SECONDS", 0)
+    monkeypatch.setattr(bridge, "_stream_call_ids", {"s1": "fc-stream"})
+    cancelled = []
+    
+    async def put(key, value):
+        pass
+    monkeypatch.setattr(bridge, "cancel_requests", types.SimpleNamespace(put=types.SimpleNamespace(aio=put)))
+    
+    async def cancel(terminate_containers=False):
+        cancelled.append("fc-stream")
+    monkeypatch.setattr(modal.FunctionCall, "from_id", lambda call_id: types.SimpleNamespace(cancel=types.SimpleNamespace(aio=cancel)))
+    
+    assert asyncio.run(bridge.stop_execution("s1")) == ("cancel", None)
+    assert cancelled == ["fc-stream"] and not bridge._stream_call_ids
@@ -25,98 +25,98 @@ app.registerExtension({
             return null;
         };
 
-        const pollProgress = async (taskId, labelSpan, onComplete) => {
-            const interval = setInterval(async () => {
+        // Stream SSE del bridge: un solo sondeo a Modal por tarea, compartido entre pestañas
+        const suscribirProgreso = (taskIds, onProgress) => {
+            const ids = taskIds.map(encodeURIComponent).join(',');
+            const fuente = new EventSource(`${API_BASE}/progress_stream?task_ids=${ids}`);
+            
+            fuente.addEventListener('progress', (event) => {
                 try {
-                    const response = await fetch(`${API_BASE}/progress/${taskId}`);
-                    const progress = await response.json();
+                    onProgress(JSON.parse(event.data));
+                } catch (error) {
+                    console.error('Error procesando progreso:', error);
+                }
+            });
+            // Todas las tareas terminaron: cerrar para que EventSource no reconecte
+            fuente.addEventListener('end', () => fuente.close());
+            fuente.onerror = () => console.warn('⚠️ Stream de progreso interrumpido, reconectando...');
+            
+            return fuente;
+        };
+
+        const pollProgress = async (taskId, labelSpan, onComplete, onError) => {
+            const fuente = suscribirProgreso([taskId], (progress) => {
+                // Una descarga fallida, cancelada o desconocida no llega nunca al 100%
+                if (progress.state === 'failed' || progress.state === 'cancelled' || progress.state === 'unknown') {
+                    fuente.close();
+                    const mensaje = progress.result?.message || progress.message
+                        || (progress.state === 'cancelled' ? 'Descarga cancelada' : 'Error en la descarga');
+                    if (onError) onError(mensaje, progress.state);
+                    return;
+                }
+                if (progress.percent !== undefined) {
+                    labelSpan.textContent = `Descargando... ${progress.percent}%`;
                     
-                    if (progress.percent !== undefined) {
-                        labelSpan.textContent = `Descargando... ${progress.percent}%`;
-                        
-                        if (progress.percent >= 100) {
-                            clearInterval(interval);
-                            labelSpan.textContent = progress.message || 'Completado ✓';
-                            setTimeout(() => {
-                                if (onComplete) onComplete();
-                            }, 1000);
-                        }
+                    if (progress.percent >= 100) {
+                        fuente.close();
+                        labelSpan.textContent = progress.message || 'Completado ✓';
+                        setTimeout(() => {
+                            if (onComplete) onComplete();
+                        }, 1000);
                     }
-                } catch (error) {
-                    console.error('Error obteniendo progreso:', error);
                 }
-            }, 1000);
+            });
             
-            return interval;
+            return fuente;
         };
 
-        // ========== REGISTRAR IMÁGENES EN COMFYUI LOCAL (descarga + mini-workflow + limpieza) ==========
-        async function registrarImagenesEnComfyUI(filenames) {
+        // ========== REGISTRAR IMÁGENES EN COMFYUI LOCAL (descarga + registro directo en el historial) ==========
+        // Los PNG originales se quedan en output/ tal cual (con su workflow embebido)
+        // y se añaden al historial de ComfyUI como salidas de un único prompt sintético
+        async function registrarImagenesEnComfyUI(filenames, taskId = null, gpuType = null) {
             if (!filenames || !filenames.length) return;
             
             console.log("📥 Registrando imágenes en ComfyUI:", filenames);
             
-            for (const filename of filenames) {
-                try {
-                    // 1. Descargar imagen desde Modal
-                    console.log(`⬇ Descargando ${filename} desde Modal...`);
-                    const downloadRes = await fetch(`${API_BASE}/get_image/${filename}`);
-                    const downloadData = await downloadRes.json();
-                    
-                    if (downloadData.status !== 'success') {
-                        console.error(`❌ Error descargando ${filename}:`, downloadData.error);
-                        continue;
-                    }
-                    
-                    console.log(`✓ Descargada temporalmente: ${filename}`);
-                    
-                    // 2. Pequeño prompt local: LoadLocalImageModal -> SaveImage
-                    const workflow = {
-                        "0": {
-                            "class_type": "LoadLocalImageModal",
-                            "inputs": { "filename": filename }
-                        },
-                        "1": {
-                            "class_type": "SaveImage",
-                            "inputs": {
-                                "images": ["0", 0],
-                                "filename_prefix": "modal_registered_"
-                            }
-                        }
-                    };
-                    
-                    const payload = {
-                        prompt: workflow,
-                        client_id: `modal-register-${Date.now()}`
-                    };
-                    
-                    const res = await fetch("/prompt", {
-                        method: "POST",
-                        headers: {"Content-Type": "application/json"},
-                        body: JSON.stringify(payload)
-                    });
-                    
-                    if (!res.ok) {
-                        const txt = await res.text();
-                        console.error(`❌ Error registrando ${filename}:`, txt);
-                        continue;
+            try {
+                // 1. Descargar todas las imágenes de Modal en una sola petición (en paralelo en el bridge)
+                const downloadRes = await fetch(`${API_BASE}/fetch_outputs`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ task_id: taskId, filenames })
+                });
+                const downloadData = await downloadRes.json();
+                
+                for (const file of downloadData.files || []) {
+                    if (file.status !== 'success') {
+                        console.error(`❌ Error descargando ${file.filename}:`, file.error);
                     }
-                    
-                    const data = await res.json();
-                    console.log(`✓ Lanzado mini-workflow local para ${filename}`, data);
-                    
-                    // 3. Esperar un momento para que se procese
-                    await new Promise(resolve => setTimeout(resolve, 500));
-                    
-                    // 4. Borrar imagen temporal
-                    console.log(`🗑 Borrando temporal: ${filename}`);
-                    const deleteRes = await fetch(`${API_BASE}/delete_temp/${filename}`, { method: 'DELETE' });
-                    const deleteData = await deleteRes.json();
-                    console.log(`✓ ${deleteData.message}`);
-                    
-                } catch (err) {
-                    console.error(`❌ Error lanzando mini-workflow para ${filename}:`, err);
                 }
+                const descargadas = (downloadData.files || [])
+                    .filter(file => file.status === 'success')
+                    .map(file => file.filename);
+                if (!descargadas.length) return;
+                
+                console.log(`✓ ${descargadas.length} imagen(es) descargadas: ${(downloadData.total_bytes / 1048576).toFixed(1)} MB a ${downloadData.throughput_mbps} MB/s`);
+                
+                // 2. Registrar todas en el historial local de una vez
+                const res = await fetch("/modal/register_outputs", {
+                    method: "POST",
+                    headers: {"Content-Type": "application/json"},
+                    body: JSON.stringify({ filenames: descargadas, task_id: taskId, gpu_type: gpuType })
+                });
+                
+                if (!res.ok) {
+                    const txt = await res.text();
+                    console.error('❌ Error registrando imágenes:', txt);
+                    return;
+                }
+                
+                const data = await res.json();
+                console.log(`✓ ${data.images.length} imagen(es) registradas en el historial (prompt ${data.prompt_id})`);
+                
+            } catch (err) {
+                console.error('❌ Error registrando imágenes en ComfyUI:', err);
             }
         }
 
@@ -207,168 +207,256 @@ app.registerExtension({
             }
         };
 
-        // Intercepta el botón "Ejecutar" cuando está en modo Modal
-        const interceptarEjecucion = () => {
-            const botonEjecutar = document.querySelector('.comfyui-queue-button .p-splitbutton-button');
+        // ========== Pre-flight: modelos faltantes ==========
+        // URLs de modelos que ComfyUI guarda en el workflow de la interfaz
+        const extraerFuentesModelos = (workflow) => {
+            const fuentes = [...(workflow?.models || [])];
+            for (const node of workflow?.nodes || []) {
+                fuentes.push(...(node.properties?.models || []));
+            }
+            return fuentes
+                .filter(m => m && m.name && m.url)
+                .map(m => ({ name: m.name, url: m.url, directory: m.directory }));
+        };
+
+        const esperarDescargas = (descargas, onUpdate) => new Promise((resolve) => {
+            const pendientes = new Map(descargas.map(d => [d.task_id, d]));
+            let fallos = 0;
             
-            if (botonEjecutar && !botonEjecutar.dataset.modalIntercepted) {
-                botonEjecutar.dataset.modalIntercepted = 'true';
+            // Un único stream para todas las descargas del workflow
+            const fuente = suscribirProgreso([...pendientes.keys()], (progress) => {
+                const descarga = pendientes.get(progress.task_id);
+                if (!descarga) return;
                 
-                botonEjecutar.addEventListener('click', async (e) => {
-                    if (modoEjecucion === 'modal') {
-                        e.preventDefault();
-                        e.stopPropagation();
-                        e.stopImmediatePropagation();
-                        
-                        console.log('🚀 Ejecutando en Modal...');
-                        console.log(`🔧 GPU seleccionada: ${selectedGPU}`); // NUEVO: Log de GPU
-                        
+                if (progress.state === 'completed' || progress.percent >= 100) {
+                    pendientes.delete(progress.task_id);
+                } else if (progress.state === 'failed' || progress.state === 'cancelled' || progress.state === 'unknown') {
+                    console.error(`❌ Falló la descarga de ${descarga.filename}: ${progress.message}`);
+                    pendientes.delete(progress.task_id);
+                    fallos++;
+                } else {
+                    onUpdate(`Descargando ${descarga.filename}: ${progress.percent || 0}% (quedan ${pendientes.size})`);
+                }
+                
+                if (!pendientes.size) {
+                    fuente.close();
+                    resolve(fallos === 0);
+                }
+            });
+        });
+
+        const manejarModelosFaltantes = async (result, reintento) => {
+            console.warn('⚠️ Faltan modelos en Modal:', result.missing);
+            
+            if (reintento || !result.downloads?.length || result.not_downloadable?.length) {
+                alert(`${result.message}\n\nDescárgalos en Modal antes de ejecutar.`);
+                return;
+            }
+            
+            const aviso = document.createElement('div');
+            aviso.className = 'pointer-events-auto flex flex-col overflow-hidden rounded-lg border font-inter border-interface-stroke bg-comfy-menu-bg shadow-interface text-xs';
+            aviso.style.cssText = `
+                position: fixed !important;
+                top: 60px !important;
+                right: 20px !important;
+                max-width: 320px;
+                z-index: 13000 !important;
+                padding: 12px !important;
+                color: var(--fg-color);
+            `;
+            aviso.textContent = `Descargando ${result.downloads.length} modelo(s) faltante(s) antes de ejecutar...`;
+            document.body.appendChild(aviso);
+            
+            const ok = await esperarDescargas(result.downloads, (texto) => { aviso.textContent = texto; });
+            aviso.remove();
+            
+            if (ok) {
+                console.log('✓ Modelos descargados, reenviando workflow');
+                await ejecutarEnModal(true);
+            } else {
+                alert('No se pudieron descargar todos los modelos faltantes. Revisa la consola.');
+            }
+        };
+
+        // Envía el workflow actual al bridge. reintento=true tras descargar modelos faltantes
+        const ejecutarEnModal = async (reintento = false) => {
+            console.log('🚀 Ejecutando en Modal...');
+            console.log(`🔧 GPU seleccionada: ${selectedGPU}`); // NUEVO: Log de GPU
+            
+            try {
+                const prompt = await app.graphToPrompt();
+                console.log('📋 Workflow capturado');
+                console.log('   Nodos:', Object.keys(prompt.workflow).length);
+                
+                // MODIFICADO: Incluir gpu_type en el request
+                const response = await fetch(`${API_BASE}/execute_workflow`, {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({
+                        workflow: prompt.output,
+                        gpu_type: selectedGPU,  // ← NUEVO: Enviar GPU seleccionada
+                        model_sources: extraerFuentesModelos(prompt.workflow),
+                        auto_download_models: true
+                    })
+                });
+                
+                const result = await response.json();
+                
+                // Pre-flight: faltan modelos en el volumen, la GPU no se ha lanzado
+                if (result.status === 'missing_models') {
+                    await manejarModelosFaltantes(result, reintento);
+                    return;
+                }
+                
+                // queued: el planificador del bridge lo lanzará cuando haya hueco en la GPU
+                if ((result.status === 'started' || result.status === 'queued') && result.task_id) {
+                    console.log(result.status === 'queued'
+                        ? `⏳ En cola del bridge (posición ${result.queue_position})`
+                        : '✓ Ejecución iniciada en Modal');
+                    console.log('   Task ID:', result.task_id);
+                    console.log('   GPU:', result.gpu_type || selectedGPU); // NUEVO: Log de GPU confirmada
+                    if (result.gpu_selection?.mode === 'auto') {
+                        console.log(`   🤖 GPU automática: ~${result.gpu_selection.vram_needed_gb} GB VRAM, ${result.gpu_selection.reason}`);
+                    }
+                    
+                    // Crear indicador de progreso
+                    const actionbarContainer = document.querySelector('.actionbar-container');
+                    const progressIndicator = document.createElement('div');
+                    progressIndicator.className = 'flex items-center gap-2 px-3 py-1 border-l border-interface-stroke';
+                    progressIndicator.style.cssText = `
+                        height: 100%;
+                        min-width: 200px;
+                    `;
+                    
+                    progressIndicator.innerHTML = `
+                        <div class="flex flex-col gap-1 flex-1">
+                            <div class="flex items-center justify-between">
+                                <span class="text-xs font-medium" style="color: var(--fg-color)">Ejecutando en Modal (${result.gpu_type || selectedGPU})</span>
+                                <span id="modal-progress-percent" class="text-xs font-mono" style="color: var(--fg-color); opacity: 0.7">0%</span>
+                            </div>
+                            <div class="flex items-center gap-2">
+                                <div class="flex-1 h-1.5 rounded-full overflow-hidden" style="background: var(--border-color)">
+                                    <div id="modal-progress-bar" class="h-full rounded-full transition-all duration-300" style="width: 0%; background: var(--primary-bg, #667eea)"></div>
+                                </div>
+                            </div>
+                            <div id="modal-progress-text" class="text-xs" style="color: var(--fg-color); opacity: 0.7">${result.status === 'queued' ? `En cola (posición ${result.queue_position})` : 'Iniciando...'}</div>
+                        </div>
+                    `;
+                    
+                    if (actionbarContainer) {
+                        actionbarContainer.appendChild(progressIndicator);
+                    } else {
+                        progressIndicator.className = 'pointer-events-auto flex flex-col overflow-hidden rounded-lg border font-inter transition-colors duration-200 ease-in-out border-interface-stroke bg-comfy-menu-bg shadow-interface';
+                        progressIndicator.style.cssText = `
+                            position: fixed !important;
+                            top: 60px !important;
+                            right: 20px !important;
+                            min-width: 280px;
+                            max-width: 320px;
+                            z-index: 13000 !important;
+                            padding: 12px !important;
+                        `;
+                        document.body.appendChild(progressIndicator);
+                    }
+                    
+                    const progressText = document.getElementById('modal-progress-text');
+                    const progressBar = document.getElementById('modal-progress-bar');
+                    const progressPercent = document.getElementById('modal-progress-percent');
+                    
+                    // Progreso por SSE; el evento final trae generated_images
+                    const progressStream = suscribirProgreso([result.task_id], (progress) => {
                         try {
-                            const prompt = await app.graphToPrompt();
-                            console.log('📋 Workflow capturado');
-                            console.log('   Nodos:', Object.keys(prompt.workflow).length);
-                            
-                            // MODIFICADO: Incluir gpu_type en el request
-                            const response = await fetch(`${API_BASE}/execute_workflow`, {
-                                method: 'POST',
-                                headers: {'Content-Type': 'application/json'},
-                                body: JSON.stringify({
-                                    workflow: prompt.output,
-                                    gpu_type: selectedGPU  // ← NUEVO: Enviar GPU seleccionada
-                                })
-                            });
-                            
-                            const result = await response.json();
-                            
-                            if (result.status === 'started' && result.task_id) {
-                                console.log('✓ Ejecución iniciada en Modal');
-                                console.log('   Task ID:', result.task_id);
-                                console.log('   GPU:', result.gpu_type || selectedGPU); // NUEVO: Log de GPU confirmada
-                                
-                                // Crear indicador de progreso
-                                const actionbarContainer = document.querySelector('.actionbar-container');
-                                const progressIndicator = document.createElement('div');
-                                progressIndicator.className = 'flex items-center gap-2 px-3 py-1 border-l border-interface-stroke';
-                                progressIndicator.style.cssText = `
-                                    height: 100%;
-                                    min-width: 200px;
-                                `;
+                            if (progress.percent !== undefined) {
+                                progressText.textContent = progress.message || 'Procesando...';
+                                progressBar.style.width = `${progress.percent}%`;
+                                progressPercent.textContent = `${progress.percent}%`;
                                 
-                                progressIndicator.innerHTML = `
-                                    <div class="flex flex-col gap-1 flex-1">
-                                        <div class="flex items-center justify-between">
-                                            <span class="text-xs font-medium" style="color: var(--fg-color)">Ejecutando en Modal (${selectedGPU})</span>
-                                            <span id="modal-progress-percent" class="text-xs font-mono" style="color: var(--fg-color); opacity: 0.7">0%</span>
-                                        </div>
-                                        <div class="flex items-center gap-2">
-                                            <div class="flex-1 h-1.5 rounded-full overflow-hidden" style="background: var(--border-color)">
-                                                <div id="modal-progress-bar" class="h-full rounded-full transition-all duration-300" style="width: 0%; background: var(--primary-bg, #667eea)"></div>
-                                            </div>
-                                        </div>
-                                        <div id="modal-progress-text" class="text-xs" style="color: var(--fg-color); opacity: 0.7">Iniciando...</div>
-                                    </div>
-                                `;
-                                
-                                if (actionbarContainer) {
-                                    actionbarContainer.appendChild(progressIndicator);
-                                } else {
-                                    progressIndicator.className = 'pointer-events-auto flex flex-col overflow-hidden rounded-lg border font-inter transition-colors duration-200 ease-in-out border-interface-stroke bg-comfy-menu-bg shadow-interface';
-                                    progressIndicator.style.cssText = `
-                                        position: fixed !important;
-                                        top: 60px !important;
-                                        right: 20px !important;
-                                        min-width: 280px;
-                                        max-width: 320px;
-                                        z-index: 13000 !important;
-                                        padding: 12px !important;
-                                    `;
-                                    document.body.appendChild(progressIndicator);
-                                }
-                                
-                                const progressText = document.getElementById('modal-progress-text');
-                                const progressBar = document.getElementById('modal-progress-bar');
-                                const progressPercent = document.getElementById('modal-progress-percent');
-                                
-                                // Polling de progreso que obtiene generated_images
-                                const progressInterval = setInterval(async () => {
-                                    try {
-                                        const progressResponse = await fetch(`${API_BASE}/progress/${result.task_id}`);
-                                        const progress = await progressResponse.json();
-                                        
-                                        if (progress.percent !== undefined) {
-                                            progressText.textContent = progress.message || 'Procesando...';
-                                            progressBar.style.width = `${progress.percent}%`;
-                                            progressPercent.textContent = `${progress.percent}%`;
+                                if (progress.percent >= 100) {
+                                    console.log('✅ Progreso 100% alcanzado!');
+                                    progressStream.close();
+                                    
+                                    progressText.textContent = 'Completado. Obteniendo imágenes...';
+                                    progressBar.style.backgroundColor = '#4caf50';
+                                    
+                                    setTimeout(async () => {
+                                        try {
+                                            // Obtener imágenes generadas del progreso
+                                            const generatedImages = progress.generated_images || [];
                                             
-                                            if (progress.percent >= 100) {
-                                                console.log('✅ Progreso 100% alcanzado!');
-                                                clearInterval(progressInterval);
+                                            if (generatedImages.length > 0) {
+                                                console.log(`📥 Imágenes generadas en este workflow: ${generatedImages.join(', ')}`);
+                                                
+                                                // Notificar al panel Modal solo con las nuevas
+                                                const imageObjects = generatedImages.map(filename => ({
+                                                    filename: filename,
+                                                    size: 0,
+                                                    modified: Date.now()
+                                                }));
+                                                
+                                                console.log('📢 Disparando evento modal-images-ready');
+                                                window.dispatchEvent(new CustomEvent('modal-images-ready', {
+                                                    detail: { images: imageObjects }
+                                                }));
                                                 
-                                                progressText.textContent = 'Completado. Obteniendo imágenes...';
-                                                progressBar.style.backgroundColor = '#4caf50';
+                                                console.log(`⬇ Descargando solo: ${generatedImages.join(', ')}`);
                                                 
-                                                setTimeout(async () => {
-                                                    try {
-                                                        // Obtener imágenes generadas del progreso
-                                                        const generatedImages = progress.generated_images || [];
-                                                        
-                                                        if (generatedImages.length > 0) {
-                                                            console.log(`📥 Imágenes generadas en este workflow: ${generatedImages.join(', ')}`);
-                                                            
-                                                            // Notificar al panel Modal solo con las nuevas
-                                                            const imageObjects = generatedImages.map(filename => ({
-                                                                filename: filename,
-                                                                size: 0,
-                                                                modified: Date.now()
-                                                            }));
-                                                            
-                                                            console.log('📢 Disparando evento modal-images-ready');
-                                                            window.dispatchEvent(new CustomEvent('modal-images-ready', {
-                                                                detail: { images: imageObjects }
-                                                            }));
-                                                            
-                                                            console.log(`⬇ Descargando solo: ${generatedImages.join(', ')}`);
-                                                            
-                                                            // Descargar, procesar y limpiar SOLO las nuevas
-                                                            await registrarImagenesEnComfyUI(generatedImages);
-                                                            await refrescarResultados();
-                                                            
-                                                            progressText.textContent = `✓ ${generatedImages.length} imagen(es) registradas`;
-                                                        } else {
-                                                            console.warn('⚠️ No se encontraron imágenes generadas en el progreso');
-                                                            progressText.textContent = 'Sin imágenes nuevas';
-                                                        }
-                                                        
-                                                        setTimeout(() => progressIndicator.remove(), 2500);
-                                                        
-                                                    } catch (error) {
-                                                        console.error('Error obteniendo imágenes:', error);
-                                                        progressText.textContent = 'Error obteniendo imágenes';
-                                                        setTimeout(() => progressIndicator.remove(), 3000);
-                                                    }
-                                                }, 1000);
+                                                // Descargar, procesar y limpiar SOLO las nuevas
+                                                await registrarImagenesEnComfyUI(generatedImages, result.task_id, result.gpu_type);
+                                                await refrescarResultados();
                                                 
-                                            } else if (progress.percent === 0 && progress.message && progress.message.includes('Error')) {
-                                                clearInterval(progressInterval);
-                                                progressText.textContent = `Error: ${progress.message}`;
-                                                progressBar.style.backgroundColor = '#f44336';
-                                                setTimeout(() => progressIndicator.remove(), 5000);
+                                                progressText.textContent = `✓ ${generatedImages.length} imagen(es) registradas`;
+                                            } else {
+                                                console.warn('⚠️ No se encontraron imágenes generadas en el progreso');
+                                                progressText.textContent = 'Sin imágenes nuevas';
                                             }
+                                            
+                                            setTimeout(() => progressIndicator.remove(), 2500);
+                                            
+                                        } catch (error) {
+                                            console.error('Error obteniendo imágenes:', error);
+                                            progressText.textContent = 'Error obteniendo imágenes';
+                                            setTimeout(() => progressIndicator.remove(), 3000);
                                         }
-                                    } catch (error) {
-                                        console.error('Error obteniendo progreso de ejecución:', error);
-                                    }
-                                }, 2000);
-                                
-                            } else {
-                                console.error('Error:', result.message);
-                                alert(`Error iniciando ejecución en Modal: ${result.message}`);
+                                    }, 1000);
+                                    
+                                } else if (progress.state === 'failed' || progress.state === 'cancelled' || progress.state === 'unknown' ||
+                                           (progress.percent === 0 && progress.message && progress.message.includes('Error'))) {
+                                    progressStream.close();
+                                    progressText.textContent = `Error: ${progress.message}`;
+                                    progressBar.style.backgroundColor = '#f44336';
+                                    setTimeout(() => progressIndicator.remove(), 5000);
+                                }
                             }
-                            
                         } catch (error) {
-                            console.error('Error ejecutando en Modal:', error);
-                            alert(`Error: ${error.message}\n\nAsegúrate de que comfyui_modal_bridge.py está corriendo.`);
+                            console.error('Error obteniendo progreso de ejecución:', error);
                         }
+                    });
+                    
+                } else {
+                    console.error('Error:', result.message);
+                    alert(`Error iniciando ejecución en Modal: ${result.message}`);
+                }
+                
+            } catch (error) {
+                console.error('Error ejecutando en Modal:', error);
+                alert(`Error: ${error.message}\n\nAsegúrate de que comfyui_modal_bridge.py está corriendo.`);
+            }
+        };
+
+        // Intercepta el botón "Ejecutar" cuando está en modo Modal
+        const interceptarEjecucion = () => {
+            const botonEjecutar = document.querySelector('.comfyui-queue-button .p-splitbutton-button');
+            
+            if (botonEjecutar && !botonEjecutar.dataset.modalIntercepted) {
+                botonEjecutar.dataset.modalIntercepted = 'true';
+                
+                botonEjecutar.addEventListener('click', async (e) => {
+                    if (modoEjecucion === 'modal') {
+                        e.preventDefault();
+                        e.stopPropagation();
+                        e.stopImmediatePropagation();
+                        
+                        await ejecutarEnModal();
                         
                         return false;
                     }
@@ -465,9 +553,76 @@ app.registerExtension({
         // ========== Descargar modelos en Modal con progreso ==========
         let processingItems = new Set();
         
+        const agregarBotonModal = ({ item, itemId, contenedorBotones, urlModelo, modelInfo }) => {
+            const nuevoBotonDiv = document.createElement('div');
+            nuevoBotonDiv.innerHTML = `
+                <button class="p-button p-component p-button-outlined p-button-sm descargar-modal-btn" type="button" aria-label="Descargar en modal" data-pc-name="button" data-p-disabled="false" data-pc-section="root">
+                    <span class="p-button-label" data-pc-section="label">Modal</span>
+                </button>
+            `;
+            
+            const botonModal = nuevoBotonDiv.querySelector('button');
+            
+            botonModal.addEventListener('click', async (e) => {
+                e.preventDefault();
+                e.stopPropagation();
+                
+                const labelSpan = botonModal.querySelector('.p-button-label');
+                const originalText = labelSpan.textContent;
+                labelSpan.textContent = '0%';
+                botonModal.disabled = true;
+                
+                try {
+                    const response = await fetch(`${API_BASE}/download_model`, {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/json'},
+                        body: JSON.stringify({
+                            url: urlModelo,
+                            subfolder: modelInfo.subfolder,
+                            filename: modelInfo.filename
+                        })
+                    });
+                    
+                    const result = await response.json();
+                    
+                    if (result.status === 'started' && result.task_id) {
+                        pollProgress(result.task_id, labelSpan, () => {
+                            console.log(`✓ Descarga completada: ${modelInfo.filename}`);
+                            item.remove();
+                            processingItems.delete(itemId);
+                        }, (mensaje, estado) => {
+                            console.error(`❌ Descarga ${estado === 'cancelled' ? 'cancelada' : 'fallida'}: ${modelInfo.filename}`, mensaje);
+                            if (estado === 'failed') alert(`Error descargando ${modelInfo.filename}: ${mensaje}`);
+                            labelSpan.textContent = originalText;
+                            botonModal.disabled = false;
+                        });
+                    } else if (result.status === 'already_exists') {
+                        console.log(result.message);
+                        item.remove();
+                        processingItems.delete(itemId);
+                    } else {
+                        alert(`Error: ${result.message}`);
+                        labelSpan.textContent = originalText;
+                        botonModal.disabled = false;
+                    }
+                    
+                    console.log('Resultado:', result);
+                } catch (error) {
+                    alert(`Error de conexión: ${error.message}\n\nAsegúrate de que comfyui_modal_bridge.py está corriendo.`);
+                    labelSpan.textContent = originalText;
+                    botonModal.disabled = false;
+                    console.error('Error:', error);
+                }
+            });
+            
+            contenedorBotones.appendChild(nuevoBotonDiv);
+        };
+        
         const observadorDialogoModelos = new MutationObserver(async () => {
             const listaItems = document.querySelectorAll('.comfy-missing-models .p-listbox-option');
             
+            // 1. Reunir todos los modelos nuevos del diálogo
+            const pendientes = [];
             for (const item of listaItems) {
                 const itemId = item.id;
                 if (processingItems.has(itemId)) continue;
@@ -496,82 +651,39 @@ app.registerExtension({
                     continue;
                 }
                 
-                try {
-                    const response = await fetch(`${API_BASE}/check_model`, {
-                        method: 'POST',
-                        headers: {'Content-Type': 'application/json'},
-                        body: JSON.stringify(modelInfo)
-                    });
-                    
-                    const result = await response.json();
-                    
-                    if (result.exists) {
-                        console.log(`✓ Modelo ya existe en Modal: ${modelInfo.filename} (${result.size_gb})`);
-                        item.remove();
-                        processingItems.delete(itemId);
-                        continue;
-                    }
-                } catch (error) {
-                    console.warn('No se pudo verificar modelo en Modal:', error);
-                }
-                
-                const nuevoBotonDiv = document.createElement('div');
-                nuevoBotonDiv.innerHTML = `
-                    <button class="p-button p-component p-button-outlined p-button-sm descargar-modal-btn" type="button" aria-label="Descargar en modal" data-pc-name="button" data-p-disabled="false" data-pc-section="root">
-                        <span class="p-button-label" data-pc-section="label">Modal</span>
-                    </button>
-                `;
-                
-                const botonModal = nuevoBotonDiv.querySelector('button');
-                
-                botonModal.addEventListener('click', async (e) => {
-                    e.preventDefault();
-                    e.stopPropagation();
-                    
-                    const labelSpan = botonModal.querySelector('.p-button-label');
-                    const originalText = labelSpan.textContent;
-                    labelSpan.textContent = '0%';
-                    botonModal.disabled = true;
-                    
-                    try {
-                        const response = await fetch(`${API_BASE}/download_model`, {
-                            method: 'POST',
-                            headers: {'Content-Type': 'application/json'},
-                            body: JSON.stringify({
-                                url: urlModelo,
-                                subfolder: modelInfo.subfolder,
-                                filename: modelInfo.filename
-                            })
-                        });
-                        
-                        const result = await response.json();
-                        
-                        if (result.status === 'started' && result.task_id) {
-                            pollProgress(result.task_id, labelSpan, () => {
-                                console.log(`✓ Descarga completada: ${modelInfo.filename}`);
-                                item.remove();
-                                processingItems.delete(itemId);
-                            });
-                        } else if (result.status === 'already_exists') {
-                            console.log(result.message);
-                            item.remove();
-                            processingItems.delete(itemId);
-                        } else {
-                            alert(`Error: ${result.message}`);
-                            labelSpan.textContent = originalText;
-                            botonModal.disabled = false;
-                        }
-                        
-                        console.log('Resultado:', result);
-                    } catch (error) {
-                        alert(`Error de conexión: ${error.message}\n\nAsegúrate de que comfyui_modal_bridge.py está corriendo.`);
-                        labelSpan.textContent = originalText;
-                        botonModal.disabled = false;
-                        console.error('Error:', error);
-                    }
+                pendientes.push({ item, itemId, contenedorBotones, urlModelo, modelInfo });
+            }
+            
+            if (!pendientes.length) return;
+            
+            // 2. Una sola petición para todo el diálogo
+            let resultados = [];
+            try {
+                const response = await fetch(`${API_BASE}/check_models`, {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({ models: pendientes.map(p => p.modelInfo) })
                 });
+                resultados = (await response.json()).results || [];
+            } catch (error) {
+                console.warn('No se pudieron verificar los modelos en Modal:', error);
+            }
+            
+            // 3. Quitar los que ya existen y añadir el botón "Modal" al resto
+            for (const pendiente of pendientes) {
+                const { modelInfo } = pendiente;
+                const result = resultados.find(r =>
+                    r.subfolder === modelInfo.subfolder && r.filename === modelInfo.filename
+                );
+                
+                if (result && result.exists) {
+                    console.log(`✓ Modelo ya existe en Modal: ${modelInfo.filename} (${result.size_gb})`);
+                    pendiente.item.remove();
+                    processingItems.delete(pendiente.itemId);
+                    continue;
+                }
                 
-                contenedorBotones.appendChild(nuevoBotonDiv);
+                agregarBotonModal(pendiente);
             }
         });
         
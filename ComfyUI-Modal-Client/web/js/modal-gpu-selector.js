@@ -9,7 +9,9 @@ app.registerExtension({
         const API_BASE = 'http://127.0.0.1:5001'
         
         // Lista completa de GPUs de Modal
+        // AUTO: el bridge elige la GPU más barata en la que cabe el workflow
         const GPU_OPTIONS = [
+            { name: 'Automática (más barata que quepa)', price: 0, value: 'AUTO', max: 1, auto: true },
             { name: 'Nvidia B200', price: 0.001736, value: 'B200', max: 8 },
             { name: 'Nvidia H200', price: 0.001261, value: 'H200', max: 8 },
             { name: 'Nvidia H100', price: 0.001097, value: 'H100', max: 8 },
@@ -29,6 +31,7 @@ app.registerExtension({
         if (window.setSelectedGPU) window.setSelectedGPU(activeGPU)
 
         const formatPrice = (value) => '$' + value.toFixed(6)
+        const formatGPUPrice = (gpu, value) => gpu && gpu.auto ? 'según workflow' : formatPrice(value)
 
         const saveState = () => {
             localStorage.setItem('modalactivegpu', activeGPU)
@@ -51,8 +54,8 @@ app.registerExtension({
                 <div class="text-xs opacity-70 mb-1">Configuración actual</div>
                 <div class="font-semibold text-sm">${data ? data.name : 'Nvidia T4'} × ${count}</div>
                 <div class="text-xs opacity-70 mt-1">
-                    Precio base: ${formatPrice(base)}<br>
-                    Total: ${formatPrice(total)}
+                    Precio base: ${formatGPUPrice(data, base)}<br>
+                    Total: ${formatGPUPrice(data, total)}
                 </div>
             `
         }
@@ -169,8 +172,8 @@ app.registerExtension({
                     <div class="flex items-center justify-between mb-3 gpu-header">
                         <span class="font-semibold text-sm">${gpu.name}</span>
                         <div class="flex flex-col items-end text-right gpu-price-container">
-                            <span class="text-xs opacity-70 base-price">Base: ${formatPrice(gpu.price)}</span>
-                            <span class="text-sm font-bold total-price" style="color: var(--primary-color, #667eea)">Total: ${formatPrice(totalPrice)}</span>
+                            <span class="text-xs opacity-70 base-price">Base: ${formatGPUPrice(gpu, gpu.price)}</span>
+                            <span class="text-sm font-bold total-price" style="color: var(--primary-color, #667eea)">Total: ${formatGPUPrice(gpu, totalPrice)}</span>
                         </div>
                     </div>
                     <div class="flex items-center gap-3">
@@ -208,7 +211,7 @@ app.registerExtension({
                     const priceBox = row.querySelector('.gpu-price-container .total-price')
                     const totalPrice = gpu.price * count
 
-                    priceBox.textContent = `Total: ${formatPrice(totalPrice)}`
+                    priceBox.textContent = `Total: ${formatGPUPrice(gpu, totalPrice)}`
 
                     if (gpu.value === activeGPU && count > 0) {
                         row.style.border = '2px solid var(--primary-bg, #667eea)'